@@ -0,0 +1,705 @@
+#!/usr/bin/python3
+"""
+Benchmark of the play.py pipeline without capture card nor Hue bridge.
+
+Frames come from a synthetic source (uniform frames whose color encodes the frame
+index) or from a video file, and the lights live on a local stand-in bridge: an
+HTTP server answering the REST calls, and an `openssl s_server` accepting the
+DTLS session and timestamping every HueStream packet. A HuePlayEngine streaming
+to them, built with the outputs play.py would build (capture -> average -> sender),
+runs for a fixed duration, then end to end latency, frames analysed/s, packets/s and
+CPU per stage are reported.
+
+    python3 benchmark.py --mode stream --resolution 1080p --lights 4
+    python3 benchmark.py --save-baseline bench_baseline.json    # record the reference results
+    python3 benchmark.py --baseline bench_baseline.json         # exit code 1 on regression
+    python3 benchmark.py --allocations --memory-budget 256      # steady state memory on a small board
+    python3 benchmark.py --zones                                # zone colors against per light cv2.mean
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import cv2
+import numpy as np
+
+PACKAGE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "hue_play")
+RESOLUTIONS = {"720p": (1280, 720), "1080p": (1920, 1080), "4k": (3840, 2160)}
+CLIENT_KEY = "0123456789abcdef0123456789abcdef"
+USER_NAME = "benchmark"
+# packets per second of each Entertainment area, play.py -r default
+DEFAULT_RATE = 50
+# play.py -ull, -url, -dll and -drl light locations, the lights of the rest mode
+REST_LOCATIONS = [[-0.5, 1.0, 1.0], [0.5, 1.0, 1.0], [-0.5, 0.65, 1.0], [0.5, 0.65, 1.0]]
+HUE_STREAM_V1_HEADER_SIZE = 16
+HUE_STREAM_V1_RECORD_SIZE = 9
+# synthetic frame indexes are encoded on 13 bits
+FRAME_INDEX_MASK = (1 << 13) - 1
+# seconds ignored at start so the startup does not weigh on rates and percentiles
+WARMUP = 1.0
+# memory the pipeline may still hold per analysed frame once in steady state, with --allocations
+ALLOCATION_BUDGET = 64
+# memory allocated on top of the memory held, and freed again, in steady state with --allocations:
+# a few requests and packets, no frame sized temporary (a 640x360 frame is 675 kB)
+ALLOCATION_PEAK_BUDGET = 256 * 1024
+# seconds between two peak measures, short enough for the memory held to stay flat meanwhile
+ALLOCATION_PEAK_INTERVAL = 0.1
+# light counts of --zones, from the usual setups to a large Entertainment area, and timed calls per count
+ZONES_LIGHTS = (4, 8, 16)
+ZONES_REPEATS = 200
+
+
+####################################
+#        Stand-in Hue bridge       #
+####################################
+class FakeBridge:
+    """
+    Local stand-in for a Hue bridge: REST API over HTTP and Entertainment API over DTLS.
+    Every REST call and HueStream packet received is kept with its arrival time.
+    """
+
+    def __init__(self, lights_count):
+        self.lights_count = lights_count
+        self.rest_calls = []
+        self.packets = []
+        self.state = {"lights": {}, "groups": {}}
+        locations = {}
+        for index, location in enumerate(spread_locations(lights_count)):
+            light_id = str(index + 1)
+            self.state["lights"][light_id] = {
+                "name": f"Light {light_id}",
+                "productname": "Hue color lamp",
+                "state": {"on": True, "bri": 254, "hue": 0, "sat": 0, "reachable": True},
+            }
+            locations[light_id] = location
+        self.state["groups"]["1"] = {
+            "name": "TV",
+            "type": "Entertainment",
+            "lights": list(self.state["lights"]),
+            "locations": locations,
+        }
+        self._http_server = None
+        self._dtls_server = None
+        self.http_port = None
+        self.dtls_port = None
+
+    def start(self):
+        bridge = self
+
+        class BridgeHandler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def reply(self, payload):
+                body = json.dumps(payload).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                parts = self.path.strip("/").split("/")
+                self.reply(bridge.state if len(parts) == 2 else bridge.state.get(parts[2], {}))
+
+            def do_PUT(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                bridge.rest_calls.append((time.monotonic(), self.path, body))
+                self.reply([{"success": {}}])
+
+            def log_message(self, *args):
+                pass
+
+        self._http_server = ThreadingHTTPServer(("127.0.0.1", 0), BridgeHandler)
+        self.http_port = self._http_server.server_port
+        threading.Thread(target=self._http_server.serve_forever, daemon=True).start()
+
+        self.dtls_port = free_udp_port()
+        self._dtls_server = subprocess.Popen(
+            [
+                "openssl",
+                "s_server",
+                "-dtls1_2",
+                "-nocert",
+                "-cipher",
+                "PSK-AES128-GCM-SHA256",
+                "-psk",
+                CLIENT_KEY,
+                "-accept",
+                f"127.0.0.1:{self.dtls_port}",
+            ],
+            stdin=subprocess.PIPE,  # s_server quits on stdin EOF: keep it open
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            bufsize=0,
+        )
+        threading.Thread(target=self._read_packets, daemon=True).start()
+
+    def _read_packets(self):
+        packet_size = HUE_STREAM_V1_HEADER_SIZE + HUE_STREAM_V1_RECORD_SIZE * self.lights_count
+        pending = b""
+        while True:
+            chunk = os.read(self._dtls_server.stdout.fileno(), 65536)
+            if not chunk:
+                break
+            received_at = time.monotonic()
+            pending += chunk
+            while True:
+                start = pending.find(b"HueStream")
+                if start < 0 or len(pending) - start < packet_size:
+                    pending = pending[max(0, start) :] if start >= 0 else pending[-8:]
+                    break
+                self.packets.append((received_at, pending[start : start + packet_size]))
+                pending = pending[start + packet_size :]
+
+    def stop(self):
+        self._http_server.shutdown()
+        self._dtls_server.terminate()
+        self._dtls_server.wait()
+
+
+def spread_locations(lights_count):
+    """
+    :return: lights spread from left to right, alternating above and below the screen center
+    """
+    return [
+        [-0.9 + 1.8 * index / max(1, lights_count - 1), 0.0, 0.8 if index % 2 == 0 else -0.8]
+        for index in range(lights_count)
+    ]
+
+
+def free_udp_port():
+    import socket
+
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as udp_socket:
+        udp_socket.bind(("127.0.0.1", 0))
+        return udp_socket.getsockname()[1]
+
+
+####################################
+#          Frames source           #
+####################################
+class BenchmarkCapture:
+    """
+    cv2.VideoCapture look-alike delivering frames at a fixed rate.
+
+    Synthetic frames are uniform, their color encodes the frame index (red: low 5 bits
+    in steps of 8, so consecutive frames are never seen as static, green: next 8 bits)
+    so packets received by the bridge can be matched to the grab time of their frame.
+    Frames loaded from a video file are replayed in a loop instead.
+    """
+
+    def __init__(self, width, height, fps, video=None):
+        self.width = width
+        self.height = height
+        self.period = 1.0 / fps
+        self.index = 0
+        self.grab_times = np.zeros(FRAME_INDEX_MASK + 1, dtype=np.float64)
+        self.frames = load_video_frames(video, width, height) if video else None
+        # a few rotating buffers: a published frame is never rewritten while being analysed
+        self._buffers = [np.empty((height, width, 3), dtype=np.uint8) for _ in range(4)]
+        self._deadline = None
+
+    def isOpened(self):
+        return True
+
+    def get(self, prop):
+        return {cv2.CAP_PROP_FRAME_WIDTH: self.width, cv2.CAP_PROP_FRAME_HEIGHT: self.height}.get(prop, 0)
+
+    def set(self, prop, value):
+        return True
+
+    def grab(self):
+        now = time.monotonic()
+        if self._deadline is None:
+            self._deadline = now
+        if self._deadline > now:
+            time.sleep(self._deadline - now)
+        self._deadline += self.period
+        self.index += 1
+        self.grab_times[self.index & FRAME_INDEX_MASK] = time.monotonic()
+        return True
+
+    def retrieve(self):
+        frame = self._buffers[self.index % len(self._buffers)]
+        if self.frames is not None:
+            np.copyto(frame, self.frames[self.index % len(self.frames)])
+        else:
+            # cv2 fills a frame much faster than numpy broadcasting does
+            color = (128, (self.index >> 5) & 0xFF, (self.index << 3) & 0xFF)  # BGR
+            cv2.rectangle(frame, (0, 0), (self.width - 1, self.height - 1), color, thickness=-1)
+        return True, frame
+
+    def release(self):
+        pass
+
+
+def load_video_frames(path, width, height, max_frames=300):
+    video = cv2.VideoCapture(path)
+    frames = []
+    while len(frames) < max_frames:
+        ok, frame = video.read()
+        if not ok:
+            break
+        frames.append(cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA))
+    video.release()
+    if not frames:
+        sys.exit(f"Unable to read frames from {path}")
+    return frames
+
+
+####################################
+#          Measurements            #
+####################################
+def thread_cpu_seconds(native_id):
+    # utime + stime of one thread (Linux only)
+    try:
+        with open(f"/proc/self/task/{native_id}/stat") as stat_file:
+            fields = stat_file.read().rsplit(")", 1)[1].split()
+    except OSError:
+        return None
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def process_cpu_seconds(pid):
+    try:
+        with open(f"/proc/{pid}/stat") as stat_file:
+            fields = stat_file.read().rsplit(")", 1)[1].split()
+    except OSError:
+        return None
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def stage_cpu_seconds(transports):
+    # one sender thread and one transport per stream session: their times add up
+    cpu = {}
+    for thread in threading.enumerate():
+        if thread.name in ("capture", "average", "sender"):
+            cpu.setdefault(thread.name, []).append(thread_cpu_seconds(thread.native_id))
+    for transport in transports:
+        if transport._proc is not None:
+            cpu.setdefault("transport", []).append(process_cpu_seconds(transport._proc.pid))
+    return {stage: None if None in seconds else sum(seconds) for stage, seconds in cpu.items()}
+
+
+def percentiles(values):
+    if not len(values):
+        return {"p50": None, "p95": None, "p99": None}
+    p50, p95, p99 = np.percentile(np.asarray(values) * 1000, [50, 95, 99])
+    return {"p50": round(p50, 2), "p95": round(p95, 2), "p99": round(p99, 2)}
+
+
+def synthetic_frame_colors(frame_indexes):
+    # RGB zone colors of the synthetic frames, see BenchmarkCapture
+    return np.column_stack(((frame_indexes << 3) & 0xFF, (frame_indexes >> 5) & 0xFF, np.full_like(frame_indexes, 128)))
+
+
+def packet_frame_indexes():
+    """
+    :return: {color bytes of a light record: candidate frame indexes}, colors are sent as gamut C x, y, brightness
+    """
+    from hue_play.color import ColorLUT
+
+    frame_indexes = np.arange(FRAME_INDEX_MASK + 1)
+    values = ColorLUT("C").lookup(synthetic_frame_colors(frame_indexes)) * np.float32(65535)
+    # same rounding as HueStreamEncoder
+    records = np.clip(values, 0, 0xFFFF).astype(">u2")
+    candidates = {}
+    for frame_index, record in zip(frame_indexes, records):
+        candidates.setdefault(record.tobytes(), []).append(frame_index)
+    return candidates
+
+
+def packet_latencies(packets, capture, since):
+    # first arrival of each frame, matched on the color of the first light. The color quantization
+    # maps a few frames a second apart on the same color: the latest one grabbed is the one sent
+    candidates = packet_frame_indexes()
+    latencies = []
+    last_color = None
+    for received_at, packet in packets:
+        if received_at < since:
+            continue
+        color = packet[HUE_STREAM_V1_HEADER_SIZE + 3 : HUE_STREAM_V1_HEADER_SIZE + HUE_STREAM_V1_RECORD_SIZE]
+        # packets arrive in order: keepalives repeat the previous frame
+        if color == last_color:
+            continue
+        last_color = color
+        grab_times = [capture.grab_times[index] for index in candidates.get(color, [])]
+        grab_times = [grabbed_at for grabbed_at in grab_times if 0 < grabbed_at <= received_at]
+        if grab_times:
+            latencies.append(received_at - max(grab_times))
+    return latencies
+
+
+####################################
+#            Benchmark             #
+####################################
+def benchmark_outputs(args, bridges):
+    """
+    :return: the engine outputs play.py builds for the stand-in bridges: the Entertainment area of each
+             one in stream mode, the first REST_LOCATIONS lights of the first one otherwise
+    """
+    from hue_play.color import DEFAULT_GAMUT
+    from hue_play.engine import EntertainmentOutput, RestOutput
+
+    if args.mode == "stream":
+        return [
+            EntertainmentOutput(
+                f"bridge{index}",
+                f"127.0.0.1:{stand_in.http_port}",
+                USER_NAME,
+                CLIENT_KEY,
+                stand_in.state["groups"]["1"]["lights"],
+                list(stand_in.state["groups"]["1"]["locations"].values()),
+                [DEFAULT_GAMUT] * args.lights,
+                DEFAULT_RATE,
+            )
+            for index, stand_in in enumerate(bridges)
+        ]
+    bridge = bridges[0]
+    light_ids = [int(light_id) for light_id in bridge.state["lights"]][: len(REST_LOCATIONS)]
+    groups = {
+        group_id: [int(light_id) for light_id in group["lights"]] for group_id, group in bridge.state["groups"].items()
+    }
+    return [
+        RestOutput(
+            f"http://127.0.0.1:{bridge.http_port}/api/{USER_NAME}",
+            light_ids,
+            REST_LOCATIONS[: len(light_ids)],
+            [DEFAULT_GAMUT] * len(light_ids),
+            fetch_groups=lambda: groups,
+        )
+    ]
+
+
+def run_benchmark(args):
+    width, height = RESOLUTIONS[args.resolution]
+    bridges = [FakeBridge(args.lights) for _ in range(args.bridges)]
+    for bridge in bridges:
+        bridge.start()
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from hue_play.engine import EngineConfig, HuePlayEngine
+    from hue_play.transport import DtlsTransport
+
+    config = EngineConfig(
+        metrics=True,
+        output_delay=args.output_delay / 1000 if args.mode == "stream" else 0.0,
+        adaptive_quality=bool(args.cpu_budget),
+        cpu_budget=args.cpu_budget or 50.0,
+        latency_budget=args.latency_budget / 1000,
+        zone_statistic=args.zone_statistic,
+    )
+    engine = HuePlayEngine(config, started=time.monotonic())
+    dtls_ports = {f"127.0.0.1:{stand_in.http_port}": stand_in.dtls_port for stand_in in bridges}
+    transports = []
+
+    def bridge_transport(host, *transport_args, **transport_kwargs):
+        # each stand-in bridge shares the REST host but listens for DTLS on a free port
+        transport = DtlsTransport("127.0.0.1", *transport_args, port=dtls_ports[host], **transport_kwargs)
+        transports.append(transport)
+        return transport
+
+    engine.transport_factory = bridge_transport
+    capture = BenchmarkCapture(width, height, args.fps, args.video)
+    engine.start_capture(lambda: capture)
+    engine.start(benchmark_outputs(args, bridges))
+
+    time.sleep(WARMUP)
+    if args.allocations:
+        # every buffer of the steady state exists by now, whatever is traced from here on was allocated per frame
+        tracemalloc.start()
+        allocation_peak = AllocationPeak()
+        allocation_peak.start()
+    started = time.monotonic()
+    cpu_start = stage_cpu_seconds(transports)
+    frames_start = engine.metrics.stages["zones"].count
+    time.sleep(args.duration)
+    elapsed = time.monotonic() - started
+    cpu_end = stage_cpu_seconds(transports)
+    frames_analysed = engine.metrics.stages["zones"].count - frames_start
+    allocations = args.allocations and steady_state_allocations(frames_analysed, allocation_peak)
+    snapshot = engine.metrics.snapshot()
+
+    engine.stop()
+    engine.wait()
+    for stand_in in bridges:
+        stand_in.stop()
+
+    # every stand-in bridge receives its own packets, the rate is the total
+    received = [
+        item for stand_in in bridges for item in (stand_in.packets if args.mode == "stream" else stand_in.rest_calls)
+    ]
+    sent = len([item for item in received if started <= item[0] <= started + elapsed])
+    # interpolated colors of delayed output, or colors of sampled frames, no longer tell their frame:
+    # the pipeline measures the latency then
+    if args.mode == "stream" and not args.video and not args.output_delay and not args.cpu_budget:
+        # measured at the bridges, includes the DTLS sessions
+        latency = percentiles(
+            [latency for stand_in in bridges for latency in packet_latencies(stand_in.packets, capture, started)]
+        )
+    else:
+        latency = {key: round(snapshot["latency"][key], 2) for key in ("p50", "p95", "p99")}
+
+    cpu_percent = {}
+    for stage, end in cpu_end.items():
+        if end is not None and cpu_start.get(stage) is not None:
+            cpu_percent[stage] = round(100 * (end - cpu_start[stage]) / elapsed, 1)
+
+    result = {
+        "config": config_name(args),
+        "frames_analysed_per_s": round(frames_analysed / elapsed, 2),
+        "packets_per_s": round(sent / elapsed, 2),
+        "latency_ms": latency,
+        "cpu_percent": cpu_percent,
+        "stages_ms": {
+            stage: {"p50": round(summary["p50"], 3), "p95": round(summary["p95"], 3)}
+            for stage, summary in snapshot.items()
+            if summary["count"]
+        },
+        # ru_maxrss is in kB on Linux
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+    if allocations:
+        result["allocations"] = allocations
+    if engine.quality is not None:
+        result["quality_level"] = engine.quality.level
+    return result
+
+
+class AllocationPeak:
+    """
+    Largest memory allocated on top of the memory held, measured with the tracemalloc peak over short windows.
+
+    Per frame temporaries are freed before any snapshot sees them, not before the peak does.
+    The peak covers the whole process, the stand-in bridges included.
+    """
+
+    def __init__(self, interval=ALLOCATION_PEAK_INTERVAL):
+        self.interval = interval
+        self.peak = 0
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="allocation-peak", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        """
+        :return: largest bytes allocated and freed again within a window
+        """
+        self._done.set()
+        self._thread.join()
+        return self.peak
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            held = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            stopping = self._done.wait(self.interval)
+            self.peak = max(self.peak, tracemalloc.get_traced_memory()[1] - held)
+
+
+def zones_benchmark(args):
+    """
+    Time ZoneAverager alone against the per light cv2.mean it replaced, on the same zones.
+    :return: result with the best time in ms of each statistic and of the reference, per light count
+    """
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from hue_play.engine import zone_bounds
+    from hue_play.zones import ZONE_STATISTICS, ZoneAverager
+
+    width, height = RESOLUTIONS[args.resolution]
+    # smooth picture: zones of uniform frames would be as cheap as the others, but tell nothing apart
+    random = np.random.default_rng(0)
+    frame = cv2.GaussianBlur(random.integers(0, 256, (height, width, 3), dtype=np.uint8), (0, 0), 25)
+    result = {"config": f"zones-{args.resolution}", "zones_ms": {}}
+    for lights_count in ZONES_LIGHTS:
+        bounds = zone_bounds(spread_locations(lights_count), (0, height, 0, width))
+        boxes = [(max(0, top), bottom, max(0, left), right) for top, bottom, left, right in bounds]
+
+        def per_light_mean():
+            # average_image before ZoneAverager: one cv2.mean per light
+            for top, bottom, left, right in boxes:
+                cv2.mean(frame[top:bottom, left:right])
+
+        timings = {"per_light_mean": best_time(per_light_mean)}
+        for statistic in ZONE_STATISTICS:
+            averager = ZoneAverager(width, height, bounds, statistic=statistic)
+            timings[statistic] = best_time(lambda: averager.compute(frame))
+        result["zones_ms"][f"{lights_count}lights"] = {name: round(ms, 3) for name, ms in timings.items()}
+    return result
+
+
+def best_time(function, repeats=ZONES_REPEATS):
+    """
+    :return: shortest ms of `repeats` calls, the least disturbed by other processes
+    """
+    best = None
+    for _ in range(repeats):
+        started = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best * 1000
+
+
+def zones_regressions(result, tolerance):
+    """
+    :return: light counts whose mean zone colors are slower than per light cv2.mean beyond `tolerance`
+    """
+    regressions = []
+    for lights, timings in result["zones_ms"].items():
+        reference = timings["per_light_mean"]
+        if timings["mean"] > reference * (1 + tolerance):
+            regressions.append(f"{lights}: mean {timings['mean']} ms > per light cv2.mean {reference} ms")
+    return regressions
+
+
+def steady_state_allocations(frames, allocation_peak):
+    """
+    :param allocation_peak: AllocationPeak started with the tracing
+    :return: memory allocated by hue_play since tracing started and still held, per analysed frame,
+             with the lines holding the most of it, and the steady state peak of temporary allocations
+    """
+    peak = allocation_peak.stop()
+    snapshot = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    sources = [tracemalloc.Filter(True, f"{PACKAGE_DIR}{os.sep}*")]
+    statistics = snapshot.filter_traces(sources).statistics("lineno")
+    held = sum(statistic.size for statistic in statistics)
+    return {
+        "bytes_per_frame": round(held / max(frames, 1), 1),
+        "peak_bytes": peak,
+        "top": [f"{statistic.traceback[0]}: {statistic.size} B" for statistic in statistics[:5]],
+    }
+
+
+def config_name(args):
+    source = os.path.basename(args.video) if args.video else "synthetic"
+    bridges = f"-{args.bridges}bridges" if args.bridges > 1 else ""
+    # tracing slows every allocation down, those runs get their own baselines
+    traced = "-allocations" if args.allocations else ""
+    delayed = f"-{args.output_delay:g}msdelay" if args.output_delay else ""
+    adaptive = f"-{args.cpu_budget:g}cpu{args.latency_budget:g}ms" if args.cpu_budget else ""
+    # the mean keeps the names of the baselines saved before zone statistics could be picked
+    statistic = f"-{args.zone_statistic}" if args.zone_statistic != "mean" else ""
+    options = f"{delayed}{adaptive}{statistic}{traced}"
+    return f"{args.mode}-{args.resolution}-{args.lights}lights{bridges}-{args.fps:g}fps-{source}{options}"
+
+
+def find_regressions(result, baseline, tolerance):
+    regressions = []
+    for key in ("frames_analysed_per_s", "packets_per_s"):
+        if result[key] < baseline[key] * (1 - tolerance):
+            regressions.append(f"{key}: {result[key]} < baseline {baseline[key]}")
+    latency, baseline_latency = result["latency_ms"].get("p95"), baseline["latency_ms"].get("p95")
+    # absolute slack keeps sub-millisecond noise from failing the run
+    if latency is not None and baseline_latency is not None and latency > baseline_latency * (1 + tolerance) + 2:
+        regressions.append(f"latency p95: {latency} ms > baseline {baseline_latency} ms")
+    for stage, cpu in result["cpu_percent"].items():
+        baseline_cpu = baseline["cpu_percent"].get(stage)
+        if baseline_cpu is not None and cpu > baseline_cpu * (1 + tolerance) + 2:
+            regressions.append(f"{stage} cpu: {cpu}% > baseline {baseline_cpu}%")
+    return regressions
+
+
+def memory_over_budget(result, memory_budget):
+    problems = []
+    if memory_budget and result["peak_rss_mb"] > memory_budget:
+        problems.append(f"peak RSS: {result['peak_rss_mb']} MB > {memory_budget} MB")
+    allocations = result.get("allocations")
+    if allocations and allocations["bytes_per_frame"] > ALLOCATION_BUDGET:
+        problems.append(f"steady state: {allocations['bytes_per_frame']} B held per frame > {ALLOCATION_BUDGET} B")
+    if allocations and allocations["peak_bytes"] > ALLOCATION_PEAK_BUDGET:
+        problems.append(
+            f"steady state: {allocations['peak_bytes']} B of temporaries > {ALLOCATION_PEAK_BUDGET} B, "
+            "a buffer is allocated per frame"
+        )
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the hue play pipeline against a stand-in bridge")
+    parser.add_argument("--mode", choices=["stream", "rest"], default="stream")
+    parser.add_argument("--resolution", choices=list(RESOLUTIONS), default="1080p")
+    parser.add_argument("--lights", type=int, default=4)
+    parser.add_argument("--bridges", type=int, default=1, help="stand-in bridges streamed to, stream mode only")
+    parser.add_argument("--fps", type=float, default=30)
+    parser.add_argument("--output-delay", type=float, default=0, help="ms, stream mode only, see play.py -od")
+    parser.add_argument(
+        "--zone-statistic",
+        choices=["mean", "dominant", "saturation"],
+        default="mean",
+        help="color of each zone, see play.py -zs",
+    )
+    parser.add_argument("--cpu-budget", type=float, help="percent, enables play.py -aq with this -cpu budget")
+    parser.add_argument("--latency-budget", type=float, default=100, help="ms, -lat of --cpu-budget runs")
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--video", help="video file replayed instead of synthetic frames")
+    parser.add_argument("--save-baseline", help="JSON file the results are saved to as reference")
+    parser.add_argument("--baseline", help="JSON file of reference results, regressions exit with code 1")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="accepted relative regression")
+    parser.add_argument(
+        "--allocations", action="store_true", help="trace the steady state allocations, exit code 1 if frames leak"
+    )
+    parser.add_argument("--memory-budget", type=float, help="peak RSS in MB, exit code 1 above it")
+    parser.add_argument(
+        "--zones",
+        action="store_true",
+        help="time the zone colors alone against per light cv2.mean, exit code 1 when slower beyond --tolerance",
+    )
+    args = parser.parse_args()
+    if args.zones:
+        result = zones_benchmark(args)
+        print(json.dumps(result, indent=2))
+        regressions = zones_regressions(result, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        sys.exit(1 if regressions else 0)
+    if args.mode == "rest":
+        args.lights = min(args.lights, len(REST_LOCATIONS))
+        args.bridges = 1
+    save_baseline = args.save_baseline and os.path.abspath(args.save_baseline)
+    baseline_path = args.baseline and os.path.abspath(args.baseline)
+
+    result = run_benchmark(args)
+    print(json.dumps(result, indent=2))
+    over_budget = memory_over_budget(result, args.memory_budget)
+    for problem in over_budget:
+        print(f"OVER BUDGET {problem}")
+
+    if save_baseline:
+        baselines = {}
+        if os.path.exists(save_baseline):
+            with open(save_baseline) as baseline_file:
+                baselines = json.load(baseline_file)
+        baselines[result["config"]] = result
+        with open(save_baseline, "w") as baseline_file:
+            json.dump(baselines, baseline_file, indent=2)
+        print(f"Baseline saved to {save_baseline}")
+
+    if baseline_path:
+        with open(baseline_path) as baseline_file:
+            baseline = json.load(baseline_file).get(result["config"])
+        if baseline is None:
+            sys.exit(f"No baseline for {result['config']} in {baseline_path}")
+        regressions = find_regressions(result, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        sys.exit(1 if regressions or over_budget else 0)
+    if over_budget:
+        sys.exit(1)
+    # the pipeline leaves daemon threads (metrics, animations) behind
+    os._exit(0)
+
+
+if __name__ == "__main__":
+    main()
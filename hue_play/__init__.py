@@ -0,0 +1,3 @@
+"""
+Building blocks used by play.py: frame pipeline, video analysis and light senders.
+"""
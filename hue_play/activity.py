@@ -0,0 +1,185 @@
+import threading
+
+import cv2
+import numpy as np
+
+ACTIVE = "active"
+STATIC = "static"
+IDLE = "idle"
+# signature of a frame: about 32x18 pixels picked on a regular lattice
+SIGNATURE_SIZE = (32, 18)
+# largest sample change, in 8-bit units, still considered the same picture (capture noise, dithering)
+STATIC_THRESHOLD = 6
+# smallest mean change of a signature block, in 8-bit units, worth analysing the frame: slow fades move
+# every sample a little, less than STATIC_THRESHOLD, but move the zone colors as much
+CHANGE_THRESHOLD = 2.0
+# signature blocks the mean change is checked on, about the size of a zone
+SIGNATURE_BLOCKS = (4, 3)
+# brightest sample of a frame considered black
+BLACK_LEVEL = 24
+# seconds of black frames or missing signal before going idle: longer than a black scene or a fade to black
+IDLE_AFTER = 30.0
+# seconds between the first two frames looked at once idle, doubled on every frame looked at up to the poll
+# interval: content coming back soon after is caught at once, a switched off source costs one frame per poll
+FIRST_POLL_INTERVAL = 0.1
+
+
+class ActivityMonitor:
+    """
+    Tells the capture stage which frames are worth analysing at all.
+
+    Each frame is reduced to a tiny signature by plain strided sampling, a few
+    hundred pixels copied without any filtering. A frame whose signature did not
+    move since the last analysed one, neither any sample beyond the capture noise
+    nor the mean of any block by the change threshold of the senders, is static:
+    it is skipped, the lights already show it. Black frames for `idle_after` seconds, or no frames at all (no signal),
+    switch to idle: frames are only looked at after FIRST_POLL_INTERVAL, then twice as
+    long each time up to one per `poll_interval`, and the senders release the bridge
+    until a frame with content shows up again.
+    """
+
+    def __init__(
+        self,
+        idle_after=IDLE_AFTER,
+        poll_interval=1.0,
+        static_threshold=STATIC_THRESHOLD,
+        change_threshold=CHANGE_THRESHOLD,
+        black_level=BLACK_LEVEL,
+    ):
+        """
+        :param idle_after: seconds of black frames or missing signal before going idle, 0 to never go idle
+        :param poll_interval: longest time between two frames looked at while idle
+        :param static_threshold: largest signature sample change of a static picture, in 8-bit units
+        :param change_threshold: smallest signature block mean change of a moving picture, in 8-bit units,
+                                 the smallest color change the senders send (-ct)
+        :param black_level: brightest signature sample of a black frame, in 8-bit units
+        """
+        self.idle_after = idle_after
+        self.poll_interval = poll_interval
+        self.static_threshold = static_threshold
+        self.change_threshold = change_threshold
+        self.black_level = black_level
+        self.idle = threading.Event()
+        self.active = threading.Event()
+        self.active.set()
+        self.stopped = False
+        self._signature = None
+        self._reference = None
+        self._difference = None
+        self._block_changes = None
+        self._steps = None
+        self._black_since = None
+        self._last_frame_time = None
+        self._last_poll = 0.0
+        self._poll_delay = FIRST_POLL_INTERVAL
+
+    def poll_due(self, now):
+        """
+        :param now: time.monotonic() of the grabbed frame
+        :return: False while idle and the next poll is not due yet: the frame needs no retrieval
+        """
+        if not self.idle.is_set():
+            return True
+        if now - self._last_poll < self._poll_delay:
+            return False
+        self._last_poll = now
+        self._poll_delay = next_poll_delay(self._poll_delay, self.poll_interval)
+        return True
+
+    def check(self, bgr_frame, now):
+        """
+        :param bgr_frame: retrieved frame
+        :param now: time.monotonic() of the frame
+        :return: ACTIVE if the frame must be analysed, STATIC if it shows the same picture as the
+                 last analysed frame, IDLE while the input is black
+        """
+        self._last_frame_time = now
+        if self._signature is None or self._steps[2] != bgr_frame.shape:
+            self._allocate(bgr_frame.shape)
+        step_y, step_x, _ = self._steps
+        np.copyto(self._signature, bgr_frame[::step_y, ::step_x], casting="unsafe")
+
+        if self.idle_after and self._signature.max() <= self.black_level:
+            if self._black_since is None:
+                self._black_since = now
+            if self.idle.is_set() or now - self._black_since >= self.idle_after:
+                self._set_idle(True, now)
+                return IDLE
+        else:
+            self._black_since = None
+            if self.idle.is_set():
+                self._set_idle(False, now)
+                np.copyto(self._reference, self._signature)
+                return ACTIVE
+
+        np.subtract(self._signature, self._reference, out=self._difference)
+        # signed mean per block first: capture noise cancels out, a fade does not
+        cv2.resize(self._difference, SIGNATURE_BLOCKS, dst=self._block_changes, interpolation=cv2.INTER_AREA)
+        np.abs(self._block_changes, out=self._block_changes)
+        np.abs(self._difference, out=self._difference)
+        if self._difference.max() <= self.static_threshold and self._block_changes.max() < self.change_threshold:
+            return STATIC
+        np.copyto(self._reference, self._signature)
+        return ACTIVE
+
+    def no_frame(self, now):
+        """
+        Report that no frame could be grabbed, the input goes idle once it lasts `idle_after` seconds.
+        :param now: time.monotonic()
+        """
+        if self._last_frame_time is None:
+            self._last_frame_time = now
+        if self.idle_after and now - self._last_frame_time >= self.idle_after:
+            self._set_idle(True, now)
+
+    def wait_active(self, cancel=None):
+        """
+        Block while idle.
+        :param cancel: optional threading.Event also ending the wait, checked once per poll interval
+        :return: False if the monitor was stopped, or `cancel` set, meanwhile
+        """
+        if cancel is None:
+            self.active.wait()
+        else:
+            while not self.active.wait(self.poll_interval) and not cancel.is_set():
+                pass
+        return not self.stopped and not (cancel is not None and cancel.is_set())
+
+    def stop(self):
+        """
+        Release every thread blocked in `wait_active`, used on shutdown.
+        """
+        self.stopped = True
+        self.active.set()
+
+    def _set_idle(self, idle, now):
+        if idle == self.idle.is_set() or self.stopped:
+            return
+        if idle:
+            self.active.clear()
+            self.idle.set()
+        else:
+            self.idle.clear()
+            self.active.set()
+        # the frame (or missing frame) that switched to idle counts as the first one looked at
+        self._last_poll = now
+        self._poll_delay = min(FIRST_POLL_INTERVAL, self.poll_interval)
+
+    def _allocate(self, shape):
+        height, width = shape[:2]
+        step_y = max(1, height // SIGNATURE_SIZE[1])
+        step_x = max(1, width // SIGNATURE_SIZE[0])
+        self._steps = (step_y, step_x, shape)
+        signature_shape = (len(range(0, height, step_y)), len(range(0, width, step_x))) + tuple(shape[2:])
+        self._signature = np.zeros(signature_shape, dtype=np.int16)
+        # first frame always differs from the reference
+        self._reference = np.full(signature_shape, -1024, dtype=np.int16)
+        self._difference = np.empty(signature_shape, dtype=np.float32)
+        self._block_changes = np.empty((SIGNATURE_BLOCKS[1], SIGNATURE_BLOCKS[0]) + tuple(shape[2:]), dtype=np.float32)
+
+
+def next_poll_delay(poll_delay, poll_interval):
+    """
+    :return: seconds until the frame after next is looked at while idle, see FIRST_POLL_INTERVAL
+    """
+    return min(poll_delay * 2, poll_interval)
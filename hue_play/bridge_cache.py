@@ -0,0 +1,146 @@
+import json
+import os
+import threading
+import time
+
+import requests
+
+CACHE_VERSION = 1
+# lights, groups and entertainment areas rarely change: warm starts trust a state up to a day old
+BRIDGE_STATE_TTL = 24 * 3600
+# a light or Entertainment zone missing from a state older than this is looked up on the bridge again
+RECHECK_AGE = 10
+
+
+class BridgeStateCache:
+    """
+    Bridge lights, groups and entertainment locations, loaded with a single request.
+
+    The full state (`GET /api/<user>`) replaces one request per light/group listing.
+    It is indexed by id, name and product name and saved as versioned JSON, so a
+    warm start within `ttl` needs no discovery round-trip at all; the copy on disk
+    is then refreshed in the background for the next start. A state older than
+    RECHECK_AGE missing a light or zone is `invalidate`d and fetched again, since
+    it may predate that light being renamed or added.
+    """
+
+    def __init__(self, path, ttl=BRIDGE_STATE_TTL, log=None):
+        """
+        :param path: JSON file the state is saved to
+        :param ttl: seconds a saved state is trusted without fetching it again
+        :param log: optional callable used to report cache events
+        """
+        self.path = path
+        self.ttl = ttl
+        self.log = log or (lambda *args: None)
+        self.base_url = None
+        self.fetched_at = 0
+        self.sections = {}
+        self.section_times = {}
+        self.lights = {}
+        self.groups = {}
+        self.lights_by_name = {}
+        self.lights_by_product = {}
+        self._lock = threading.Lock()
+
+    def is_fresh(self):
+        return bool(self.lights) and time.time() - self.fetched_at < self.ttl
+
+    def needs_recheck(self):
+        """
+        :return: True if the state is old enough to miss lights renamed or added since it was fetched
+        """
+        return time.time() - self.fetched_at >= RECHECK_AGE
+
+    def invalidate(self):
+        """
+        Distrust every saved section, e.g. the entertainment configurations: they are fetched again when next used.
+        """
+        with self._lock:
+            self.fetched_at = 0
+            self.section_times = {}
+
+    def load(self, base_url):
+        """
+        Load the state saved for this bridge user.
+        :param base_url: bridge user url, http://<bridge ip>/api/<user name>
+        :return: True if a fresh state was loaded
+        """
+        try:
+            with open(self.path) as cache_file:
+                cached = json.load(cache_file)
+        except (OSError, ValueError):
+            return False
+        if cached.get("version") != CACHE_VERSION or cached.get("base_url") != base_url:
+            return False
+        with self._lock:
+            self.base_url = base_url
+            self.fetched_at = cached.get("fetched_at", 0)
+            self.sections = cached.get("sections", {})
+            self.section_times = cached.get("section_times", {})
+            self._index()
+        return self.is_fresh()
+
+    def fetch(self, base_url):
+        """
+        Fetch the full bridge state in one request, then save it.
+        :param base_url: bridge user url, http://<bridge ip>/api/<user name>
+        """
+        state = requests.get(base_url, timeout=5).json()
+        if isinstance(state, list):  # the bridge answers errors as a list, e.g. unauthorized user
+            raise ValueError(f"Unable to fetch bridge state: {state}")
+        with self._lock:
+            self.base_url = base_url
+            self.fetched_at = time.time()
+            self.sections.update({"lights": state.get("lights", {}), "groups": state.get("groups", {})})
+            self._index()
+        self.save()
+
+    def refresh_in_background(self):
+        def refresh():
+            try:
+                self.fetch(self.base_url)
+                self.log("Bridge state cache refreshed")
+            except (requests.RequestException, ValueError) as e:
+                self.log(f"Unable to refresh bridge state cache: {e}")
+
+        threading.Thread(target=refresh, daemon=True).start()
+
+    def get_section(self, name):
+        """
+        Extra cached data fetched separately, e.g. CLIP v2 resources.
+        :return: the saved value, None if missing or older than the ttl
+        """
+        if time.time() - self.section_times.get(name, 0) >= self.ttl:
+            return None
+        return self.sections.get(name)
+
+    def set_section(self, name, value):
+        with self._lock:
+            self.sections[name] = value
+            self.section_times[name] = time.time()
+        self.save()
+
+    def save(self):
+        with self._lock:
+            cached = {
+                "version": CACHE_VERSION,
+                "base_url": self.base_url,
+                "fetched_at": self.fetched_at,
+                "sections": self.sections,
+                "section_times": self.section_times,
+            }
+            # write then rename: a crash never leaves a half written cache behind
+            temporary_path = f"{self.path}.tmp"
+            with open(temporary_path, "w") as cache_file:
+                json.dump(cached, cache_file)
+            os.replace(temporary_path, self.path)
+
+    def _index(self):
+        self.lights = self.sections.get("lights", {})
+        self.groups = self.sections.get("groups", {})
+        self.lights_by_name = {}
+        self.lights_by_product = {}
+        for light_id, light in self.lights.items():
+            self.lights_by_name[light.get("name")] = light_id
+            self.lights_by_product.setdefault(light.get("productname"), []).append(light_id)
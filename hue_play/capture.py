@@ -0,0 +1,288 @@
+import sys
+import time
+
+import cv2
+import numpy as np
+
+FOURCCS = ("MJPG", "YUYV")
+DECODE_SCALES = (1, 2, 4, 8)
+# JPEG decoders skip whole DCT coefficients to decode at 1/2, 1/4 or 1/8 of the size, for almost free
+REDUCED_COLOR_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+PIPE_SOURCE_PREFIX = "pipe:"
+# frames are decoded into rotating buffers: one is filled while the previous ones may still be analysed
+FRAME_BUFFERS = 3
+
+
+class CaptureProfile:
+    """
+    What the capture device is asked for.
+    None keeps the device default, the device may also ignore any request.
+    """
+
+    def __init__(self, width=None, height=None, fourcc=None, fps=None, decode_scale=1):
+        """
+        :param width: requested frame width
+        :param height: requested frame height
+        :param fourcc: requested pixel format, one of FOURCCS
+        :param fps: requested frame rate
+        :param decode_scale: frames are decoded at 1/decode_scale of their size, one of DECODE_SCALES
+        """
+        if fourcc is not None and fourcc not in FOURCCS:
+            raise ValueError(f"Unsupported capture format {fourcc}, expected one of {', '.join(FOURCCS)}")
+        if decode_scale not in DECODE_SCALES:
+            raise ValueError(f"Unsupported decode scale {decode_scale}, expected one of {DECODE_SCALES}")
+        self.width = width
+        self.height = height
+        self.fourcc = fourcc
+        self.fps = fps
+        self.decode_scale = decode_scale
+
+    @staticmethod
+    def parse_size(size):
+        """
+        :param size: "<width>x<height>", e.g. "640x360"
+        :return: (width, height)
+        """
+        try:
+            width, height = (int(value) for value in size.lower().split("x"))
+        except ValueError:
+            raise ValueError(f"Invalid size {size}, expected <width>x<height>")
+        return width, height
+
+
+class DeviceCapture:
+    """
+    Capture device opened with a CaptureProfile, decoding as little as the zones need.
+
+    With an explicit format the raw device buffers are read (CAP_PROP_CONVERT_RGB off)
+    and decoded here: MJPEG frames with a reduced-scale JPEG decode, YUYV frames by
+    sampling the luma/chroma planes at the reduced size before a small color
+    conversion. Without an explicit format, or when the backend does not hand out raw
+    buffers, the backend decodes full frames as usual.
+
+    Same interface as cv2.VideoCapture; sizes are the ones of the frames returned.
+    """
+
+    # a failed grab means no signal for now, not the end of the stream
+    live = True
+
+    def __init__(self, device, profile, log=None):
+        """
+        :param device: capture device index
+        :param profile: CaptureProfile
+        :param log: optional callable used to report the negotiated settings
+        """
+        self.profile = profile
+        self.log = log or (lambda *args: None)
+        self.capture = cv2.VideoCapture(device)
+        self.raw = False
+        self._yuyv = None
+        self._raw_frame = None
+        # filled by the first frames, then handed back to OpenCV to decode into
+        self._frames = [None] * FRAME_BUFFERS
+        self._index = 0
+        if not self.capture.isOpened():
+            return
+        if profile.fourcc:
+            self.capture.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*profile.fourcc))
+        if profile.width and profile.height:
+            self.capture.set(cv2.CAP_PROP_FRAME_WIDTH, profile.width)
+            self.capture.set(cv2.CAP_PROP_FRAME_HEIGHT, profile.height)
+        if profile.fps:
+            self.capture.set(cv2.CAP_PROP_FPS, profile.fps)
+        self.device_width = int(self.capture.get(cv2.CAP_PROP_FRAME_WIDTH))
+        self.device_height = int(self.capture.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        fourcc = int(self.capture.get(cv2.CAP_PROP_FOURCC)).to_bytes(4, "little").decode(errors="replace")
+        self.fourcc = fourcc if fourcc in FOURCCS else None
+        self.log(f"Capture device format {fourcc} {self.device_width}x{self.device_height}")
+
+        if profile.fourcc and self.fourcc == profile.fourcc:
+            self.raw = bool(self.capture.set(cv2.CAP_PROP_CONVERT_RGB, 0))
+        if profile.fourcc and not self.raw:
+            self.log(f"Raw {profile.fourcc} frames unavailable, the capture backend decodes full frames")
+        scale = profile.decode_scale if self.raw else 1
+        self.width = self.device_width // scale // 2 * 2  # YUYV frames hold pixel pairs
+        self.height = self.device_height // scale
+        if self.raw and self.fourcc == "YUYV":
+            self._yuyv = np.empty((self.height, self.width // 2, 4), dtype=np.uint8)
+
+    def isOpened(self):
+        return self.capture.isOpened()
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return self.width
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return self.height
+        return self.capture.get(prop)
+
+    def set(self, prop, value):
+        return self.capture.set(prop, value)
+
+    def grab(self):
+        return self.capture.grab()
+
+    def retrieve(self):
+        self._index = (self._index + 1) % FRAME_BUFFERS
+        if not self.raw:
+            # OpenCV decodes in place when the buffer has the frame size
+            ok, frame = self.capture.retrieve(self._frames[self._index])
+            if ok:
+                self._frames[self._index] = frame
+            return ok, frame
+        # the raw buffer is decoded right away, a single one is reused
+        ok, frame = self.capture.retrieve(self._raw_frame)
+        if not ok:
+            return ok, frame
+        self._raw_frame = frame
+        if self.fourcc == "MJPG":
+            # imdecode has no destination: only the reduced size frame is allocated
+            bgr_frame = cv2.imdecode(frame, REDUCED_COLOR_FLAGS[self.profile.decode_scale])
+            return bgr_frame is not None, bgr_frame
+        return True, self._yuyv_to_bgr(frame)
+
+    def release(self):
+        self.capture.release()
+
+    def _yuyv_to_bgr(self, frame):
+        # YUYV packs 2 pixels in 4 bytes (Y0 U Y1 V): keeping every `step`-th pair of
+        # every `step`-th row is still a valid YUYV image, 1/step of the size, so only
+        # the pixels the zones need go through the color conversion
+        step = self.profile.decode_scale
+        packed = frame.reshape(self.device_height, self.device_width // 2, 4)
+        np.copyto(self._yuyv, packed[::step, ::step][: self.height, : self.width // 2])
+        # rotating destination: the previous frames may still be analysed
+        self._frames[self._index] = cv2.cvtColor(
+            self._yuyv.reshape(self.height, self.width, 2), cv2.COLOR_YUV2BGR_YUYV, dst=self._frames[self._index]
+        )
+        return self._frames[self._index]
+
+
+class PipeCapture:
+    """
+    Raw bgr24 frames read from a pipe, e.g.
+    `ffmpeg -i movie.mkv -s 1280x720 -f rawvideo -pix_fmt bgr24 - | python3 play.py -src pipe:1280x720`
+    or from a fifo with `-src pipe:1280x720:/tmp/frames`.
+
+    Same interface as cv2.VideoCapture.
+    """
+
+    def __init__(self, stream, width, height):
+        """
+        :param stream: binary file object, stdin or a fifo
+        :param width: frame width
+        :param height: frame height
+        """
+        self.stream = stream
+        self.width = width
+        self.height = height
+        self._frames = [np.empty((height, width, 3), dtype=np.uint8) for _ in range(FRAME_BUFFERS)]
+        self._index = 0
+        self._filled = False
+
+    def isOpened(self):
+        return not self.stream.closed
+
+    def get(self, prop):
+        return {cv2.CAP_PROP_FRAME_WIDTH: self.width, cv2.CAP_PROP_FRAME_HEIGHT: self.height}.get(prop, 0)
+
+    def set(self, prop, value):
+        return False
+
+    def grab(self):
+        self._index = (self._index + 1) % len(self._frames)
+        view = memoryview(self._frames[self._index]).cast("B")
+        read = 0
+        while read < len(view):
+            count = self.stream.readinto(view[read:])
+            if not count:
+                self._filled = False
+                return False
+            read += count
+        self._filled = True
+        return True
+
+    def retrieve(self):
+        return self._filled, self._frames[self._index]
+
+    def release(self):
+        self.stream.close()
+
+
+class FileCapture:
+    """
+    Video file played at its own frame rate, like a live source would deliver it.
+
+    Same interface as cv2.VideoCapture.
+    """
+
+    def __init__(self, path, realtime=True):
+        """
+        :param path: any file or url cv2.VideoCapture can read
+        :param realtime: wait for each frame time instead of reading as fast as possible
+        """
+        self.capture = cv2.VideoCapture(path)
+        fps = self.capture.get(cv2.CAP_PROP_FPS) if realtime else 0
+        self.period = 1.0 / fps if fps and fps > 0 else 0
+        self._deadline = None
+        self._frames = [None] * FRAME_BUFFERS
+        self._index = 0
+
+    def isOpened(self):
+        return self.capture.isOpened()
+
+    def get(self, prop):
+        return self.capture.get(prop)
+
+    def set(self, prop, value):
+        return self.capture.set(prop, value)
+
+    def grab(self):
+        if self.period:
+            now = time.monotonic()
+            if self._deadline is None or now - self._deadline > self.period:
+                self._deadline = now  # first frame or late: restart the frame clock
+            elif self._deadline > now:
+                time.sleep(self._deadline - now)
+            self._deadline += self.period
+        return self.capture.grab()
+
+    def retrieve(self):
+        self._index = (self._index + 1) % FRAME_BUFFERS
+        ok, frame = self.capture.retrieve(self._frames[self._index])
+        if ok:
+            self._frames[self._index] = frame
+        return ok, frame
+
+    def release(self):
+        self.capture.release()
+
+
+def open_capture(source, profile, log=None):
+    """
+    :param source: capture device index, "pipe:<width>x<height>[:<fifo path>]" for raw bgr24 frames on stdin
+                   or a fifo, or a video file
+    :param profile: CaptureProfile applied to capture devices
+    :param log: optional callable used to report the capture settings
+    :return: an object with the cv2.VideoCapture interface
+    """
+    source = str(source)
+    if source.isdigit():
+        return DeviceCapture(int(source), profile, log=log)
+    if source.startswith(PIPE_SOURCE_PREFIX):
+        size, _, path = source[len(PIPE_SOURCE_PREFIX) :].partition(":")
+        width, height = CaptureProfile.parse_size(size)
+        return PipeCapture(open(path, "rb") if path else sys.stdin.buffer, width, height)
+    return FileCapture(source)
+
+
+def reads_stdin(source):
+    """
+    :return: True if the source takes its frames from stdin, which is then not available for the keyboard
+    """
+    return str(source).startswith(PIPE_SOURCE_PREFIX) and ":" not in str(source)[len(PIPE_SOURCE_PREFIX) :]
@@ -0,0 +1,212 @@
+import os
+import threading
+
+import numpy as np
+
+# Philips Hue color gamuts: (red, green, blue) corners of the reachable xy triangle
+GAMUTS = {
+    "A": ((0.704, 0.296), (0.2151, 0.7106), (0.138, 0.08)),
+    "B": ((0.675, 0.322), (0.409, 0.518), (0.167, 0.04)),
+    "C": ((0.6915, 0.3083), (0.17, 0.7), (0.1532, 0.0475)),
+}
+# lights that do not report their gamut are most likely recent ones
+DEFAULT_GAMUT = "C"
+# wide gamut RGB D65 to XYZ, as recommended by the Hue developer documentation
+_RGB_TO_XYZ = np.array(
+    [
+        [0.664511, 0.154324, 0.162028],
+        [0.283881, 0.668433, 0.047685],
+        [0.000088, 0.072310, 0.986039],
+    ],
+    dtype=np.float64,
+)
+# x and y of a black pixel, D65 white point
+_WHITE_XY = (0.3127, 0.3290)
+LUT_VERSION = 1
+# 6 bits per channel: 64^3 entries, 4 levels of 8-bit input per step
+LUT_BITS = 6
+# tables already loaded by this process, shared by every converter (one per stream session)
+_tables = {}
+_tables_lock = threading.Lock()
+
+
+def light_gamut(light_state):
+    """
+    :param light_state: light as returned by the bridge REST API
+    :return: "A", "B" or "C"
+    """
+    gamut = light_state.get("capabilities", {}).get("control", {}).get("colorgamuttype")
+    return gamut if gamut in GAMUTS else DEFAULT_GAMUT
+
+
+def rgb_to_xy_brightness(rgb, gamut=DEFAULT_GAMUT):
+    """
+    Exact conversion, used to build the lookup tables.
+    :param rgb: array of shape (n, 3), sRGB values in [0, 255]
+    :param gamut: "A", "B" or "C", xy outside the gamut triangle are moved to its closest point
+    :return: float array of shape (n, 3): x, y and brightness in [0, 1]. Brightness is the
+             largest channel: a lamp shows a pure blue at its full blue output, while the
+             relative luminance of that blue would nearly switch it off
+    """
+    rgb = np.asarray(rgb, dtype=np.float64)
+    linear = rgb / 255.0
+    linear = np.where(linear > 0.04045, ((linear + 0.055) / 1.055) ** 2.4, linear / 12.92)
+    xyz = linear @ _RGB_TO_XYZ.T
+    total = xyz.sum(axis=1)
+    black = total <= 0
+    total[black] = 1.0
+    xy = xyz[:, :2] / total[:, None]
+    xy[black] = _WHITE_XY
+    xy = _clamp_to_triangle(xy, np.array(GAMUTS[gamut]))
+    return np.column_stack((xy, np.clip(rgb.max(axis=1) / 255.0, 0.0, 1.0)))
+
+
+def _clamp_to_triangle(points, triangle):
+    # barycentric test, points outside go to the closest point of the closest edge
+    a, b, c = triangle
+    v0, v1, v2 = c - a, b - a, points - a
+    dot00, dot01, dot11 = v0 @ v0, v0 @ v1, v1 @ v1
+    dot02, dot12 = v2 @ v0, v2 @ v1
+    inverse = 1.0 / (dot00 * dot11 - dot01 * dot01)
+    u = (dot11 * dot02 - dot01 * dot12) * inverse
+    v = (dot00 * dot12 - dot01 * dot02) * inverse
+    outside = (u < 0) | (v < 0) | (u + v > 1)
+    if not outside.any():
+        return points
+    candidates = []
+    for start, end in ((a, b), (b, c), (c, a)):
+        edge = end - start
+        t = np.clip(((points[outside] - start) @ edge) / (edge @ edge), 0.0, 1.0)
+        candidates.append(start + t[:, None] * edge)
+    candidates = np.stack(candidates)
+    distances = ((candidates - points[outside]) ** 2).sum(axis=2)
+    clamped = points.copy()
+    clamped[outside] = candidates[distances.argmin(axis=0), np.arange(len(distances[0]))]
+    return clamped
+
+
+class ColorLUT:
+    """
+    RGB -> (x, y, brightness) lookup table of one gamut, quantized on `bits` per channel.
+
+    Converting all the zones is one fancy-indexing lookup instead of a gamma
+    correction, a matrix product and a gamut clamp per frame. Tables are built
+    once and saved as .npy files under `cache_dir`, then memory-mapped on the next
+    starts.
+    """
+
+    def __init__(self, gamut=DEFAULT_GAMUT, bits=LUT_BITS, cache_dir=None, log=None):
+        """
+        :param gamut: "A", "B" or "C"
+        :param bits: quantization bits per RGB channel
+        :param cache_dir: directory the table is saved to, None to build it in memory only
+        :param log: optional callable used to report table builds
+        """
+        self.gamut = gamut
+        self.levels = 1 << bits
+        self.scale = (self.levels - 1) / 255.0
+        # float32 holds the 18 bits flat indexes exactly
+        self._strides = np.array([self.levels * self.levels, self.levels, 1], dtype=np.float32)
+        log = log or (lambda *args: None)
+        with _tables_lock:
+            key = (gamut, bits, cache_dir)
+            if key not in _tables:
+                _tables[key] = self._load_or_build(gamut, bits, cache_dir, log)
+            self.table = _tables[key]
+
+    def _load_or_build(self, gamut, bits, cache_dir, log):
+        path = cache_dir and os.path.join(cache_dir, f"gamut_{gamut}_{bits}bits_v{LUT_VERSION}.npy")
+        table = None
+        if path and os.path.exists(path):
+            try:
+                table = np.load(path, mmap_mode="r")
+            except (OSError, ValueError):
+                table = None
+        if table is None or table.shape != (self.levels ** 3, 3):
+            log(f"Building color lookup table for gamut {gamut}")
+            table = self._build()
+            if path:
+                os.makedirs(cache_dir, exist_ok=True)
+                # write then rename: a crash never leaves a half written table behind
+                temporary_path = f"{path}.{os.getpid()}.tmp.npy"
+                np.save(temporary_path, table)
+                os.replace(temporary_path, path)
+        return table
+
+    def _build(self):
+        levels = np.arange(self.levels, dtype=np.float64) / self.scale
+        r, g, b = np.meshgrid(levels, levels, levels, indexing="ij")
+        rgb = np.column_stack((r.ravel(), g.ravel(), b.ravel()))
+        return rgb_to_xy_brightness(rgb, self.gamut).astype(np.float32)
+
+    def indexes(self, rgb, out=None, scratch=None, flat_scratch=None):
+        """
+        :param rgb: array of shape (n, 3), RGB in [0, 255]
+        :param out: optional intp array of shape (n,) written in place
+        :param scratch: optional float32 array of shape (n, 3) used as work buffer
+        :param flat_scratch: optional float32 array of shape (n,) used as work buffer
+        :return: flat table index of each color
+        """
+        quantized = np.multiply(rgb, self.scale, out=scratch, dtype=np.float32)
+        np.rint(quantized, out=quantized)
+        np.clip(quantized, 0, self.levels - 1, out=quantized)
+        flat = np.dot(quantized, self._strides, out=flat_scratch)
+        if out is None:
+            return flat.astype(np.intp)
+        np.copyto(out, flat, casting="unsafe")
+        return out
+
+    def lookup(self, rgb):
+        """
+        :param rgb: array of shape (n, 3), RGB in [0, 255]
+        :return: float32 array of shape (n, 3): x, y, brightness in [0, 1]
+        """
+        return self.table[self.indexes(rgb)]
+
+
+class ZoneColorConverter:
+    """
+    Converts the zone colors of a frame to (x, y, brightness), each zone with the gamut of its light.
+    """
+
+    def __init__(self, gamuts, bits=LUT_BITS, cache_dir=None, log=None):
+        """
+        :param gamuts: gamut of each zone, in zone order
+        :param bits: quantization bits per RGB channel
+        :param cache_dir: directory the lookup tables are saved to
+        :param log: optional callable used to report table builds
+        """
+        self.luts = {gamut: ColorLUT(gamut, bits, cache_dir, log) for gamut in set(gamuts)}
+        self._zones = {gamut: np.flatnonzero(np.array(gamuts) == gamut) for gamut in self.luts}
+        self._single = next(iter(self.luts.values())) if len(self.luts) == 1 else None
+        # work buffers of each gamut zones, so converting a frame does not allocate
+        self._buffers = {
+            gamut: (
+                np.empty((len(zones), 3), dtype=np.float32),
+                np.empty(len(zones), dtype=np.intp),
+                np.empty((len(zones), 3), dtype=np.float32),
+                np.empty(len(zones), dtype=np.float32),
+                np.empty((len(zones), 3), dtype=np.float32),
+            )
+            for gamut, zones in self._zones.items()
+        }
+        self._result = np.empty((len(gamuts), 3), dtype=np.float32)
+
+    def convert(self, rgb):
+        """
+        :param rgb: float array of shape (zones, 3), RGB in [0, 255]
+        :return: float32 array of shape (zones, 3): x, y, brightness in [0, 1], valid until the next call
+        """
+        if self._single is not None:
+            _, indexes, scratch, flat_scratch, _ = self._buffers[self._single.gamut]
+            self._single.indexes(rgb, out=indexes, scratch=scratch, flat_scratch=flat_scratch)
+            np.take(self._single.table, indexes, axis=0, out=self._result)
+            return self._result
+        for gamut, zones in self._zones.items():
+            zone_rgb, indexes, scratch, flat_scratch, zone_result = self._buffers[gamut]
+            np.take(rgb, zones, axis=0, out=zone_rgb)
+            lut = self.luts[gamut]
+            lut.indexes(zone_rgb, out=indexes, scratch=scratch, flat_scratch=flat_scratch)
+            np.take(lut.table, indexes, axis=0, out=zone_result)
+            self._result[zones] = zone_result
+        return self._result
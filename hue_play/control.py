@@ -0,0 +1,127 @@
+import json
+import threading
+import traceback
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+# largest request body read, commands only take a few settings
+MAX_BODY = 64 * 1024
+# host names of the Origin headers accepted: pages served by this machine only
+LOCAL_ORIGIN_HOSTS = ("localhost", "127.0.0.1", "::1")
+
+
+def is_local_origin(origin):
+    """
+    :param origin: Origin header of a request, None when the client sent none (curl, scripts)
+    :return: False for a request sent by a web page of another site
+    """
+    if origin is None:
+        return True
+    try:
+        return urlsplit(origin).hostname in LOCAL_ORIGIN_HOSTS
+    except ValueError:
+        return False
+
+
+class ControlServer:
+    """
+    Local HTTP control API of a long running process, served from a background thread.
+
+    `POST /<command>` (with an optional JSON object body) calls the command of that name
+    with the body as keyword arguments and answers its return value as JSON, read only
+    commands (`queries`) are also served on `GET /<command>`. Commands run one at a time,
+    in request order. A command raising ValueError answers 400 with the message, any
+    other error 500.
+    There is no authentication: a POST must be sent as `Content-Type: application/json`,
+    which browsers never send cross-origin without a CORS preflight this server does not
+    answer, and requests from a web page of another site (`Origin` header) are refused,
+    so no page open in a browser can control the process.
+    """
+
+    def __init__(self, commands, port, queries=(), host="127.0.0.1", log=None):
+        """
+        :param commands: {name: callable(**params) returning a JSON serializable value}
+        :param queries: names of the commands without side effects, the only ones served on GET
+        :param port: port listened on, 0 picks a free one
+        :param host: address listened on, only the local host by default: the API has no authentication
+        :param log: optional callable every command is reported to
+        """
+        self.commands = commands
+        self.queries = set(queries)
+        self.log = log or (lambda *args: None)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self.port = self._server.server_address[1]
+
+    def start(self):
+        threading.Thread(target=self._server.serve_forever, name="control-server", daemon=True).start()
+        return self
+
+    def shutdown(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def call(self, name, params, query=False):
+        """
+        :param query: True for a GET request, only `queries` are answered
+        :return: (HTTP status, JSON serializable answer)
+        """
+        command = self.commands.get(name)
+        if command is None:
+            return 404, {"error": f"Unknown command {name}, one of: {', '.join(sorted(self.commands))}"}
+        if query and name not in self.queries:
+            return 405, {"error": f"{name} changes the state, POST it"}
+        with self._lock:
+            self.log(f"Control command: {name} {params or ''}")
+            try:
+                return 200, command(**params)
+            except (TypeError, ValueError) as e:
+                return 400, {"error": str(e)}
+            except Exception as e:
+                # e.g. a bridge out of reach, the process keeps serving
+                traceback.print_exc()
+                return 500, {"error": str(e)}
+
+    def _handler_class(self):
+        server = self
+
+        class ControlHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if not is_local_origin(self.headers.get("Origin")):
+                    self._answer(403, {"error": "Requests from other sites are refused"})
+                    return
+                self._answer(*server.call(self.path.strip("/"), {}, query=True))
+
+            def do_POST(self):
+                if not is_local_origin(self.headers.get("Origin")):
+                    self._answer(403, {"error": "Requests from other sites are refused"})
+                    return
+                content_type = (self.headers.get("Content-Type") or "").split(";")[0].strip().lower()
+                if content_type != "application/json":
+                    self._answer(415, {"error": "Send commands as Content-Type: application/json"})
+                    return
+                length = int(self.headers.get("Content-Length") or 0)
+                if length > MAX_BODY:
+                    self._answer(413, {"error": "Request body too large"})
+                    return
+                try:
+                    params = json.loads(self.rfile.read(length) or b"{}")
+                except ValueError:
+                    params = None
+                if not isinstance(params, dict):
+                    self._answer(400, {"error": "The body must be a JSON object"})
+                    return
+                self._answer(*server.call(self.path.strip("/"), params))
+
+            def _answer(self, status, answer):
+                body = json.dumps(answer).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return ControlHandler
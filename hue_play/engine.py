@@ -0,0 +1,846 @@
+import threading
+import time
+import traceback
+
+import cv2
+import numpy as np
+
+from hue_play.activity import ACTIVE, IDLE_AFTER, STATIC, ActivityMonitor
+from hue_play.color import ZoneColorConverter
+from hue_play.frame_ring import CaptureProcessError
+from hue_play.huestream import COLOR_SPACE_XY, HueStreamEncoder
+from hue_play.jitter import JitterBuffer
+from hue_play.letterbox import ActiveAreaDetector
+from hue_play.metrics import Metrics
+from hue_play.pipeline import LatestSlot, Readiness
+from hue_play.quality import QualityController
+from hue_play.rest import RestLightSender
+from hue_play.scheduler import SendScheduler
+from hue_play.transport import DtlsTransport
+from hue_play.zones import MEAN, ZONE_STATISTICS, ZoneAverager
+
+# approx percent of the screen outside the location to capture
+BREADTH = 0.15
+# seconds between two letterbox / pillarbox detections
+ACTIVE_AREA_INTERVAL = 1.0
+
+
+class EngineConfig:
+    """
+    Settings of a HuePlayEngine, named after the play.py options setting them.
+    """
+
+    def __init__(
+        self,
+        change_threshold=2.0,
+        keepalive=1.0,
+        idle=IDLE_AFTER,
+        letterbox=True,
+        color_lut_dir=None,
+        metrics_port=None,
+        metrics_log=0,
+        metrics=False,
+        log_packets=False,
+        output_delay=0.0,
+        adaptive_quality=False,
+        cpu_budget=50.0,
+        latency_budget=0.1,
+        zone_statistic=MEAN,
+    ):
+        """
+        :param change_threshold: smallest color change, 0-255 scale, worth sending a new packet (-ct)
+        :param keepalive: seconds between keepalive packets on a static picture (-ka)
+        :param idle: seconds of black picture or missing signal before going idle, 0 never goes idle (-idle)
+        :param letterbox: zones follow the active picture between letterbox / pillarbox bars (not -nlb)
+        :param color_lut_dir: directory the color lookup tables are kept in, None to build them in memory
+        :param metrics_port: serve the stage timings on http://127.0.0.1:<port>/metrics (-mp)
+        :param metrics_log: log the stage timings every n seconds, 0 never (-ml)
+        :param metrics: time the stages even when they are neither served nor logged
+        :param log_packets: log every HueStream packet sent, in hex (-v)
+        :param output_delay: seconds between the capture of a frame and the Entertainment packets showing it,
+                             to match the TV processing delay, 0 sends as soon as possible (-od)
+        :param adaptive_quality: tune the frame skip, analysis resolution and send rate at runtime
+                                 to stay inside `cpu_budget` and `latency_budget` (-aq)
+        :param cpu_budget: percent of the whole machine the engine may use, 100 is every core busy (-cpu)
+        :param latency_budget: p95 seconds from frame grab to light packet, output delay excluded (-lat)
+        :param zone_statistic: color of each zone, one of hue_play.zones.ZONE_STATISTICS (-zs)
+        """
+        self.change_threshold = change_threshold
+        self.keepalive = keepalive
+        self.idle = idle
+        self.letterbox = letterbox
+        self.color_lut_dir = color_lut_dir
+        self.metrics_port = metrics_port
+        self.metrics_log = metrics_log
+        # the adaptive quality works from the stage timings
+        self.metrics = metrics or bool(metrics_port or metrics_log) or adaptive_quality
+        self.log_packets = log_packets
+        self.output_delay = output_delay
+        self.adaptive_quality = adaptive_quality
+        self.cpu_budget = cpu_budget
+        self.latency_budget = latency_budget
+        self.zone_statistic = zone_statistic
+
+
+class EntertainmentOutput:
+    """
+    Entertainment area of one bridge, streamed over its own DTLS session by its own sender thread.
+    """
+
+    __slots__ = (
+        "name",
+        "host",
+        "psk_identity",
+        "client_key",
+        "zone_ids",
+        "locations",
+        "gamuts",
+        "rate",
+        "version",
+        "entertainment_id",
+        "on_open",
+        "on_close",
+        "on_idle",
+        "on_resume",
+        "zones",
+    )
+
+    def __init__(
+        self,
+        name,
+        host,
+        psk_identity,
+        client_key,
+        zone_ids,
+        locations,
+        gamuts,
+        rate=50,
+        version=1,
+        entertainment_id=None,
+        on_open=None,
+        on_close=None,
+        on_idle=None,
+        on_resume=None,
+    ):
+        """
+        :param host: bridge address the DTLS session is opened to
+        :param psk_identity: user name (v1) or application id (v2)
+        :param client_key: hex PSK of the user
+        :param zone_ids: light ids (v1) or channel ids (v2), one per zone
+        :param locations: [x, y, z] entertainment location of each zone, x and z in [-1, 1]
+        :param gamuts: color gamut of each zone
+        :param rate: target packets per second
+        :param version: HueStream protocol version
+        :param entertainment_id: entertainment configuration id, HueStream v2 only
+        :param on_open: optional callable run before each DTLS session is opened, e.g. to start streaming
+        :param on_close: optional callable run after each DTLS session is closed
+        :param on_idle: optional callable run once the session was released on idle input
+        :param on_resume: optional callable run when the input comes back, before the session is reopened
+        """
+        self.name = name
+        self.host = host
+        self.psk_identity = psk_identity
+        self.client_key = client_key
+        self.zone_ids = list(zone_ids)
+        self.locations = list(locations)
+        self.gamuts = list(gamuts)
+        self.rate = rate
+        self.version = version
+        self.entertainment_id = entertainment_id
+        self.on_open = on_open
+        self.on_close = on_close
+        self.on_idle = on_idle
+        self.on_resume = on_resume
+        # slice of the output zones in the analysed zone colors, set by the engine
+        self.zones = None
+
+
+class RestOutput:
+    """
+    Lights updated through the REST API, for lights outside of any Entertainment area.
+    """
+
+    __slots__ = (
+        "base_url",
+        "zone_ids",
+        "locations",
+        "gamuts",
+        "brightness",
+        "fetch_groups",
+        "on_idle",
+        "on_resume",
+        "zones",
+    )
+
+    def __init__(
+        self, base_url, zone_ids, locations, gamuts, brightness=100, fetch_groups=None, on_idle=None, on_resume=None
+    ):
+        """
+        :param base_url: bridge REST API url of the user
+        :param zone_ids: light ids, one per zone
+        :param locations: [x, y, z] location of each zone, x and z in [-1, 1]
+        :param gamuts: color gamut of each light
+        :param brightness: brightness the color brightness is scaled up to (1-254)
+        :param fetch_groups: optional callable returning {group id: [light ids]}, enables batched updates
+        :param on_idle: optional callable run on idle input, e.g. to switch the lights off
+        :param on_resume: optional callable run when the input comes back
+        """
+        self.base_url = base_url
+        self.zone_ids = list(zone_ids)
+        self.locations = list(locations)
+        self.gamuts = list(gamuts)
+        self.brightness = brightness
+        self.fetch_groups = fetch_groups
+        self.on_idle = on_idle
+        self.on_resume = on_resume
+        self.zones = None
+
+
+def zone_bounds(locations, area, breadth=BREADTH):
+    """
+    :param locations: [x, y, z] location of every zone, x and z in [-1, 1]
+    :param area: (top, bottom, left, right) active picture of the frames, in pixels
+    :param breadth: approx percent of the screen outside the location to capture
+    :return: one [top, bottom, left, right] pixel box per zone
+    """
+    top, bottom, left, right = area
+    area_width = right - left
+    area_height = bottom - top
+    # Scales up locations to identify the nearest pixel based on lights locations, within the active picture
+    avg_size = area_width / 2 + area_height / 2
+    dist = int(breadth * avg_size)  # proportion of the pixels we want to average around in relation to the video size
+
+    zones_bounds = []
+    for light_pos in locations:
+        # Translates x value and resizes to the active picture width
+        x = left + ((light_pos[0]) + 1) * area_width // 2
+        # Flips y, translates, and resize to the active picture height
+        y = top + (-1 * (light_pos[2]) + 1) * area_height // 2
+        bound_map = list(map(int, [y - dist, y + dist, x - dist, x + dist]))
+        # zones never reach into the bars around the active picture
+        bounds = [max(top, bound_map[0]), bound_map[1], max(left, bound_map[2]), bound_map[3]]
+        bounds[1] = max(bounds[0] + 1, min(bottom, bounds[1]))
+        bounds[3] = max(bounds[2] + 1, min(right, bounds[3]))
+        zones_bounds.append(bounds)
+    return zones_bounds
+
+
+class HuePlayEngine:
+    """
+    Frames in, light colors out: the capture, analysis and sender stages of play.py as one object.
+
+    Frames come from a capture source (`start_capture`, `start_capture_process`) or are
+    pushed by the embedding application (`push_frame`), without any copy. Every zone of
+    every output is averaged in one pass per frame, then each output sender converts,
+    encodes and sends its slice of the zone colors on its own thread. The engine can be
+    created, and its capture started, before the outputs are known: `start` brings up
+    the analysis and the senders once they are, and `stop_outputs` takes them down again
+    while the capture goes on, e.g. to switch to other outputs.
+    """
+
+    def __init__(self, config=None, log=None, started=None):
+        """
+        :param config: EngineConfig, defaults otherwise
+        :param log: optional callable used for verbose output
+        :param started: time.monotonic() the startup timeline is measured from, now by default
+        """
+        self.config = config or EngineConfig()
+        self.log = log or (lambda *args: None)
+        self.metrics = Metrics(enabled=self.config.metrics)
+        if self.config.metrics_port:
+            self.metrics.serve(self.config.metrics_port)
+        if self.config.metrics_log:
+            self.metrics.log_periodically(self.config.metrics_log)
+        # newest video frame (capture -> average) and newest light colors (average -> sender)
+        self.frame_slot = LatestSlot("frame")
+        self.colors_slot = LatestSlot("colors")
+        self.readiness = Readiness(started)
+        self.activity = ActivityMonitor(idle_after=self.config.idle, change_threshold=self.config.change_threshold)
+        self.stopped = threading.Event()
+        self.stop_requested = False
+        # set to stop the analysis and senders of the current `start`, replaced on every `start`
+        self.outputs_stopped = threading.Event()
+        # DTLS transport class, replaced by stand-ins in benchmarks
+        self.transport_factory = DtlsTransport
+        self.outputs = []
+        self.video_width = None
+        self.video_height = None
+        self.capture_process = None
+        # JitterBuffer releasing the zone colors at capture time + output delay, when there is one
+        self.jitter = None
+        # analyse one frame out of frame_skip, one pixel out of sample_step in each direction,
+        # and send at rate_scale times the output rates: set by `set_quality`
+        self.frame_skip = 1
+        self.sample_step = 1
+        self.rate_scale = 1.0
+        self.averager = None
+        self.quality = None
+        # zones cover about `breadth` of the active picture around each light location, see `set_breadth`
+        self.breadth = BREADTH
+        self.active_area = None
+        self._bounds_lock = threading.Lock()
+        self._frames_skipped = 0
+        self._first_colors_seq = 0
+        self._capture_threads = []
+        self._threads = []
+
+    ####################################
+    #             Frames in            #
+    ####################################
+    def set_video_size(self, width, height):
+        self.video_width = width
+        self.video_height = height
+        self.log(f"Video Shape is: {width}, {height}")
+        self.readiness.set("video_size")
+
+    def push_frame(self, bgr_frame, timestamp=None):
+        """
+        Hand a decoded frame to the analysis, in place of a capture source.
+        The array is analysed as is, without any copy: it must not be written to while it may still be
+        analysed, decode into a few rotating buffers like the capture sources (hue_play.capture.FRAME_BUFFERS).
+        :param bgr_frame: (height, width, 3) uint8 array in BGR order, every frame of the same size
+        :param timestamp: time.monotonic() at which the frame was decoded or shown, now by default
+        :return: False once the engine is stopped
+        :raise ValueError: not a 3 channels uint8 frame, or not of the size of the first one
+        """
+        if self.stop_requested:
+            return False
+        if bgr_frame.dtype != np.uint8 or bgr_frame.ndim != 3 or bgr_frame.shape[2] != 3:
+            raise ValueError(f"Frame of {bgr_frame.dtype} and shape {bgr_frame.shape}, the engine analyses BGR uint8")
+        if timestamp is None:
+            timestamp = time.monotonic()
+        height, width = bgr_frame.shape[:2]
+        if self.video_width is None:
+            self.set_video_size(width, height)
+        elif (width, height) != (self.video_width, self.video_height):
+            raise ValueError(f"Frame of {width}x{height}, the engine analyses {self.video_width}x{self.video_height}")
+        if self._frame_due() and self._check_frame(bgr_frame, timestamp):
+            self.frame_slot.publish(bgr_frame, timestamp)  # replaces any frame not analysed yet
+            self.readiness.set("first_frame")
+        return True
+
+    def start_capture(self, open_capture):
+        """
+        Grab frames from a capture source on a "capture" thread.
+        :param open_capture: callable returning an object with the cv2.VideoCapture interface,
+                             called again to reopen a live source after a signal loss
+        """
+        self._start_capture_thread(self._capture_frames, open_capture)
+
+    def start_capture_process(self, capture_process):
+        """
+        Receive the frames of a started CaptureProcess on a "capture" thread.
+        """
+        self.capture_process = capture_process
+        self._start_capture_thread(self._receive_process_frames, capture_process)
+
+    def _start_capture_thread(self, target, *args):
+        capture_thread = threading.Thread(target=target, args=args, name="capture")
+        self._capture_threads.append(capture_thread)
+        capture_thread.start()
+
+    def _capture_frames(self, open_capture):
+        # Init video capture, runs while the bridge login and lights discovery are in progress
+        capture = open_capture()
+
+        # Try to get the first frame
+        if capture.isOpened():
+            self.log("Capture Device Opened")
+
+        else:
+            print("Unable to open Capture Device, please check your configuration")
+            self.stop()
+            return
+
+        self.set_video_size(int(capture.get(cv2.CAP_PROP_FRAME_WIDTH)), int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+
+        # This section loops & pulls re-colored frames and always get the newest frame
+        capture.set(cv2.CAP_PROP_BUFFERSIZE, 0)  # No frame buffer to avoid lagging, always grab newest frame
+
+        metrics = self.metrics
+        activity = self.activity
+        while not self.stop_requested:
+            started = metrics.now()
+            frame = capture.grab()  # constantly grabs frames, even idle, so the device never serves stale ones
+            captured_at = time.monotonic()
+            metrics.record("grab", started)
+            if not frame and getattr(capture, "live", False):
+                # no signal: retry at the idle poll rate, reopening the device
+                activity.no_frame(captured_at)
+                capture.release()
+                time.sleep(activity.poll_interval)
+                capture = open_capture()
+                continue
+            if frame and activity.poll_due(captured_at) and self._frame_due():
+                started = metrics.now()
+                frame, bgr_frame = capture.retrieve()  # processes most recent frame
+                metrics.record("retrieve", started)
+                if frame and self._check_frame(bgr_frame, captured_at):
+                    # BGR is kept as is, ZoneAverager swaps channels on its tiny per zone result
+                    self.frame_slot.publish(bgr_frame, captured_at)  # replaces any frame not analysed yet
+                    self.readiness.set("first_frame")
+
+            # if no new frame: stop loop
+            if not frame:
+                print("No more frames from Capture Device")
+                self.stop()
+                break
+        capture.release()
+
+    def _receive_process_frames(self, capture_process):
+        # Same as _capture_frames, the capture itself runs in its own process
+        try:
+            self.set_video_size(*capture_process.wait_ready())
+
+            while not self.stop_requested:
+                capture_process.set_idle(self.activity.idle.is_set())
+                frame = capture_process.next_frame(timeout=self.activity.poll_interval)
+                if frame is None:
+                    self.activity.no_frame(time.monotonic())
+                    continue
+                seq, bgr_frame, captured_at, grab_seconds, retrieve_seconds = frame
+                self.metrics.record_duration("grab", grab_seconds)
+                self.metrics.record_duration("retrieve", retrieve_seconds)
+                if not self._frame_due() or not self._check_frame(bgr_frame, captured_at):
+                    continue
+                # zero-copy view on the shared frame ring, the analysis checks it was not overwritten meanwhile
+                self.frame_slot.publish(bgr_frame, captured_at)
+                self.readiness.set("first_frame")
+        except (EOFError, CaptureProcessError) as e:
+            print(e)
+        finally:
+            self.stop()
+            capture_process.stop()
+
+    def _frame_due(self):
+        """
+        :return: True for one frame out of `frame_skip`, the others are grabbed but neither retrieved nor analysed
+        """
+        self._frames_skipped += 1
+        if self._frames_skipped < self.frame_skip:
+            return False
+        self._frames_skipped = 0
+        return True
+
+    def _check_frame(self, bgr_frame, captured_at):
+        """
+        :return: True if the frame must be analysed
+        """
+        activity = self.activity.check(bgr_frame, captured_at)
+        if activity == STATIC and self.jitter is not None:
+            self.jitter.hold(captured_at)
+        return activity == ACTIVE
+
+    def frame_intact(self, bgr_frame, captured_at):
+        return self.capture_process is None or self.capture_process.ring.is_intact(bgr_frame, captured_at)
+
+    ####################################
+    #             Running              #
+    ####################################
+    @property
+    def zone_ids(self):
+        """
+        :return: id of every zone, in zone colors order: the zones of each output one after the other
+        """
+        return [str(zone_id) for output in self.outputs for zone_id in output.zone_ids]
+
+    @property
+    def zone_locations(self):
+        return [location for output in self.outputs for location in output.locations]
+
+    def set_outputs(self, outputs):
+        """
+        :param outputs: EntertainmentOutput and RestOutput list, each reads its own slice of the zone colors
+        """
+        self.outputs = list(outputs)
+        first_zone = 0
+        for output in self.outputs:
+            output.zones = slice(first_zone, first_zone + len(output.zone_ids))
+            first_zone = output.zones.stop
+
+    def start(self, outputs, track=None, track_start=0.0):
+        """
+        Start the analysis and one sender per output.
+        :param outputs: EntertainmentOutput and RestOutput list
+        :param track: LightTrack played in place of the frames analysis
+        :param track_start: seconds into the track the playback starts at
+        """
+        self.set_outputs(outputs)
+        self.outputs_stopped = threading.Event()
+        # colors published for the previous outputs are never sent to these ones
+        self._first_colors_seq = self.colors_slot.seq
+        if self.config.output_delay:
+            self.jitter = JitterBuffer(self.config.output_delay, len(self.zone_ids))
+        if track is not None:
+            self.log("Starting light track playback...")
+            # the track holds the zone colors already: no capture nor analysis
+            self._start_stage("track", self._play_track, track, track_start)
+        else:
+            self.log("Starting Average image...")
+            self._start_stage("average", self._average_image)
+            if self.config.adaptive_quality:
+                self.quality = QualityController(self, self.config.cpu_budget, self.config.latency_budget)
+                self._start_stage("quality", self.quality.run)
+        for output in self.outputs:
+            if isinstance(output, EntertainmentOutput):
+                self._start_stage("sender", self._stream_output, output)
+            else:
+                self._start_stage("sender", self._send_rest_output, output)
+
+    def stop_outputs(self):
+        """
+        Stop the analysis and the senders started by `start`, which close their Entertainment sessions.
+        The capture keeps running: `start` brings the outputs, the same or others, back in no time.
+        """
+        self.outputs_stopped.set()
+        # wake up stages blocked on their input, the capture keeps publishing to the same slots;
+        # stages busy elsewhere see outputs_stopped as soon as they wait on them again
+        self.frame_slot.wake()
+        self.colors_slot.wake()
+        while self._threads:
+            stage_thread = self._threads.pop(0)
+            if stage_thread is not threading.current_thread():
+                stage_thread.join()
+        self.jitter = None
+        self.averager = None
+        self.quality = None
+
+    def set_breadth(self, breadth):
+        """
+        Resize the zones at runtime, swapped into the analysis at once like a new active picture.
+        :param breadth: approx percent of the screen outside the location to capture
+        """
+        with self._bounds_lock:
+            self.breadth = breadth
+            if self.averager is not None and self.active_area is not None:
+                self.averager.set_bounds(zone_bounds(self.zone_locations, self.active_area, breadth))
+
+    def set_zone_statistic(self, statistic):
+        """
+        :param statistic: color of each zone from the next frame on, one of hue_play.zones.ZONE_STATISTICS
+        """
+        if statistic not in ZONE_STATISTICS:
+            raise ValueError(f"Unknown zone statistic {statistic}, one of: {', '.join(ZONE_STATISTICS)}")
+        self.config.zone_statistic = statistic
+        if self.averager is not None:
+            self.averager.statistic = statistic
+
+    def set_quality(self, frame_skip=1, sample_step=1, rate_scale=1.0):
+        """
+        Trade quality for CPU at runtime, applied from the next frame and the next sender tick.
+        :param frame_skip: analyse one frame out of `frame_skip`
+        :param sample_step: analyse one pixel out of `sample_step` in each direction
+        :param rate_scale: send at `rate_scale` times the rate of each Entertainment output
+        """
+        self.frame_skip = frame_skip
+        self.sample_step = sample_step
+        self.rate_scale = rate_scale
+        if self.averager is not None:
+            self.averager.set_sample_step(sample_step)
+
+    def _start_stage(self, name, stage, *args):
+        stage_thread = threading.Thread(target=self._run_stage, args=(stage, *args), name=name)
+        self._threads.append(stage_thread)
+        stage_thread.start()
+
+    def _run_stage(self, stage, *args):
+        # a failing stage stops the whole pipeline instead of leaving the others running for nothing
+        try:
+            stage(*args)
+        except Exception as e:
+            print(e)
+            traceback.print_exc()
+            self.stop()
+
+    def wait(self, timeout=None):
+        """
+        Block until the engine is stopped and its stages are done.
+        :return: False on timeout
+        """
+        if not self.stopped.wait(timeout):
+            return False
+        for stage_thread in self._capture_threads + list(self._threads):
+            if stage_thread is not threading.current_thread():
+                stage_thread.join()
+        return True
+
+    def stop(self):
+        self.stop_requested = True
+        self.outputs_stopped.set()
+        # wake up stages blocked on their input or on a startup milestone
+        self.frame_slot.close()
+        self.colors_slot.close()
+        self.readiness.cancel()
+        self.activity.stop()
+        self.stopped.set()
+
+    def report_first_packet(self):
+        if self.readiness.set("first_packet"):
+            print(
+                f"Time to first packet: {self.readiness.times['first_packet'] * 1000:.0f} ms "
+                f"({self.readiness.summary()})"
+            )
+
+    ####################################
+    #          Average image          #
+    ####################################
+    def _average_image(self):
+        outputs_stopped = self.outputs_stopped
+        while not self.readiness.wait("video_size", self.activity.poll_interval):
+            if self.readiness.cancelled or outputs_stopped.is_set():
+                return
+        locations = self.zone_locations
+        with self._bounds_lock:
+            # the last active picture found, when the outputs are started again
+            if self.active_area is None:
+                self.active_area = (0, self.video_height, 0, self.video_width)
+            zones_bounds = zone_bounds(locations, self.active_area, self.breadth)
+            averager = ZoneAverager(
+                self.video_width,
+                self.video_height,
+                zones_bounds,
+                sample_step=self.sample_step,
+                statistic=self.config.zone_statistic,
+            )
+            self.averager = averager
+        self.log("Zones and bounds (in order) on TV array after math are: ", list(zip(self.zone_ids, zones_bounds)))
+        self.log(f"Zones {averager.statistic} {averager.method}")
+        if self.config.letterbox:
+            self._start_stage("letterbox", self._detect_active_area, averager, locations)
+        frame_seq = 0
+
+        # Sets RGB values of every zone at once via taking average of nearby pixels, once per new frame
+        while not outputs_stopped.is_set():
+            frame_seq, bgr_frame, captured_at = self.frame_slot.wait(frame_seq, cancel=outputs_stopped)
+            if bgr_frame is None:
+                continue
+            started = self.metrics.now()
+            # array of rgb values, one row for each zone, every output at once
+            zone_colors = averager.compute(bgr_frame)
+            self.metrics.record("zones", started)
+            if not self.frame_intact(bgr_frame, captured_at):
+                continue  # the capture process rewrote the frame during the analysis
+            self._publish_colors(zone_colors, captured_at)
+
+    def _publish_colors(self, zone_colors, captured_at):
+        if self.jitter is not None:
+            self.jitter.push(zone_colors, captured_at)
+        self.colors_slot.publish(zone_colors, captured_at)
+        self.readiness.set("first_zones")
+
+    def _detect_active_area(self, averager, locations):
+        """
+        Letterbox / pillarbox detection, once per ACTIVE_AREA_INTERVAL on the newest frame.
+        The zone bounds of a new active picture are computed here and swapped into the averager at once,
+        the per frame path of the analysis never pays for the detection.
+        """
+        detector = ActiveAreaDetector(self.video_width, self.video_height)
+        detector.area = self.active_area
+        frame_seq = 0
+        outputs_stopped = self.outputs_stopped
+        while not outputs_stopped.wait(ACTIVE_AREA_INTERVAL):
+            seq, bgr_frame, captured_at = self.frame_slot.latest()
+            if bgr_frame is None or seq == frame_seq:
+                continue  # idle or static: no new picture to look at
+            frame_seq = seq
+            area = detector.detect(bgr_frame)
+            if area is None or not self.frame_intact(bgr_frame, captured_at):
+                continue
+            top, bottom, left, right = area
+            self.log(f"Active picture is now {right - left}x{bottom - top} at ({left}, {top})")
+            with self._bounds_lock:
+                self.active_area = area
+                averager.set_bounds(zone_bounds(locations, area, self.breadth))
+
+    def _play_track(self, track, start=0.0):
+        """
+        Publish the zone colors of a light track at its frame rate, in place of the capture and analysis.
+        The colors are read from the memory mapped track, playback costs one publish per frame.
+        """
+        try:
+            if track.zones != self.zone_ids:
+                print("Error: the light track was analysed for other lights, analyse the video again with -at")
+                return
+            self.log(f"Playing light track {track.path}: {track.frame_count} frames at {track.fps:g} fps")
+            # track time 0 on the monotonic clock, `start` seconds into the track now
+            origin = time.monotonic() - start
+            index = track.frame_at(start)
+            outputs_stopped = self.outputs_stopped
+            while not outputs_stopped.is_set() and index is not None:
+                frame_time = origin + index / track.fps
+                delay = frame_time - time.monotonic()
+                if delay > 0 and outputs_stopped.wait(delay):
+                    break
+                self._publish_colors(track.colors[index], frame_time)
+                # late frames are skipped, the playback keeps in sync with the clock
+                index = max(index + 1, int((time.monotonic() - origin) * track.fps))
+                if index >= track.frame_count:
+                    index = None
+            if index is None:
+                print("End of the light track")
+        finally:
+            self.stop()
+
+    ####################################
+    #            Colors out            #
+    ####################################
+    def _converter(self, output):
+        return ZoneColorConverter(output.gamuts, cache_dir=self.config.color_lut_dir, log=self.log)
+
+    def _send_rest_output(self, output):
+        self.log("Streaming colors to lights... (Press Enter to stop streaming)")
+        sender = RestLightSender(output.base_url, log=self.log)
+        if output.fetch_groups:
+            # groups only enable batched updates, lights are sent one by one until they are known
+            threading.Thread(target=lambda: sender.set_groups(output.fetch_groups()), daemon=True).start()
+        activity = self.activity
+        metrics = self.metrics
+        converter = None
+        colors_seq = self._first_colors_seq
+        zone_colors = None
+        pending = False
+        outputs_stopped = self.outputs_stopped
+        while not outputs_stopped.is_set():
+            # while rate limited, come back as soon as a token frees up with the newest colors
+            colors_seq, new_colors, new_captured_at = self.colors_slot.wait(
+                colors_seq, timeout=sender.retry_delay() if pending else activity.poll_interval, cancel=outputs_stopped
+            )
+            if activity.idle.is_set():
+                # no signal: lights off until content comes back
+                self.log("Input idle, switching lights off")
+                if output.on_idle:
+                    output.on_idle()
+                if not activity.wait_active(outputs_stopped):
+                    break
+                self.log("Input back, switching lights on")
+                if output.on_resume:
+                    output.on_resume()
+                sender.reset()
+                continue
+            if new_colors is not None:
+                zone_colors, captured_at = new_colors[output.zones], new_captured_at
+            if zone_colors is None:
+                continue
+            if converter is None:
+                converter = self._converter(output)
+            started = metrics.now()
+            states = {}
+            # xy within the gamut of each light, brightness follows the picture up to the output brightness
+            for light_id, (x, y, brightness) in zip(output.zone_ids, converter.convert(zone_colors).tolist()):
+                bri = max(1, round(brightness * output.brightness))
+                states[light_id] = {"xy": (round(x, 4), round(y, 4)), "bri": bri}
+            metrics.record("convert", started)
+            started = metrics.now()
+            sent_count = sender.sent_count
+            pending = sender.send(states)
+            if sender.sent_count != sent_count:
+                metrics.record("write", started)
+                metrics.record_latency(captured_at)
+                self.report_first_packet()
+        sender.close()
+
+    def _encoder(self, output):
+        if output.version == 2:
+            return HueStreamEncoder(
+                output.zone_ids, version=2, entertainment_id=output.entertainment_id, color_space=COLOR_SPACE_XY
+            )
+        return HueStreamEncoder([int(zone_id) for zone_id in output.zone_ids], color_space=COLOR_SPACE_XY)
+
+    def _open_session(self, output):
+        if output.on_open:
+            output.on_open()
+        transport = self.transport_factory(
+            output.host,
+            output.psk_identity,
+            output.client_key,
+            on_connected=lambda: self.readiness.set("transport_connected"),
+            log=self.log,
+        )
+        transport.start()
+        return transport
+
+    def _close_session(self, output, transport):
+        # Turn off streaming to allow normal function immediately
+        transport.close()
+        if output.on_close:
+            output.on_close()
+
+    def _stream_output(self, output):
+        """
+        Sender of one output: its own DTLS session, packet rate and encoder, fed with its slice of the zone colors.
+        """
+        self.log(f"Streaming colors to Entertainment zone {output.name}... (Press Enter to stop streaming)")
+        config = self.config
+        activity = self.activity
+        metrics = self.metrics
+        transport = self._open_session(output)
+        scheduler = SendScheduler(output.rate, config.change_threshold, config.keepalive)
+        colors_seq = self._first_colors_seq
+        encoder = None
+        jitter = self.jitter
+        if jitter is not None:
+            delayed_colors = np.empty((len(self.zone_ids), 3), dtype=np.float32)
+        outputs_stopped = self.outputs_stopped
+        try:
+            while not outputs_stopped.is_set():
+                if activity.idle.is_set():
+                    # no signal: hand the lights back to the bridge until content comes back
+                    self.log(f"Input idle, releasing the Entertainment session {output.name}")
+                    self._close_session(output, transport)
+                    transport = None
+                    if output.on_idle:
+                        output.on_idle()
+                    if not activity.wait_active(outputs_stopped):
+                        break
+                    self.log(f"Input back, resuming the Entertainment session {output.name}")
+                    if output.on_resume:
+                        output.on_resume()
+                    transport = self._open_session(output)
+                    scheduler = SendScheduler(output.rate, config.change_threshold, config.keepalive)
+
+                if scheduler.rate != output.rate * self.rate_scale:
+                    scheduler.set_rate(output.rate * self.rate_scale)
+                scheduler.wait_tick()
+                if jitter is not None:
+                    # colors of the picture the TV shows now: captured `output_delay` ago
+                    now = time.monotonic()
+                    zone_colors, sync_error = jitter.colors_at(now, delayed_colors)
+                    if zone_colors is not None:
+                        metrics.record_duration("sync", sync_error)
+                    captured_at = now - jitter.delay
+                else:
+                    # newest colors, or nothing when no frame was analysed before the keepalive is due
+                    colors_seq, zone_colors, captured_at = self.colors_slot.wait(
+                        colors_seq, timeout=scheduler.keepalive_timeout(), cancel=outputs_stopped
+                    )
+                if zone_colors is not None:
+                    zone_colors = zone_colors[output.zones]  # view on the zones of this output
+                if encoder is None:
+                    if zone_colors is None:
+                        continue
+                    encoder = self._encoder(output)
+                    converter = self._converter(output)
+
+                if zone_colors is not None and scheduler.has_changed(zone_colors):
+                    started = metrics.now()
+                    xy_brightness = converter.convert(zone_colors)
+                    metrics.record("convert", started)
+                    started = metrics.now()
+                    message = encoder.encode_unit(xy_brightness)
+                    metrics.record("encode", started)
+                    if config.log_packets:
+                        self.log(f"message: {message.hex()}")
+                    # dropped while the transport re-handshakes, the next frame goes out once reconnected
+                    started = metrics.now()
+                    if transport.send(message):
+                        metrics.record("write", started)
+                        metrics.record_latency(captured_at)
+                        scheduler.mark_sent(zone_colors)
+                        self.report_first_packet()
+                elif scheduler.keepalive_due():
+                    # static picture: repeat the last packet so the bridge does not close the session
+                    if transport.send(encoder.packet):
+                        scheduler.mark_sent()
+        finally:
+            if transport:
+                self._close_session(output, transport)
@@ -0,0 +1,278 @@
+import multiprocessing
+import time
+import traceback
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+
+from hue_play.activity import FIRST_POLL_INTERVAL, next_poll_delay
+from hue_play.capture import open_capture
+
+FRAME_SLOTS = 4
+# per slot: sequence number and capture time, followed by the frames themselves
+_SLOT_HEADER = np.dtype([("seq", np.int64), ("captured_at", np.float64)])
+
+
+class CaptureProcessError(Exception):
+    pass
+
+
+class SharedFrameRing:
+    """
+    Ring of preallocated BGR frame buffers in shared memory.
+
+    The capture process writes frames in turn into the slots, tagging each with its
+    sequence number and capture time; other processes read them in place through
+    numpy views. A slot is tagged 0 while being written, so a reader checks
+    `is_intact` once done with a frame to know whether it was overwritten meanwhile.
+    """
+
+    def __init__(self, width, height, slots=FRAME_SLOTS, name=None):
+        """
+        :param width: frame width
+        :param height: frame height
+        :param slots: number of frame buffers
+        :param name: shared memory name to attach to, None to create a new ring
+        """
+        self.width = width
+        self.height = height
+        self.slots = slots
+        frame_size = width * height * 3
+        headers_size = _SLOT_HEADER.itemsize * slots
+        self.memory = shared_memory.SharedMemory(
+            name=name, create=name is None, size=headers_size + frame_size * slots
+        )
+        self.name = self.memory.name
+        self.headers = np.ndarray((slots,), dtype=_SLOT_HEADER, buffer=self.memory.buf)
+        self.frames = [
+            np.ndarray((height, width, 3), dtype=np.uint8, buffer=self.memory.buf, offset=headers_size + frame_size * i)
+            for i in range(slots)
+        ]
+        self._slots_by_frame = {id(frame): slot for slot, frame in enumerate(self.frames)}
+        if name is None:
+            self.headers["seq"] = -1
+        self._seq = 0
+
+    def write(self, frame, captured_at):
+        """
+        :param frame: BGR frame of the ring size
+        :param captured_at: time.monotonic() at which the frame was grabbed
+        :return: sequence number of the frame
+        """
+        self._seq += 1
+        slot = self._seq % self.slots
+        self.headers["seq"][slot] = 0
+        if frame.shape == self.frames[slot].shape:
+            np.copyto(self.frames[slot], frame)
+        else:  # device reopened with another size
+            cv2.resize(frame, (self.width, self.height), dst=self.frames[slot], interpolation=cv2.INTER_AREA)
+        self.headers["captured_at"][slot] = captured_at
+        self.headers["seq"][slot] = self._seq
+        return self._seq
+
+    def frame(self, seq):
+        """
+        :return: view of the frame `seq`, valid as long as `is_intact`
+        """
+        return self.frames[seq % self.slots]
+
+    def is_intact(self, frame, captured_at):
+        """
+        :param frame: view returned by `frame()`
+        :param captured_at: capture time announced with the frame
+        :return: False if the slot was rewritten, or is being rewritten, since the frame was announced
+        """
+        slot = self._slots_by_frame[id(frame)]
+        return self.headers["captured_at"][slot] == captured_at and self.headers["seq"][slot] != 0
+
+    def close(self):
+        self.headers = None
+        self.frames = []
+        self._slots_by_frame = {}
+        try:
+            self.memory.close()
+        except BufferError:
+            pass  # views still held by a stage, the mapping goes away with them
+
+    def unlink(self):
+        self.memory.unlink()
+
+
+def run_capture_process(connection, stop, idle, poll_interval, source, profile, slots, verbose):
+    """
+    Capture process body: grab frames into the shared ring and notify each one on `connection`.
+    While `idle` is set, frames are retrieved as seldom as ActivityMonitor.poll_due looks at them,
+    up to one per `poll_interval`.
+    Messages: ("size", width, height), ("frame", seq, captured_at, grab_seconds, retrieve_seconds),
+    ("end",) at the end of the stream and ("error", message).
+    """
+    log = print if verbose else None
+    capture = open_capture(source, profile, log=log)
+    ring = None
+    try:
+        if not capture.isOpened():
+            connection.send(("error", "Unable to open Capture Device, please check your configuration"))
+            return
+        width = int(capture.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        connection.send(("size", width, height))
+        # the parent creates (and always unlinks) the ring, even if this process dies
+        ring = SharedFrameRing(width, height, slots, name=connection.recv())
+        capture.set(cv2.CAP_PROP_BUFFERSIZE, 0)  # No frame buffer to avoid lagging, always grab newest frame
+        last_poll = 0.0
+        poll_delay = FIRST_POLL_INTERVAL
+
+        while not stop.is_set():
+            started = time.perf_counter()
+            frame = capture.grab()
+            captured_at = time.monotonic()
+            grabbed = time.perf_counter()
+            if not frame and getattr(capture, "live", False):
+                # no signal: retry at the idle poll rate, the reader notices the missing frames
+                capture.release()
+                time.sleep(poll_interval)
+                capture = open_capture(source, profile, log=log)
+                continue
+            if frame and idle.is_set():
+                if captured_at - last_poll < poll_delay:
+                    continue
+                last_poll = captured_at
+                poll_delay = next_poll_delay(poll_delay, poll_interval)
+            elif frame:
+                poll_delay = min(FIRST_POLL_INTERVAL, poll_interval)
+            if frame:
+                frame, bgr_frame = capture.retrieve()
+            if not frame:
+                connection.send(("end",))
+                break
+            seq = ring.write(bgr_frame, captured_at)
+            connection.send(("frame", seq, captured_at, grabbed - started, time.perf_counter() - grabbed))
+    except (BrokenPipeError, EOFError):
+        pass  # parent gone
+    except Exception:
+        connection.send(("error", traceback.format_exc()))
+    finally:
+        capture.release()
+        if ring:
+            ring.close()
+
+
+class CaptureProcess:
+    """
+    Runs the capture in a child process, out of reach of the GIL held by the other stages.
+
+    Frames are shared through a SharedFrameRing and announced over a pipe, so the
+    reader gets zero-copy views tagged with their sequence number. A dead child or
+    a capture error is raised as CaptureProcessError by the reading methods.
+    """
+
+    def __init__(self, source, profile, slots=FRAME_SLOTS, poll_interval=1.0, verbose=False):
+        """
+        :param source: capture source, see hue_play.capture.open_capture
+        :param profile: CaptureProfile
+        :param slots: frame buffers in the ring
+        :param poll_interval: seconds between two frames retrieved while idle
+        :param verbose: let the capture process print its settings
+        """
+        self.source = source
+        self.profile = profile
+        self.slots = slots
+        self.poll_interval = poll_interval
+        self.verbose = verbose
+        self.ring = None
+        # spawn: forking a process that already runs threads is not safe
+        self._context = multiprocessing.get_context("spawn")
+        self._connection = None
+        self._stop = None
+        self._idle = None
+        self._process = None
+
+    def start(self):
+        self._connection, child_connection = self._context.Pipe()
+        self._stop = self._context.Event()
+        self._idle = self._context.Event()
+        self._process = self._context.Process(
+            target=run_capture_process,
+            args=(
+                child_connection,
+                self._stop,
+                self._idle,
+                self.poll_interval,
+                self.source,
+                self.profile,
+                self.slots,
+                self.verbose,
+            ),
+            name="capture",
+            daemon=True,
+        )
+        self._process.start()
+        child_connection.close()
+
+    @property
+    def pid(self):
+        return self._process.pid if self._process is not None else None
+
+    def wait_ready(self):
+        """
+        Block until the capture device is open and the frame ring created.
+        :return: (width, height) of the frames
+        """
+        message = self._receive()
+        if message[0] != "size":
+            raise CaptureProcessError(f"Unexpected capture message {message[0]}")
+        _, width, height = message
+        self.ring = SharedFrameRing(width, height, self.slots)
+        self._connection.send(self.ring.name)
+        return width, height
+
+    def next_frame(self, timeout=None):
+        """
+        Frames announced while the caller was busy are skipped, only the newest one is returned.
+        :param timeout: max seconds to wait for a frame
+        :return: (seq, frame view, captured_at, grab seconds, retrieve seconds), None on timeout
+        :raise EOFError: at the end of the stream
+        """
+        if not self._connection.poll(timeout):
+            return None
+        message = self._receive()
+        while message[0] == "frame" and self._connection.poll(0):
+            message = self._receive()
+        if message[0] == "end":
+            raise EOFError("No more frames from Capture Device")
+        _, seq, captured_at, grab_seconds, retrieve_seconds = message
+        return seq, self.ring.frame(seq), captured_at, grab_seconds, retrieve_seconds
+
+    def set_idle(self, idle):
+        """
+        :param idle: True to only retrieve one frame per poll interval
+        """
+        if idle and not self._idle.is_set():
+            self._idle.set()
+        elif not idle and self._idle.is_set():
+            self._idle.clear()
+
+    def stop(self):
+        if self._process is None:
+            return
+        self._stop.set()
+        self._process.join(timeout=2)
+        if self._process.is_alive():
+            self._process.terminate()
+            self._process.join()
+        self._connection.close()
+        if self.ring:
+            self.ring.unlink()
+            self.ring.close()
+        self._process = None
+
+    def _receive(self):
+        try:
+            message = self._connection.recv()
+        except (EOFError, OSError):
+            self._process.join(timeout=1)
+            raise CaptureProcessError(f"Capture process died (exit code {self._process.exitcode})")
+        if message[0] == "error":
+            raise CaptureProcessError(message[1])
+        return message
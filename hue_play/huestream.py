@@ -0,0 +1,94 @@
+import struct
+
+import numpy as np
+
+PROTOCOL_NAME = b"HueStream"
+COLOR_SPACE_RGB = 0x00
+COLOR_SPACE_XY = 0x01
+DEVICE_TYPE_LIGHT = 0x00
+# v2 packets address at most 20 channels of one entertainment configuration
+MAX_V2_CHANNELS = 20
+
+# "HueStream", version major/minor, sequence id, 2 reserved, color space, 1 reserved
+_HEADER = struct.Struct(">9sBBBxxBx")
+# v2 appends the 36 characters entertainment configuration id to the v1 header
+_V2_CONFIGURATION = struct.Struct(">36s")
+_V1_RECORD = np.dtype([("type", "u1"), ("id", ">u2"), ("color", ">u2", (3,))])
+_V2_RECORD = np.dtype([("id", "u1"), ("color", ">u2", (3,))])
+
+
+class HueStreamEncoder:
+    """
+    Writes HueStream packets in place into one preallocated buffer.
+
+    Protocol v1 addresses lights by id, protocol v2 addresses the channels of an
+    entertainment configuration identified by its UUID. Colors are sent with full
+    16-bit precision. The header and the ids are written once at creation, each
+    `encode` only updates the sequence id and the colors, so steady-state encoding
+    does not allocate and the returned memoryview is always the same object.
+    """
+
+    def __init__(self, ids, version=1, entertainment_id=None, color_space=COLOR_SPACE_RGB):
+        """
+        :param ids: light ids (v1) or channel ids (v2), in the order colors are given to `encode`
+        :param version: HueStream protocol version, 1 or 2
+        :param entertainment_id: entertainment configuration UUID, required by v2
+        :param color_space: COLOR_SPACE_RGB or COLOR_SPACE_XY
+        """
+        if version == 1:
+            record = _V1_RECORD
+            header_size = _HEADER.size
+        elif version == 2:
+            if not entertainment_id or len(entertainment_id) != 36:
+                raise ValueError("HueStream v2 needs the 36 characters entertainment configuration id")
+            if len(ids) > MAX_V2_CHANNELS:
+                raise ValueError(f"HueStream v2 supports at most {MAX_V2_CHANNELS} channels per packet")
+            record = _V2_RECORD
+            header_size = _HEADER.size + _V2_CONFIGURATION.size
+        else:
+            raise ValueError(f"Unsupported HueStream version: {version}")
+
+        self.version = version
+        self.ids = list(ids)
+        self.sequence = 0
+        self.buffer = bytearray(header_size + record.itemsize * len(self.ids))
+        self.packet = memoryview(self.buffer)
+
+        _HEADER.pack_into(self.buffer, 0, PROTOCOL_NAME, version, 0, 0, color_space)
+        if version == 2:
+            _V2_CONFIGURATION.pack_into(self.buffer, _HEADER.size, entertainment_id.encode("ascii"))
+        self._records = np.frombuffer(self.buffer, dtype=record, offset=header_size)
+        if version == 1:
+            self._records["type"] = DEVICE_TYPE_LIGHT
+        self._records["id"] = self.ids
+        self._colors = self._records["color"]
+        self._scaled = np.empty((len(self.ids), 3), dtype=np.float32)
+
+    def encode(self, colors):
+        """
+        :param colors: array of shape (ids, 3), 8-bit range values in [0, 255]
+        :return: memoryview on the encoded packet, valid until the next call
+        """
+        # 255 * 257 == 65535: maps the 8-bit range on the full 16-bit range, keeping averaged fractions
+        np.multiply(colors, 257.0, out=self._scaled)
+        np.clip(self._scaled, 0, 0xFFFF, out=self._scaled)
+        return self.encode_16bit(self._scaled)
+
+    def encode_unit(self, values):
+        """
+        :param values: array of shape (ids, 3), values in [0, 1], e.g. x, y and brightness in COLOR_SPACE_XY
+        :return: memoryview on the encoded packet, valid until the next call
+        """
+        np.multiply(values, 65535.0, out=self._scaled)
+        np.clip(self._scaled, 0, 0xFFFF, out=self._scaled)
+        return self.encode_16bit(self._scaled)
+
+    def encode_16bit(self, colors):
+        """
+        :param colors: array of shape (ids, 3), values in [0, 65535]
+        :return: memoryview on the encoded packet, valid until the next call
+        """
+        self.sequence = (self.sequence + 1) & 0xFF
+        self.buffer[11] = self.sequence
+        np.copyto(self._colors, colors, casting="unsafe")
+        return self.packet
@@ -0,0 +1,85 @@
+import threading
+
+import numpy as np
+
+# zone colors kept: about 2 seconds of 60 fps frames, longer than any TV processing delay
+JITTER_FRAMES = 128
+
+
+class JitterBuffer:
+    """
+    Holds the zone colors of the last frames with their capture time, so senders release
+    them at capture time + `delay` instead of as soon as they are analysed.
+
+    Senders ask for the colors of the picture shown at a given time: the two frames
+    captured around time - `delay` are blended linearly, so the output follows the TV
+    whatever the capture and analysis jitter, and frames in between two sender ticks
+    are simply never released. When the newest frame is older than time - `delay` the
+    pipeline lags and the newest colors are held: the gap is reported as sync error,
+    unless the capture saw the picture did not change meanwhile (`hold`).
+    """
+
+    def __init__(self, delay, zones, capacity=JITTER_FRAMES):
+        """
+        :param delay: seconds between the capture of a frame and the output of its colors
+        :param zones: zones per frame
+        :param capacity: frames kept, the oldest are overwritten first
+        """
+        self.delay = delay
+        self.capacity = capacity
+        self._times = np.zeros(capacity, dtype=np.float64)
+        self._colors = np.zeros((capacity, zones, 3), dtype=np.float32)
+        self._count = 0
+        self._newest = -1
+        self._held_until = None
+        self._lock = threading.Lock()
+
+    def push(self, colors, captured_at):
+        """
+        :param colors: zone colors of a frame, copied
+        :param captured_at: time.monotonic() at which the frame was captured
+        """
+        with self._lock:
+            if self._count and captured_at <= self._times[self._newest]:
+                return  # out of order, e.g. an older frame analysed late
+            self._newest = (self._newest + 1) % self.capacity
+            self._times[self._newest] = captured_at
+            np.copyto(self._colors[self._newest], colors)
+            self._count = min(self._count + 1, self.capacity)
+
+    def hold(self, captured_at):
+        """
+        Record that the picture captured at `captured_at` still shows the newest colors (static frame).
+        """
+        self._held_until = captured_at
+
+    def colors_at(self, now, out):
+        """
+        :param now: time.monotonic() at which the colors are output
+        :param out: float32 array of shape (zones, 3) the colors are written to
+        :return: (out, sync error in seconds, positive when the colors lag the picture),
+                 (None, None) while no frame was captured `delay` ago yet
+        """
+        target = now - self.delay
+        with self._lock:
+            if not self._count:
+                return None, None
+            index = self._newest
+            newest_time = self._times[index]
+            if target >= newest_time:
+                np.copyto(out, self._colors[index])
+                if self._held_until is not None and self._held_until >= target:
+                    return out, 0.0  # static picture, the newest colors are the right ones
+                return out, target - newest_time
+            # newest first, the target is usually a few frames back
+            for _ in range(self._count - 1):
+                previous = (index - 1) % self.capacity
+                previous_time = self._times[previous]
+                if previous_time <= target:
+                    weight = (target - previous_time) / (self._times[index] - previous_time)
+                    np.subtract(self._colors[index], self._colors[previous], out=out)
+                    np.multiply(out, weight, out=out)
+                    np.add(out, self._colors[previous], out=out)
+                    return out, 0.0
+                index = previous
+            return None, None
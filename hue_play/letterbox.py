@@ -0,0 +1,101 @@
+import numpy as np
+
+# rows and columns sampled to find the picture: about 96x54 pixels picked on a regular lattice
+SAMPLE_SIZE = (96, 54)
+# brightest sample of a bar row or column, in 8-bit units (bars are rarely true black once encoded)
+BAR_LEVEL = 32
+# smallest change of the active area edges, in fraction of the frame size, worth recomputing the zones
+MIN_CHANGE = 0.02
+# detections in a row agreeing on a new active area before it replaces the current one
+CONFIRMATIONS = 3
+# largest fraction of the frame height (or width) a bar may cover, beyond that it is a dark scene
+MAX_BAR = 0.3
+
+
+class ActiveAreaDetector:
+    """
+    Finds the active picture of frames carrying letterbox (top/bottom) or pillarbox (left/right) bars.
+
+    Only meant to run at a low frequency, outside of the per frame path: each call samples
+    a few thousand pixels of the frame by plain striding and looks for the outermost rows and
+    columns brighter than `bar_level`. A new area is only reported once `confirmations`
+    detections in a row agree on it, and only if it moved by more than `min_change`,
+    so dark scenes and fades do not make the zones jump back and forth.
+    """
+
+    def __init__(
+        self,
+        frame_width,
+        frame_height,
+        bar_level=BAR_LEVEL,
+        min_change=MIN_CHANGE,
+        confirmations=CONFIRMATIONS,
+        max_bar=MAX_BAR,
+    ):
+        """
+        :param frame_width: width in pixels of the analysed frames
+        :param frame_height: height in pixels of the analysed frames
+        :param bar_level: brightest sample of a bar row or column, in 8-bit units
+        :param min_change: smallest edge move reported, in fraction of the frame size
+        :param confirmations: detections in a row agreeing on a new area before it is reported
+        :param max_bar: largest fraction of the frame a single bar may cover
+        """
+        self.frame_width = frame_width
+        self.frame_height = frame_height
+        self.bar_level = bar_level
+        self.confirmations = confirmations
+        self.max_bar = max_bar
+        self._step_y = max(1, frame_height // SAMPLE_SIZE[1])
+        self._step_x = max(1, frame_width // SAMPLE_SIZE[0])
+        self._tolerance = (min_change * frame_height, min_change * frame_width)
+        self.area = (0, frame_height, 0, frame_width)
+        self._candidate = None
+        self._candidate_count = 0
+
+    def detect(self, bgr_frame):
+        """
+        :param bgr_frame: frame as delivered by OpenCV
+        :return: new (top, bottom, left, right) active area in pixels once confirmed, None while unchanged
+        """
+        samples = bgr_frame[:: self._step_y, :: self._step_x]
+        # brightest channel of every sample, then of every sampled row and column
+        brightest = samples.max(axis=2) if samples.ndim == 3 else samples
+        rows = np.flatnonzero(brightest.max(axis=1) > self.bar_level)
+        columns = np.flatnonzero(brightest.max(axis=0) > self.bar_level)
+        if not len(rows) or not len(columns):
+            # black frame: nothing tells where the picture is, keep the current area
+            self._candidate = None
+            return None
+        candidate = (
+            self._edge(rows[0] * self._step_y, self.frame_height),
+            self.frame_height - self._edge(self.frame_height - (rows[-1] + 1) * self._step_y, self.frame_height),
+            self._edge(columns[0] * self._step_x, self.frame_width),
+            self.frame_width - self._edge(self.frame_width - (columns[-1] + 1) * self._step_x, self.frame_width),
+        )
+        if not self._moved(candidate, self.area):
+            self._candidate = None
+            return None
+        if self._candidate is not None and not self._moved(candidate, self._candidate):
+            self._candidate_count += 1
+        else:
+            self._candidate = candidate
+            self._candidate_count = 1
+        if self._candidate_count < self.confirmations:
+            return None
+        self.area = self._candidate
+        self._candidate = None
+        return self.area
+
+    def _edge(self, bar, size):
+        # a bar wider than max_bar is a dark part of the picture, not a bar
+        bar = max(0, int(bar))
+        return bar if bar <= self.max_bar * size else 0
+
+    def _moved(self, area, reference):
+        tolerance_y, tolerance_x = self._tolerance
+        return (
+            abs(area[0] - reference[0]) > tolerance_y
+            or abs(area[1] - reference[1]) > tolerance_y
+            or abs(area[2] - reference[2]) > tolerance_x
+            or abs(area[3] - reference[3]) > tolerance_x
+        )
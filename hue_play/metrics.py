@@ -0,0 +1,174 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+# pipeline stages in frame order, "latency" is the end to end time from frame grab to transport write,
+# "sync" the signed gap between the picture shown and the colors sent with an output delay (lag when positive)
+STAGES = ("grab", "retrieve", "zones", "convert", "encode", "write", "latency", "sync")
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class StageStats:
+    """
+    Rolling window of the last `window` durations of one stage, with their end times, and the count and
+    sum of every duration since the start. Written by every thread running the stage, e.g. one sender
+    per output, read by reporters.
+    """
+
+    __slots__ = ("count", "total", "durations", "ends", "_index", "_window", "_lock")
+
+    def __init__(self, window):
+        self.count = 0
+        self.total = 0.0
+        self.durations = np.zeros(window, dtype=np.float64)
+        self.ends = np.zeros(window, dtype=np.float64)
+        self._index = 0
+        self._window = window
+        self._lock = threading.Lock()
+
+    def add(self, duration, end):
+        with self._lock:
+            self.durations[self._index] = duration
+            self.ends[self._index] = end
+            self._index = (self._index + 1) % self._window
+            self.count += 1
+            self.total += duration
+
+    def recent(self, since):
+        """
+        :param since: end time, on the clock the stage is recorded with
+        :return: durations in seconds of the samples in the window ended after `since`
+        """
+        with self._lock:
+            filled = min(self.count, self._window)
+            return self.durations[:filled][self.ends[:filled] > since]
+
+    def summary(self):
+        with self._lock:
+            count = self.count
+            total = self.total
+            filled = min(count, self._window)
+            durations = self.durations[:filled].copy()
+            ends = self.ends[:filled].copy()
+        if not filled:
+            return {"count": 0, "sum": 0.0, "rate": 0.0, **{f"p{int(q * 100)}": 0.0 for q in QUANTILES}}
+        span = ends.max() - ends.min()
+        summary = {"count": count, "sum": total * 1000, "rate": (filled - 1) / span if span > 0 else 0.0}
+        for quantile, value in zip(QUANTILES, np.quantile(durations, QUANTILES)):
+            summary[f"p{int(quantile * 100)}"] = value * 1000
+        return summary
+
+
+class Metrics:
+    """
+    Per-stage timings of the hot path: rolling p50/p95/p99 durations and rates.
+
+    Stages time themselves with `now()` and `record()`. When disabled both return
+    right away without reading the clock, so instrumentation can stay in the hot
+    loops. Reports are served as Prometheus text on `/metrics` and/or logged as
+    one JSON line at a fixed interval.
+    """
+
+    def __init__(self, enabled=False, window=1024):
+        self.enabled = enabled
+        self.stages = {stage: StageStats(window) for stage in STAGES}
+
+    def now(self):
+        return time.perf_counter() if self.enabled else 0.0
+
+    def record(self, stage, started):
+        """
+        :param stage: one of STAGES
+        :param started: `now()` taken when the stage started
+        """
+        if not self.enabled:
+            return
+        end = time.perf_counter()
+        self.stages[stage].add(end - started, end)
+
+    def record_duration(self, stage, duration):
+        """
+        :param stage: one of STAGES
+        :param duration: seconds measured elsewhere, e.g. in the capture process
+        """
+        if not self.enabled:
+            return
+        self.stages[stage].add(duration, time.perf_counter())
+
+    def record_latency(self, captured_at):
+        """
+        :param captured_at: time.monotonic() at which the frame was grabbed
+        """
+        if not self.enabled:
+            return
+        now = time.monotonic()
+        self.stages["latency"].add(now - captured_at, now)
+
+    def snapshot(self):
+        return {stage: stats.summary() for stage, stats in self.stages.items()}
+
+    def prometheus_text(self):
+        lines = [
+            "# HELP hue_play_stage_duration_ms Stage duration over the rolling window",
+            "# TYPE hue_play_stage_duration_ms summary",
+        ]
+        snapshot = self.snapshot()
+        for stage, summary in snapshot.items():
+            for quantile in QUANTILES:
+                value = summary[f"p{int(quantile * 100)}"]
+                lines.append(f'hue_play_stage_duration_ms{{stage="{stage}",quantile="{quantile}"}} {value:.3f}')
+            lines.append(f'hue_play_stage_duration_ms_sum{{stage="{stage}"}} {summary["sum"]:.3f}')
+            lines.append(f'hue_play_stage_duration_ms_count{{stage="{stage}"}} {summary["count"]}')
+        lines += ["# HELP hue_play_stage_rate Stage events per second", "# TYPE hue_play_stage_rate gauge"]
+        for stage, summary in snapshot.items():
+            lines.append(f'hue_play_stage_rate{{stage="{stage}"}} {summary["rate"]:.2f}')
+        return "\n".join(lines) + "\n"
+
+    def json_line(self):
+        snapshot = self.snapshot()
+        for summary in snapshot.values():
+            for key, value in summary.items():
+                if isinstance(value, float):
+                    summary[key] = round(value, 3)
+        return json.dumps({"metrics": snapshot})
+
+    def serve(self, port, host="127.0.0.1"):
+        """
+        Serve `/metrics` in a background thread.
+        :return: the HTTP server, `shutdown()` it to stop
+        """
+        metrics = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.prometheus_text().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+        threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+        return server
+
+    def log_periodically(self, interval, log=print):
+        """
+        Log `json_line()` every `interval` seconds from a background thread.
+        """
+
+        def log_loop():
+            while True:
+                time.sleep(interval)
+                log(self.json_line())
+
+        threading.Thread(target=log_loop, name="metrics-log", daemon=True).start()
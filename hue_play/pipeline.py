@@ -0,0 +1,140 @@
+import threading
+import time
+
+
+class LatestSlot:
+    """
+    Single-slot "latest value" buffer shared between two pipeline stages.
+
+    The producer publishes values tagged with an increasing sequence number and the
+    capture timestamp of the frame they derive from, consumers block until a value
+    newer than the last one they handled shows up.
+    Nothing is ever queued: a value that was not consumed before the next publish
+    is simply dropped, so a slow stage always works on the freshest input.
+    """
+
+    def __init__(self, name=""):
+        self.name = name
+        self._condition = threading.Condition()
+        self._value = None
+        self._timestamp = None
+        self._seq = 0
+        self._closed = False
+        self._wakeups = 0
+
+    @property
+    def seq(self):
+        return self._seq
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def publish(self, value, timestamp=None):
+        """
+        Replace the slot content and wake up every waiting consumer.
+        :param value: new value, must not be mutated by the producer afterwards
+        :param timestamp: time.monotonic() at which the source frame was captured
+        :return: sequence number of the published value
+        """
+        with self._condition:
+            self._value = value
+            self._timestamp = timestamp
+            self._seq += 1
+            self._condition.notify_all()
+            return self._seq
+
+    def latest(self):
+        """
+        :return: (sequence number, value, timestamp) currently held, without waiting
+        """
+        with self._condition:
+            return self._seq, self._value, self._timestamp
+
+    def wait(self, last_seq=0, timeout=None, cancel=None):
+        """
+        Block until a value newer than `last_seq` is published, the slot is closed or woken up.
+        :param last_seq: sequence number of the last value handled by the caller
+        :param timeout: max seconds to wait, None to wait forever
+        :param cancel: optional threading.Event also ending the wait, set before calling `wake`:
+                       unlike the wakeup itself it is not missed by a consumer that was busy meanwhile
+        :return: (sequence number, value, timestamp), value is None on timeout, when closed, woken up or cancelled
+        """
+        with self._condition:
+            wakeups = self._wakeups
+            self._condition.wait_for(
+                lambda: self._seq != last_seq
+                or self._closed
+                or self._wakeups != wakeups
+                or (cancel is not None and cancel.is_set()),
+                timeout,
+            )
+            if self._seq == last_seq:
+                return last_seq, None, None
+            return self._seq, self._value, self._timestamp
+
+    def wake(self):
+        """
+        Release every consumer blocked in `wait` once, without closing the slot: used to stop
+        the consumers of a slot that stays in use, e.g. the analysis while the capture goes on.
+        Only the consumers waiting right now are released, set their `cancel` event first.
+        """
+        with self._condition:
+            self._wakeups += 1
+            self._condition.notify_all()
+
+    def close(self):
+        """
+        Release every consumer blocked in `wait`, used on shutdown.
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+
+class Readiness:
+    """
+    Startup milestones signalled by the stages themselves instead of fixed sleeps.
+
+    Each milestone is an event set once, timestamped relative to the creation of
+    this object, so the startup timeline ("time to first packet") can be reported.
+    """
+
+    MILESTONES = ("video_size", "first_frame", "first_zones", "transport_connected", "first_packet")
+
+    def __init__(self, started=None):
+        self.started = started or time.monotonic()
+        self.times = {}
+        self.cancelled = False
+        self._events = {name: threading.Event() for name in self.MILESTONES}
+
+    def set(self, name):
+        """
+        :return: True the first time the milestone is reached
+        """
+        event = self._events[name]
+        if event.is_set():
+            return False
+        self.times[name] = time.monotonic() - self.started
+        event.set()
+        return True
+
+    def is_set(self, name):
+        return self._events[name].is_set()
+
+    def wait(self, name, timeout=None):
+        """
+        :return: True once the milestone is reached, False on timeout or when startup was cancelled
+        """
+        return self._events[name].wait(timeout) and not self.cancelled
+
+    def cancel(self):
+        """
+        Release every waiter, used when the pipeline stops before being ready.
+        """
+        self.cancelled = True
+        for event in self._events.values():
+            event.set()
+
+    def summary(self):
+        return ", ".join(f"{name}: {self.times[name] * 1000:.0f} ms" for name in self.MILESTONES if name in self.times)
@@ -0,0 +1,159 @@
+import os
+import time
+
+import numpy as np
+
+# (frame skip, sample step, send rate scale) from the best quality to the cheapest:
+# analyse one frame out of `frame skip`, one pixel out of `sample step` in each direction,
+# and send at `send rate scale` times the output rate
+QUALITY_LEVELS = (
+    (1, 1, 1.0),
+    (1, 2, 1.0),
+    (1, 4, 1.0),
+    (2, 4, 1.0),
+    (2, 4, 0.5),
+    (3, 8, 0.5),
+    (4, 8, 0.25),
+)
+# seconds between two decisions, long enough for the stage timings of a level to show
+QUALITY_INTERVAL = 2.0
+# a better level is only tried below this fraction of both budgets
+HEADROOM = 0.7
+# decisions in a row with headroom before trying a better level, doubled each time that level goes over budget
+UPGRADE_CHECKS = 3
+MAX_UPGRADE_CHECKS = 48
+
+
+def process_cpu_seconds(pid):
+    """
+    :return: user + system CPU seconds of a process (Linux only), None when unknown
+    """
+    try:
+        with open(f"/proc/{pid}/stat") as stat_file:
+            fields = stat_file.read().rsplit(")", 1)[1].split()
+    except OSError:
+        return None
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+class QualityController:
+    """
+    Keeps the engine inside a CPU and latency budget by moving along QUALITY_LEVELS.
+
+    Every `interval` the CPU load of the engine process (and of its capture process, if
+    any) and the p95 end to end latency of the frames sent meanwhile are compared with
+    the budgets: over any of them the next cheaper level is applied right away, while a
+    better level is only tried after UPGRADE_CHECKS decisions in a row well below both.
+    A level that went over budget waits twice as long before it is tried again, so the
+    engine settles on the best level the box sustains, and steps down on its own when
+    the CPU slows down, e.g. thermal throttling. Every level change is logged with its reason.
+    """
+
+    def __init__(
+        self, engine, cpu_budget, latency_budget, interval=QUALITY_INTERVAL, levels=QUALITY_LEVELS, log=print
+    ):
+        """
+        :param engine: HuePlayEngine tuned, its metrics must be enabled
+        :param cpu_budget: percent of the whole machine (100: every core busy) the engine may use
+        :param latency_budget: p95 seconds from frame grab to light packet, output delay excluded
+        :param interval: seconds between two decisions
+        :param levels: (frame skip, sample step, send rate scale) from the best quality to the cheapest
+        :param log: callable every decision is reported to
+        """
+        self.engine = engine
+        self.cpu_budget = cpu_budget
+        self.latency_budget = latency_budget
+        self.interval = interval
+        self.levels = levels
+        self.log = log
+        self.level = 0
+        self._cpu_count = os.cpu_count() or 1
+        self._upgrade_checks = [UPGRADE_CHECKS] * len(levels)
+        self._headroom_count = 0
+        self._floor_logged = False
+        self._last_time = None
+        self._last_cpu = None
+
+    def run(self):
+        """
+        Decide every `interval` until the engine outputs stop.
+        """
+        outputs_stopped = self.engine.outputs_stopped
+        self.engine.set_quality(*self.levels[self.level])
+        self.measure()
+        while not outputs_stopped.wait(self.interval):
+            cpu, latency = self.measure()
+            self.decide(cpu, latency)
+
+    def cpu_seconds(self):
+        # all threads of this process, plus the capture process which does the decoding with -pc
+        seconds = time.process_time()
+        capture_process = self.engine.capture_process
+        if capture_process is not None and capture_process.pid is not None:
+            seconds += process_cpu_seconds(capture_process.pid) or 0.0
+        return seconds
+
+    def measure(self):
+        """
+        :return: (percent of the machine used since the last call, p95 latency in seconds of the
+                 packets sent since the last call or None when none was)
+        """
+        # the latency stage is timed on the monotonic clock
+        now = time.monotonic()
+        cpu_seconds = self.cpu_seconds()
+        cpu = None
+        if self._last_time is not None and now > self._last_time:
+            cpu = 100 * (cpu_seconds - self._last_cpu) / (now - self._last_time) / self._cpu_count
+        latencies = self.engine.metrics.stages["latency"].recent(self._last_time or 0.0)
+        latency = None
+        if len(latencies):
+            # the output delay is a wanted latency, only the pipeline part counts
+            latency = max(0.0, float(np.quantile(latencies, 0.95)) - self.engine.config.output_delay)
+        self._last_time = now
+        self._last_cpu = cpu_seconds
+        return cpu, latency
+
+    def decide(self, cpu, latency):
+        """
+        Apply the level fitting the last measures.
+        :param cpu: percent of the machine used, None when unknown
+        :param latency: p95 latency in seconds, None when no packet was sent (static or idle picture)
+        """
+        measures = (
+            f"CPU {_format(cpu, '{:.0f}%')} (budget {self.cpu_budget:g}%), "
+            f"p95 latency {_format(latency, '{:.0f} ms', 1000)} (budget {self.latency_budget * 1000:.0f} ms)"
+        )
+        if (cpu is not None and cpu > self.cpu_budget) or (latency is not None and latency > self.latency_budget):
+            self._headroom_count = 0
+            # this level does not hold on this box (or not anymore): try it again less often
+            self._upgrade_checks[self.level] = min(MAX_UPGRADE_CHECKS, self._upgrade_checks[self.level] * 2)
+            if self.level + 1 < len(self.levels):
+                self._apply(self.level + 1, "over budget", measures)
+            elif not self._floor_logged:
+                self.log(f"Quality: over budget at the cheapest level {self.level}, keeping it ({measures})")
+                self._floor_logged = True
+            return
+        self._floor_logged = False
+        has_headroom = (cpu is None or cpu < HEADROOM * self.cpu_budget) and (
+            latency is None or latency < HEADROOM * self.latency_budget
+        )
+        if not has_headroom or self.level == 0:
+            self._headroom_count = 0
+            return
+        self._headroom_count += 1
+        if self._headroom_count >= self._upgrade_checks[self.level - 1]:
+            self._headroom_count = 0
+            self._apply(self.level - 1, "headroom", measures)
+
+    def _apply(self, level, reason, measures):
+        frame_skip, sample_step, rate_scale = self.levels[level]
+        self.log(
+            f"Quality: level {self.level} -> {level} ({reason}: {measures}), analysing 1/{frame_skip} frames "
+            f"at 1/{sample_step} resolution, sending at {rate_scale:g}x the output rate"
+        )
+        self.level = level
+        self.engine.set_quality(frame_skip, sample_step, rate_scale)
+
+
+def _format(value, pattern, scale=1):
+    return "n/a" if value is None else pattern.format(value * scale)
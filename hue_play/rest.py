@@ -0,0 +1,144 @@
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Bridge guidance: about 10 light commands/s and 1 group command/s before commands get queued and dropped
+LIGHT_COMMANDS_PER_SECOND = 10
+GROUP_COMMANDS_PER_SECOND = 1
+
+
+class TokenBucket:
+    """
+    Token bucket rate limiter: `rate` tokens per second, at most `burst` saved up.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst or rate
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self):
+        """
+        :return: True if a token was taken, never waits
+        """
+        with self._lock:
+            self._refill()
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+    def delay(self):
+        """
+        :return: seconds until the next token is available
+        """
+        with self._lock:
+            self._refill()
+            return max(0.0, (1 - self._tokens) / self.rate)
+
+
+class RestLightSender:
+    """
+    Sends light states through the bridge REST API within the bridge rate limits.
+
+    Requests go through one keep-alive `requests.Session`. `send` only ever pushes
+    the newest state of each light: states equal to the last one sent are skipped,
+    lights waiting for a token are served first on the next call, and lights sharing
+    a state are updated with one group action when a bridge group holds exactly them.
+    """
+
+    def __init__(
+        self,
+        base_url,
+        groups=None,
+        light_rate=LIGHT_COMMANDS_PER_SECOND,
+        group_rate=GROUP_COMMANDS_PER_SECOND,
+        timeout=1.0,
+        log=None,
+    ):
+        """
+        :param base_url: bridge user url, http://<bridge ip>/api/<user name>
+        :param groups: {group_id: light ids} of the bridge groups usable for batched updates
+        :param light_rate: light commands per second
+        :param group_rate: group commands per second
+        :param timeout: seconds before a request is abandoned
+        :param log: optional callable used to report failed requests
+        """
+        self.base_url = base_url
+        self.set_groups(groups or {})
+        self.light_bucket = TokenBucket(light_rate)
+        self.group_bucket = TokenBucket(group_rate)
+        self.timeout = timeout
+        self.log = log or (lambda *args: None)
+        self.session = requests.Session()
+        self.session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=4))
+        self.sent_count = 0
+        self._sent_states = {}
+        self._sent_times = {}
+
+    def set_groups(self, groups):
+        """
+        :param groups: {group_id: light ids} of the bridge groups usable for batched updates
+        """
+        self.groups = {frozenset(light_ids): group_id for group_id, light_ids in groups.items() if light_ids}
+
+    def send(self, states):
+        """
+        Push the states that changed since they were last sent, as far as the rate limits allow.
+        :param states: {light_id: state dict}, newest wanted state of each light, values must be hashable
+        :return: True if changed states are left unsent, call again after `retry_delay()`
+        """
+        changed = {}
+        for light_id, state in states.items():
+            if self._sent_states.get(light_id) != state:
+                changed.setdefault(tuple(sorted(state.items())), []).append(light_id)
+
+        pending = False
+        for state_key, light_ids in changed.items():
+            group_id = self.groups.get(frozenset(light_ids)) if len(light_ids) > 1 else None
+            if group_id is not None and self.group_bucket.try_acquire():
+                self._put(f"{self.base_url}/groups/{group_id}/action", dict(state_key), light_ids)
+                continue
+            # least recently updated lights first, so no light starves under the rate limit
+            for light_id in sorted(light_ids, key=lambda light: self._sent_times.get(light, 0)):
+                if not self.light_bucket.try_acquire():
+                    pending = True
+                    break
+                self._put(f"{self.base_url}/lights/{light_id}/state", dict(state_key), [light_id])
+        return pending
+
+    def reset(self):
+        """
+        Forget the states sent so far, e.g. after the lights were switched off: every state is sent again.
+        """
+        self._sent_states = {}
+
+    def retry_delay(self):
+        return self.light_bucket.delay()
+
+    def close(self):
+        self.session.close()
+
+    def _put(self, url, state, light_ids):
+        try:
+            response = self.session.put(url, json=state, timeout=self.timeout)
+            if response.status_code >= 300:
+                self.log(f"Error on set state {state} on {url}: {response.status_code}")
+                return
+        except requests.RequestException as e:
+            self.log(f"Error on set state {state} on {url}: {e}")
+            return
+        now = time.monotonic()
+        self.sent_count += 1
+        for light_id in light_ids:
+            self._sent_states[light_id] = state
+            self._sent_times[light_id] = now
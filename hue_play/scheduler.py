@@ -0,0 +1,90 @@
+import time
+
+import numpy as np
+
+
+class SendScheduler:
+    """
+    Paces a sender on the monotonic clock and decides which frames are worth sending.
+
+    Ticks are laid on a fixed grid of deadlines (`period` apart), so encode time or
+    lock contention never make the rate drift; a tick missed by more than one period
+    restarts the grid instead of bursting to catch up. Frames whose colors moved less
+    than `change_threshold` since the last sent one are skipped, and the last packet
+    is repeated every `keepalive_interval` so the bridge keeps the session open.
+    """
+
+    def __init__(self, rate=50, change_threshold=2.0, keepalive_interval=1.0):
+        """
+        :param rate: target packets per second
+        :param change_threshold: smallest channel change, in 8-bit units, that triggers a send
+        :param keepalive_interval: max seconds between two packets on a static picture
+        """
+        self.rate = rate
+        self.period = 1.0 / rate
+        self.change_threshold = change_threshold
+        self.keepalive_interval = keepalive_interval
+        self.last_sent_time = None
+        self._deadline = None
+        self._last_colors = None
+        self._difference = None
+
+    def set_rate(self, rate):
+        """
+        Change the packet rate, from the next tick on.
+        """
+        self.rate = rate
+        self.period = 1.0 / rate
+
+    def wait_tick(self):
+        """
+        Sleep until the next deadline.
+        :return: lateness in seconds of this tick (0 when on time)
+        """
+        now = time.monotonic()
+        if self._deadline is None:
+            self._deadline = now
+        delay = self._deadline - now
+        if delay > 0:
+            time.sleep(delay)
+            lateness = 0.0
+        else:
+            lateness = -delay
+            if lateness > self.period:
+                self._deadline = now
+        self._deadline += self.period
+        return lateness
+
+    def keepalive_timeout(self):
+        """
+        :return: seconds left before a keepalive is due
+        """
+        if self.last_sent_time is None:
+            return self.keepalive_interval
+        return max(0.0, self.last_sent_time + self.keepalive_interval - time.monotonic())
+
+    def keepalive_due(self):
+        return self.last_sent_time is not None and self.keepalive_timeout() == 0.0
+
+    def has_changed(self, colors):
+        """
+        :param colors: zone colors array, 8-bit range
+        :return: True if any channel moved at least `change_threshold` since the last sent colors
+        """
+        if self._last_colors is None or self._last_colors.shape != colors.shape:
+            return True
+        np.subtract(colors, self._last_colors, out=self._difference)
+        np.abs(self._difference, out=self._difference)
+        return bool(self._difference.max() >= self.change_threshold)
+
+    def mark_sent(self, colors=None):
+        """
+        Record a sent packet, `colors` is omitted for keepalives which repeat the last colors.
+        """
+        self.last_sent_time = time.monotonic()
+        if colors is not None:
+            if self._last_colors is None or self._last_colors.shape != colors.shape:
+                self._last_colors = np.array(colors, dtype=np.float32)
+                self._difference = np.empty_like(self._last_colors)
+            else:
+                np.copyto(self._last_colors, colors)
@@ -0,0 +1,178 @@
+import json
+import multiprocessing
+import os
+import struct
+import time
+
+import cv2
+import numpy as np
+
+from hue_play.zones import MEAN, ZoneAverager
+
+TRACK_MAGIC = b"HUETRACK"
+TRACK_VERSION = 1
+# magic, version, header length; the JSON header follows, then the colors from the next aligned offset
+_PREAMBLE = struct.Struct("<8sII")
+_ALIGNMENT = 64
+# frames analysed by a worker in one go: long enough to amortize the seek, short enough to balance the pool
+CHUNK_FRAMES = 600
+
+
+class LightTrack:
+    """
+    Zone colors of every frame of a video, analysed ahead of time.
+
+    The file holds a small JSON header (frame rate, zone ids, video size) and the
+    float32 zone colors of each frame as one (frames, zones, 3) array, the same
+    values ZoneAverager would publish live. The colors are memory mapped: opening a
+    track reads nothing, playback only touches the pages of the frames it sends.
+    """
+
+    def __init__(self, path, header, colors):
+        self.path = path
+        self.header = header
+        # (frames, zones, 3) RGB means in [0, 255]
+        self.colors = colors
+
+    @property
+    def fps(self):
+        return self.header["fps"]
+
+    @property
+    def zones(self):
+        return self.header["zones"]
+
+    @property
+    def frame_count(self):
+        return len(self.colors)
+
+    @property
+    def duration(self):
+        return self.frame_count / self.fps
+
+    def frame_at(self, seconds):
+        """
+        :param seconds: position in the track
+        :return: index of the frame shown at that time, None past the end
+        """
+        index = int(seconds * self.fps)
+        return index if index < self.frame_count else None
+
+    @classmethod
+    def create(cls, path, fps, zones, frame_count, width, height):
+        """
+        Write the header and size the file, the colors are then filled in place, e.g. by the analysis workers.
+        :param zones: id of every zone, in zone colors order
+        """
+        header = {"fps": fps, "zones": [str(zone) for zone in zones], "width": width, "height": height}
+        offset = _write_header(path, header, frame_count * len(zones) * 3 * 4)
+        colors = np.memmap(path, dtype=np.float32, mode="r+", offset=offset, shape=(frame_count, len(zones), 3))
+        return cls(path, header, colors)
+
+    @classmethod
+    def open(cls, path, mode="r"):
+        """
+        :raise ValueError: not a light track, or a track of another version
+        """
+        with open(path, "rb") as track_file:
+            preamble = track_file.read(_PREAMBLE.size)
+            if len(preamble) != _PREAMBLE.size:
+                raise ValueError(f"{path} is not a light track")
+            magic, version, header_size = _PREAMBLE.unpack(preamble)
+            if magic != TRACK_MAGIC or version != TRACK_VERSION:
+                raise ValueError(f"{path} is not a light track of version {TRACK_VERSION}")
+            header = json.loads(track_file.read(header_size))
+        offset = _colors_offset(header_size)
+        zones = len(header["zones"])
+        frame_count = (os.path.getsize(path) - offset) // (zones * 3 * 4)
+        colors = np.memmap(path, dtype=np.float32, mode=mode, offset=offset, shape=(frame_count, zones, 3))
+        return cls(path, header, colors)
+
+
+def _colors_offset(header_size):
+    return -(-(_PREAMBLE.size + header_size) // _ALIGNMENT) * _ALIGNMENT
+
+
+def _write_header(path, header, colors_size):
+    encoded = json.dumps(header).encode()
+    offset = _colors_offset(len(encoded))
+    with open(path, "wb") as track_file:
+        track_file.write(_PREAMBLE.pack(TRACK_MAGIC, TRACK_VERSION, len(encoded)))
+        track_file.write(encoded)
+        track_file.truncate(offset + colors_size)
+    return offset
+
+
+def video_properties(path):
+    """
+    :return: (width, height, fps, frame count) of a video file
+    """
+    video = cv2.VideoCapture(path)
+    try:
+        if not video.isOpened():
+            raise ValueError(f"Unable to open video {path}")
+        return (
+            int(video.get(cv2.CAP_PROP_FRAME_WIDTH)),
+            int(video.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+            video.get(cv2.CAP_PROP_FPS) or 25.0,
+            int(video.get(cv2.CAP_PROP_FRAME_COUNT)),
+        )
+    finally:
+        video.release()
+
+
+def analyse_video(
+    video_path, track_path, zones, bounds, processes=None, chunk_frames=CHUNK_FRAMES, statistic=MEAN, log=None
+):
+    """
+    Build the light track of a video file: the video is split in chunks of frames decoded and
+    averaged by a pool of processes, each writing its zone colors straight into the track file.
+    :param zones: id of every zone, in zone colors order
+    :param bounds: one [top, bottom, left, right] pixel box per zone, as given to ZoneAverager
+    :param processes: pool size, every CPU by default
+    :param statistic: color of each zone, one of hue_play.zones.ZONE_STATISTICS
+    :param log: optional callable used to report the progress
+    :return: the LightTrack, opened read only
+    """
+    log = log or (lambda *args: None)
+    width, height, fps, frame_count = video_properties(video_path)
+    if frame_count <= 0:
+        raise ValueError(f"Unknown frame count for {video_path}, the video cannot be split in chunks")
+    LightTrack.create(track_path, fps, zones, frame_count, width, height).colors.flush()
+    chunks = [(start, min(chunk_frames, frame_count - start)) for start in range(0, frame_count, chunk_frames)]
+    started = time.monotonic()
+    analysed = 0
+    # spawn: the caller may already run threads
+    with multiprocessing.get_context("spawn").Pool(processes) as pool:
+        jobs = [(video_path, track_path, bounds, statistic, start, count) for start, count in chunks]
+        for index, count in enumerate(pool.imap_unordered(_analyse_chunk, jobs)):
+            analysed += count
+            log(f"Light track: {index + 1}/{len(chunks)} chunks, {analysed} frames")
+    elapsed = time.monotonic() - started
+    log(f"Light track: {analysed} frames in {elapsed:.1f}s, {frame_count / fps / max(elapsed, 1e-6):.1f}x real time")
+    return LightTrack.open(track_path)
+
+
+def _analyse_chunk(job):
+    video_path, track_path, bounds, statistic, start, count = job
+    track = LightTrack.open(track_path, mode="r+")
+    video = cv2.VideoCapture(video_path)
+    try:
+        video.set(cv2.CAP_PROP_POS_FRAMES, start)
+        width = int(video.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(video.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        averager = ZoneAverager(width, height, bounds, statistic=statistic)
+        frame = None
+        analysed = 0
+        for index in range(start, start + count):
+            ok, frame = video.read(frame)
+            if not ok:
+                break
+            track.colors[index] = averager.compute(frame)
+            analysed += 1
+        # frames the decoder could not deliver stay black
+        track.colors[start + analysed : start + count] = 0
+        track.colors.flush()
+        return analysed
+    finally:
+        video.release()
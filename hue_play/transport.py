@@ -0,0 +1,211 @@
+import os
+import subprocess
+import threading
+import time
+
+ENTERTAINMENT_PORT = 2100
+PSK_CIPHER = "PSK-AES128-GCM-SHA256"
+# printed by `openssl s_client` once the handshake is over, followed by "(NONE)" when it failed
+HANDSHAKE_DONE_MARKER = b"Cipher is "
+HANDSHAKE_FAILED_MARKER = b"Cipher is (NONE)"
+# seconds s_client is given to close the session cleanly before being terminated, it takes about 0.5 s
+CLOSE_NOTIFY_TIMEOUT = 2.0
+
+
+class DtlsTransport:
+    """
+    Owns the DTLS session to the bridge Entertainment API.
+
+    The session is run by an `openssl s_client` child over binary pipes. Its stdout
+    and stderr are drained by background threads, so they can never fill up and
+    stall the stream, and reaching EOF on them tells us the session died. A
+    supervisor thread then re-handshakes in the background while `send` drops
+    packets, so streaming resumes without touching the rest of the application.
+    """
+
+    def __init__(
+        self,
+        host,
+        psk_identity,
+        psk,
+        port=ENTERTAINMENT_PORT,
+        handshake_timeout=2.0,
+        retry_delay=0.1,
+        on_connected=None,
+        log=None,
+    ):
+        """
+        :param host: bridge ip address (or a local stand-in for tests)
+        :param psk_identity: PSK identity, the bridge user name
+        :param psk: PSK as an hex string, the bridge client key
+        :param port: DTLS port
+        :param handshake_timeout: seconds before a pending handshake is abandoned and retried
+        :param retry_delay: seconds to wait before the first reconnection attempt, doubled up to 2s on failures
+        :param on_connected: optional callable run after each successful handshake
+        :param log: optional callable used to report session events
+        """
+        self.host = host
+        self.port = port
+        self.psk_identity = psk_identity
+        self.psk = psk
+        self.handshake_timeout = handshake_timeout
+        self.retry_delay = retry_delay
+        self.on_connected = on_connected
+        self.log = log or (lambda *args: None)
+        self.connected = threading.Event()
+        self.reconnections = 0
+        self._dead = threading.Event()
+        self._closed = False
+        self._proc = None
+        self._proc_lock = threading.Lock()
+        self._supervisor = None
+
+    def command(self):
+        return [
+            "openssl",
+            "s_client",
+            "-dtls1_2",
+            "-cipher",
+            PSK_CIPHER,
+            "-psk_identity",
+            self.psk_identity,
+            "-psk",
+            self.psk,
+            "-connect",
+            f"{self.host}:{self.port}",
+        ]
+
+    def start(self):
+        """
+        Start the session supervisor, the first handshake runs in the background.
+        Use `connected.wait()` to block until packets can be sent.
+        """
+        self._dead.set()
+        self._supervisor = threading.Thread(target=self._supervise, name="dtls-supervisor", daemon=True)
+        self._supervisor.start()
+
+    def send(self, packet):
+        """
+        Write one packet to the session, never blocks on a dead or pending session.
+        :param packet: bytes-like HueStream packet
+        :return: True if the packet was handed to the session, False if it was dropped
+        """
+        if not self.connected.is_set():
+            return False
+        proc = self._proc
+        try:
+            if proc.poll() is not None:
+                raise BrokenPipeError
+            proc.stdin.write(packet)
+            proc.stdin.flush()
+            return True
+        except (OSError, ValueError):
+            self._session_lost(proc, "write failed")
+            return False
+
+    def close(self):
+        self._closed = True
+        self.connected.clear()
+        self._dead.set()
+        self._stop_process(self._proc)
+        if self._supervisor:
+            self._supervisor.join(timeout=self.handshake_timeout)
+
+    def _supervise(self):
+        delay = self.retry_delay
+        first = True
+        while not self._closed:
+            self._dead.wait()
+            if self._closed:
+                break
+            if not first:
+                time.sleep(delay)
+                self.reconnections += 1
+            first = False
+            if self._handshake():
+                delay = self.retry_delay
+            else:
+                delay = min(delay * 2, 2.0)
+
+    def _handshake(self):
+        self._dead.clear()
+        handshake = threading.Event()
+        command = self.command()
+        # the PSK is the bridge client key: it never goes to the logs
+        shown = ["<psk>" if argument == self.psk else argument for argument in command]
+        self.log(f'Opening DTLS session: {" ".join(shown)}')
+        proc = subprocess.Popen(
+            command,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            bufsize=0,
+        )
+        with self._proc_lock:
+            self._proc = proc
+        threading.Thread(target=self._drain, args=(proc, proc.stdout, handshake), daemon=True).start()
+        threading.Thread(target=self._drain, args=(proc, proc.stderr, None), daemon=True).start()
+
+        if not handshake.wait(self.handshake_timeout) or self._dead.is_set():
+            self._session_lost(proc, "handshake failed")
+            return False
+        self.log("DTLS session connected")
+        self.connected.set()
+        if self.on_connected:
+            self.on_connected()
+        return True
+
+    def _drain(self, proc, pipe, handshake):
+        # keeps the pipe empty and watches for the session end (EOF)
+        tail = b""
+        while True:
+            try:
+                chunk = os.read(pipe.fileno(), 4096)
+            except OSError:
+                chunk = b""
+            if not chunk:
+                break
+            if handshake is not None and not handshake.is_set():
+                tail = (tail + chunk)[-4096:]
+                if HANDSHAKE_FAILED_MARKER in tail:
+                    break
+                if HANDSHAKE_DONE_MARKER in tail:
+                    handshake.set()
+        if handshake is not None:
+            self._session_lost(proc, "session closed")
+            handshake.set()
+
+    def _session_lost(self, proc, reason):
+        with self._proc_lock:
+            if proc is not self._proc or self._dead.is_set():
+                return
+            self.connected.clear()
+            self._dead.set()
+        if not self._closed:
+            self.log(f"DTLS session lost ({reason}), reconnecting...")
+        self._stop_process(proc)
+
+    @staticmethod
+    def _stop_process(proc):
+        if proc is None or proc.poll() is not None:
+            return
+        try:
+            proc.stdin.close()
+        except OSError:
+            pass
+        # on stdin EOF s_client sends a close_notify, so the bridge frees the session right away instead
+        # of waiting for it to time out: it is given some time to do so without holding the caller
+        threading.Thread(target=DtlsTransport._reap_process, args=(proc,), name="dtls-close", daemon=True).start()
+
+    @staticmethod
+    def _reap_process(proc):
+        try:
+            proc.wait(timeout=CLOSE_NOTIFY_TIMEOUT)
+            return
+        except subprocess.TimeoutExpired:
+            pass
+        proc.terminate()
+        try:
+            proc.wait(timeout=1)
+        except subprocess.TimeoutExpired:
+            proc.kill()
@@ -0,0 +1,313 @@
+import cv2
+import numpy as np
+
+# Width in cells of the reduced grid zones are averaged on, height follows the video aspect ratio
+GRID_WIDTH = 64
+# zone colors arrays handed out in turn: a published result stays untouched for the next OUTPUT_BUFFERS - 1 frames
+OUTPUT_BUFFERS = 4
+# color of a zone: mean of its cells, mean of its most common coarse color, or mean weighted by saturation
+MEAN = "mean"
+DOMINANT = "dominant"
+SATURATION = "saturation"
+ZONE_STATISTICS = (MEAN, DOMINANT, SATURATION)
+# bits kept per channel by the dominant color histogram: 8 levels per channel, 512 coarse colors
+HISTOGRAM_BITS = 3
+# cost of an INTER_AREA reduction per pixel read, relative to cv2.mean: with zones covering less
+# than AREA_COST times the pixels of the grid, the zones are read one by one instead
+AREA_COST = 3
+
+
+class ZoneAverager:
+    """
+    Computes the color of every light zone of a frame, reading each pixel of the zones at most once.
+
+    A few zones are read one by one: `cv2.mean` of each zone box, or for the DOMINANT and
+    SATURATION statistics an INTER_AREA reduction of each zone box straight to its cells.
+    Many overlapping zones are cheaper on a shared grid: the bounding box of the zones is
+    reduced with INTER_AREA (a true box filter) to a small grid, then a summed-area table
+    of that grid gives each zone sum with four lookups, whatever the number of zones.
+    The cheaper of both is picked from the pixels each one reads whenever the zones change.
+    The DOMINANT and SATURATION statistics work on the zone cells either way: one `bincount`
+    per channel over all zones gives either each zone coarse color histogram or its saturation
+    weighted sums, still without any per zone loop.
+    With a `sample_step` the bounding box of the zones is first picked one pixel out of
+    `sample_step` in each direction (INTER_NEAREST reads no other pixel), dividing the cost
+    of the grid by about sample_step (every picked row is still loaded from memory), which soon
+    makes it the cheaper one.
+    Every array of the steady state is allocated up front, `compute` only writes into them,
+    but for the few bincount results of DOMINANT and SATURATION, sized by the zones.
+    """
+
+    def __init__(self, frame_width, frame_height, bounds, grid_width=GRID_WIDTH, sample_step=1, statistic=MEAN):
+        """
+        :param frame_width: width in pixels of the analysed frames
+        :param frame_height: height in pixels of the analysed frames
+        :param bounds: one [top, bottom, left, right] pixel box per zone
+        :param grid_width: width of the reduced grid, capped to the frame width
+        :param sample_step: analyse one pixel out of `sample_step` in each direction, see `set_sample_step`
+        :param statistic: one of ZONE_STATISTICS, can be changed at any time
+        """
+        if statistic not in ZONE_STATISTICS:
+            raise ValueError(f"Unknown zone statistic {statistic}, one of: {', '.join(ZONE_STATISTICS)}")
+        self.statistic = statistic
+        self.frame_width = frame_width
+        self.frame_height = frame_height
+        self.grid_width = min(grid_width, frame_width)
+        self.grid_height = max(1, min(frame_height, round(self.grid_width * frame_height / frame_width)))
+        self._grid = np.empty((self.grid_height, self.grid_width, 3), dtype=np.uint8)
+        self._integral = np.empty((self.grid_height + 1, self.grid_width + 1, 3), dtype=np.int32)
+        self._output_index = 0
+        self.set_bounds(bounds)
+        self.set_sample_step(sample_step)
+
+    def set_bounds(self, bounds):
+        """
+        Map zone pixel boxes on the grid, a zone always covers at least one cell.
+        The new geometry replaces the previous one in a single assignment: another thread may call
+        this while `compute` runs, a frame is always averaged with either the old or the new zones.
+        :param bounds: one [top, bottom, left, right] pixel box per zone
+        """
+        boxes = np.asarray(bounds, dtype=np.float64).reshape(-1, 4)
+        y_scale = self.grid_height / self.frame_height
+        x_scale = self.grid_width / self.frame_width
+        top = np.clip(np.floor(boxes[:, 0] * y_scale), 0, self.grid_height - 1).astype(np.intp)
+        bottom = np.clip(np.ceil(boxes[:, 1] * y_scale), top + 1, self.grid_height).astype(np.intp)
+        left = np.clip(np.floor(boxes[:, 2] * x_scale), 0, self.grid_width - 1).astype(np.intp)
+        right = np.clip(np.ceil(boxes[:, 3] * x_scale), left + 1, self.grid_width).astype(np.intp)
+        areas = ((bottom - top) * (right - left)).astype(np.float32)[:, None]
+        # flat integral table index of the 4 corners of every zone: bottom right, top right, bottom left, top left
+        stride = self.grid_width + 1
+        corners = np.concatenate(
+            [bottom * stride + right, top * stride + right, bottom * stride + left, top * stride + left]
+        )
+        corner_sums = np.empty((4, len(areas), 3), dtype=np.int32)
+        outputs = [np.empty((len(areas), 3), dtype=np.float32) for _ in range(OUTPUT_BUFFERS)]
+        # pixel boxes of the zones as given, read by cv2.mean, and aligned on their cells
+        zone_boxes = [
+            (max(0, int(zone_top)), max(1, int(zone_bottom)), max(0, int(zone_left)), max(1, int(zone_right)))
+            for zone_top, zone_bottom, zone_left, zone_right in boxes
+        ]
+        cell_boxes = [self._pixel_box(*cell_box) for cell_box in zip(top, bottom, left, right)]
+        # grid cells and pixels of the bounding box of every zone, the rest of the frame is never read
+        grid_box = (int(top.min()), int(bottom.max()), int(left.min()), int(right.max()))
+        pixel_box = self._pixel_box(*grid_box)
+        # pixels read zone by zone, by cv2.mean or to the cells of the other statistics (overlapping zones are
+        # read more than once), and on the grid, see `_zone_by_zone`
+        pixels = (_pixels(zone_boxes), _pixels(cell_boxes), _pixels([pixel_box]))
+        self._geometry = (
+            corners,
+            areas,
+            corner_sums,
+            outputs,
+            self._zone_cells(top, bottom, left, right, cell_boxes),
+            zone_boxes,
+            (grid_box, pixel_box),
+            pixels,
+        )
+
+    def _pixel_box(self, top, bottom, left, right):
+        """
+        :return: frame pixel box of a grid cells box
+        """
+        y_scale = self.frame_height / self.grid_height
+        x_scale = self.frame_width / self.grid_width
+        return (
+            round(int(top) * y_scale),
+            round(int(bottom) * y_scale),
+            round(int(left) * x_scale),
+            round(int(right) * x_scale),
+        )
+
+    def _zone_cells(self, top, bottom, left, right, cell_boxes):
+        # flat grid index of the cells of every zone, zone after zone, with the zone of each of them
+        cells = np.concatenate(
+            [
+                (np.arange(zone_top, zone_bottom)[:, None] * self.grid_width + np.arange(zone_left, zone_right)).ravel()
+                for zone_top, zone_bottom, zone_left, zone_right in zip(top, bottom, left, right)
+            ]
+        )
+        cell_zones = np.repeat(np.arange(len(top)), (bottom - top) * (right - left))
+        # histogram bins of a zone start at zone * bins: one bincount covers every zone
+        zone_bins = cell_zones * (1 << 3 * HISTOGRAM_BITS)
+        colors = np.empty((len(cells), 3), dtype=np.uint8)
+        # the cells of each zone as an image, written to by the zone by zone reductions
+        zone_images = []
+        first_cell = 0
+        for zone_top, zone_bottom, zone_left, zone_right in zip(top, bottom, left, right):
+            height, width = int(zone_bottom - zone_top), int(zone_right - zone_left)
+            zone_images.append(colors[first_cell : first_cell + height * width].reshape(height, width, 3))
+            first_cell += height * width
+        zones = len(top)
+        bins = 1 << 3 * HISTOGRAM_BITS
+        buffers = {
+            "keys": np.empty(len(cells), dtype=np.intp),
+            "channel_keys": np.empty(len(cells), dtype=np.intp),
+            "weights": np.empty(len(cells), dtype=np.float64),
+            "products": np.empty(len(cells), dtype=np.float64),
+            "highest": np.empty(len(cells), dtype=np.uint8),
+            "lowest": np.empty(len(cells), dtype=np.uint8),
+            "dominant": np.empty(zones, dtype=np.intp),
+            "zone_offsets": np.arange(zones) * bins,
+            "counts": np.empty(zones, dtype=np.intp),
+        }
+        return cells, cell_zones, zone_bins, colors, list(zip(cell_boxes, zone_images)), buffers
+
+    def set_sample_step(self, sample_step):
+        """
+        Analyse one pixel out of `sample_step` in each direction, the frame is never sampled below the grid size.
+        Like `set_bounds`, safe to call while `compute` runs on another thread.
+        :return: the sample step applied
+        """
+        sample_step = max(
+            1, min(int(sample_step), self.frame_width // self.grid_width, self.frame_height // self.grid_height)
+        )
+        if sample_step == 1:
+            self._sampled = None
+        else:
+            self._sampled = np.empty(
+                (self.frame_height // sample_step, self.frame_width // sample_step, 3), dtype=np.uint8
+            )
+        self.sample_step = sample_step
+        return sample_step
+
+    @property
+    def zone_count(self):
+        return len(self._geometry[1])
+
+    @property
+    def method(self):
+        """
+        :return: how the zones are read with the current statistic and sample step, for logs
+        """
+        if self._zone_by_zone(self._geometry[-1], self.statistic, self._sampled):
+            return "read zone by zone"
+        return f"on a {self.grid_width}x{self.grid_height} grid"
+
+    def _zone_by_zone(self, pixels, statistic, sampled):
+        """
+        :return: True when reading the zones one by one costs less than reducing their bounding box to the grid
+        """
+        zone_pixels, cell_pixels, box_pixels = pixels
+        if sampled is not None:
+            # the grid reduces one pixel out of sample_step² only, but picking them still loads every
+            # sample_step-th row of the frame from memory, the zones are always read whole
+            box_pixels /= self.frame_width // sampled.shape[1]
+        if statistic == MEAN:
+            # cv2.mean reads a pixel about AREA_COST times faster than INTER_AREA
+            return zone_pixels < AREA_COST * box_pixels
+        return cell_pixels < box_pixels
+
+    def compute(self, bgr_frame):
+        """
+        :param bgr_frame: frame as delivered by OpenCV (BGR channel order)
+        :return: float32 array of shape (zones, 3), RGB means in [0, 255], left untouched by the
+                 next OUTPUT_BUFFERS - 1 calls
+        """
+        corners, areas, corner_sums, outputs, zone_cells, zone_boxes, boxes, pixels = self._geometry
+        self._output_index = (self._output_index + 1) % len(outputs)
+        output = outputs[self._output_index]
+        statistic = self.statistic
+        sampled = self._sampled
+        zone_by_zone = self._zone_by_zone(pixels, statistic, sampled)
+        if zone_by_zone and statistic == MEAN:
+            for zone, (top, bottom, left, right) in enumerate(zone_boxes):
+                blue, green, red, _ = cv2.mean(bgr_frame[top:bottom, left:right])
+                # BGR -> RGB on the zone results
+                output[zone] = red, green, blue
+            return output
+        if zone_by_zone:
+            for (top, bottom, left, right), zone_image in zone_cells[4]:
+                cv2.resize(
+                    bgr_frame[top:bottom, left:right],
+                    (zone_image.shape[1], zone_image.shape[0]),
+                    dst=zone_image,
+                    interpolation=cv2.INTER_AREA,
+                )
+        else:
+            self._reduce(bgr_frame, sampled, *boxes)
+            if statistic != MEAN:
+                np.take(self._grid.reshape(-1, 3), zone_cells[0], axis=0, out=zone_cells[3])
+        if statistic == DOMINANT:
+            return self._dominant(zone_cells, output)
+        if statistic == SATURATION:
+            return self._saturation_weighted(zone_cells, output)
+        cv2.integral(self._grid, self._integral, sdepth=cv2.CV_32S)
+        np.take(self._integral.reshape(-1, 3), corners, axis=0, out=corner_sums.reshape(-1, 3))
+        sums, top_right, bottom_left, top_left = corner_sums
+        np.subtract(sums, top_right, out=sums)
+        np.subtract(sums, bottom_left, out=sums)
+        np.add(sums, top_left, out=sums)
+        # reversing the channel axis of the tiny result replaces a full frame BGR -> RGB conversion
+        return np.divide(sums[:, ::-1], areas, out=output, dtype=np.float32)
+
+    def _reduce(self, bgr_frame, sampled, grid_box, pixel_box):
+        """
+        Reduce the bounding box of the zones to its grid cells, the cells outside of it are left as they are:
+        no zone sum reads them.
+        """
+        grid_top, grid_bottom, grid_left, grid_right = grid_box
+        top, bottom, left, right = pixel_box
+        grid = self._grid[grid_top:grid_bottom, grid_left:grid_right]
+        frame = bgr_frame[top:bottom, left:right]
+        if sampled is not None:
+            sample_step = self.frame_width // sampled.shape[1]
+            sampled = sampled[: (bottom - top) // sample_step, : (right - left) // sample_step]
+            cv2.resize(frame, (sampled.shape[1], sampled.shape[0]), dst=sampled, interpolation=cv2.INTER_NEAREST)
+            frame = sampled
+        cv2.resize(frame, (grid.shape[1], grid.shape[0]), dst=grid, interpolation=cv2.INTER_AREA)
+
+    def _dominant(self, zone_cells, output):
+        """
+        Mean of the cells of the most common coarse color of each zone: a zone half red, half blue
+        shows red or blue instead of their muddy average.
+        """
+        cells, cell_zones, zone_bins, colors, zone_images, buffers = zone_cells
+        keys, channel_keys, weights = buffers["keys"], buffers["channel_keys"], buffers["weights"]
+        # coarse color of every cell, BGR bits packed in one histogram bin, offset by its zone
+        shift = 8 - HISTOGRAM_BITS
+        np.copyto(keys, zone_bins)
+        for channel, position in ((0, 2), (1, 1), (2, 0)):
+            np.right_shift(colors[:, channel], shift, out=channel_keys)
+            np.left_shift(channel_keys, position * HISTOGRAM_BITS, out=channel_keys)
+            np.add(keys, channel_keys, out=keys)
+        bins = 1 << 3 * HISTOGRAM_BITS
+        zones = len(output)
+        counts = np.bincount(keys, minlength=zones * bins)
+        dominant = buffers["dominant"]
+        np.argmax(counts.reshape(zones, bins), axis=1, out=dominant)
+        np.add(dominant, buffers["zone_offsets"], out=dominant)
+        for channel in range(3):
+            np.copyto(weights, colors[:, channel])
+            # BGR -> RGB on the zone results
+            np.take(np.bincount(keys, weights=weights, minlength=zones * bins), dominant, out=output[:, 2 - channel])
+        dominant_counts = buffers["counts"]
+        np.take(counts, dominant, out=dominant_counts)
+        np.divide(output, dominant_counts[:, None], out=output)
+        return output
+
+    def _saturation_weighted(self, zone_cells, output):
+        """
+        Mean of the cells of each zone weighted by their chroma (max - min channel, + 1 so grey zones
+        keep their plain mean): a saturated object on a grey background keeps its color.
+        """
+        cells, cell_zones, zone_bins, colors, zone_images, buffers = zone_cells
+        weights, products = buffers["weights"], buffers["products"]
+        np.max(colors, axis=1, out=buffers["highest"])
+        np.min(colors, axis=1, out=buffers["lowest"])
+        np.subtract(buffers["highest"], buffers["lowest"], out=weights, dtype=np.float64)
+        np.add(weights, 1.0, out=weights)
+        zones = len(output)
+        totals = np.bincount(cell_zones, weights=weights, minlength=zones)
+        for channel in range(3):
+            np.multiply(weights, colors[:, channel], out=products)
+            output[:, 2 - channel] = np.bincount(cell_zones, weights=products, minlength=zones)
+        np.divide(output, totals[:, None], out=output)
+        return output
+
+
+def _pixels(boxes):
+    """
+    :param boxes: [top, bottom, left, right] pixel boxes
+    :return: pixels read by reading every box
+    """
+    return sum((bottom - top) * (right - left) for top, bottom, left, right in boxes)
@@ -1,34 +1,105 @@
 #!/usr/bin/python3
 
 import json
-import pickle
-import subprocess
 import sys
 import threading
 import time
 import traceback
 
-import cv2
-
-import colorsys
 import requests
 import argparse
+import urllib3
 from hue_api import HueApi
 from hue_api.exceptions import UninitializedException, ButtonNotPressedException, FailedToSetState, DevicetypeException
 from hue_api.groups import HueGroup
 from hue_api.lights import HueLight
 
+from hue_play.activity import IDLE_AFTER
+from hue_play.bridge_cache import BridgeStateCache
+from hue_play.capture import CaptureProfile, DECODE_SCALES, FOURCCS, open_capture, reads_stdin
+from hue_play.color import DEFAULT_GAMUT, light_gamut
+from hue_play.control import ControlServer
+from hue_play.engine import EngineConfig, EntertainmentOutput, HuePlayEngine, RestOutput, zone_bounds
+from hue_play.frame_ring import CaptureProcess
+from hue_play.zones import MEAN, ZONE_STATISTICS
+from hue_play.track import LightTrack, analyse_video, video_properties
+
 parser = argparse.ArgumentParser()
 parser.add_argument("-s", "--stream", dest="stream", action="store_true")
 parser.add_argument("-sgr", "--streamgradient", dest="stream_gradient", action="store_true")
 parser.add_argument("-v", "--verbose", dest="verbose", action="store_true")
-parser.add_argument("-br", "--brightness", dest="brightness", default=100)
-parser.add_argument("-bid", "--bridgeid", dest="bridge_id")
+parser.add_argument("-br", "--brightness", dest="brightness", type=int, default=100)
+parser.add_argument("-bid", "--bridgeid", dest="bridge_ids", action="append")  # once per bridge to stream to
+parser.add_argument("-r", "--rate", dest="rate", type=float, action="append")  # Entertainment packets/s, per session
+parser.add_argument("-ct", "--changethreshold", dest="change_threshold", type=float, default=2.0)
+parser.add_argument("-ka", "--keepalive", dest="keepalive", type=float, default=1.0)
+parser.add_argument("-mp", "--metricsport", dest="metrics_port", type=int)  # serves http://127.0.0.1:<port>/metrics
+parser.add_argument("-ml", "--metricslog", dest="metrics_log", type=float, default=0)  # JSON line every n seconds
+parser.add_argument("-od", "--outputdelay", dest="output_delay", type=float, default=0)  # ms, TV processing delay
+parser.add_argument("-aq", "--adaptivequality", dest="adaptive_quality", action="store_true")  # see -cpu / -lat
+parser.add_argument("-cpu", "--cpubudget", dest="cpu_budget", type=float, default=50)  # % of all cores, with -aq
+parser.add_argument("-lat", "--latencybudget", dest="latency_budget", type=float, default=100)  # p95 ms, with -aq
+parser.add_argument("-idle", "--idle", dest="idle", type=float, default=IDLE_AFTER)  # s of black/no signal, then idle
+parser.add_argument("-zs", "--zonestatistic", dest="zone_statistic", choices=ZONE_STATISTICS, default=MEAN)
+parser.add_argument("-nlb", "--noletterbox", dest="no_letterbox", action="store_true")  # zones cover the bars
+parser.add_argument("-d", "--daemon", dest="daemon_port", type=int)  # control API on http://127.0.0.1:<port>
+parser.add_argument("-dh", "--daemonhost", dest="daemon_host", default="127.0.0.1")  # address the -d API listens on
+parser.add_argument("-src", "--source", dest="source", default="0")  # device index, video file or pipe:<w>x<h>
+parser.add_argument("-at", "--analysetrack", dest="analyse_track")  # light track built from the -src video file
+parser.add_argument("-pt", "--playtrack", dest="play_track")  # light track played instead of capturing
+parser.add_argument("-ps", "--playstart", dest="play_start", type=float, default=0)  # track seconds to start at
+parser.add_argument("-pc", "--processcapture", dest="process_capture", action="store_true")
+parser.add_argument("-cs", "--capturesize", dest="capture_size")  # requested capture size, e.g. 640x360
+parser.add_argument("-cf", "--captureformat", dest="capture_format", choices=FOURCCS)
+parser.add_argument("-cfps", "--capturefps", dest="capture_fps", type=float)
+parser.add_argument("-ds", "--decodescale", dest="decode_scale", type=int, default=1, choices=DECODE_SCALES)
 parser.add_argument("-ull", "--upleftlight", dest="up_left_light")
 parser.add_argument("-url", "--uprightlight", dest="up_right_light")
 parser.add_argument("-dll", "--downleftlight", dest="down_left_light")
 parser.add_argument("-drl", "--downrightlight", dest="down_right_light")
-cmd_args = parser.parse_args()
+# set by parse_command_line(), play.py can be imported without parsing anything
+cmd_args = None
+
+
+def parse_command_line(argv=None):
+    """
+    :param argv: command line arguments, sys.argv[1:] by default
+    """
+    global cmd_args
+    cmd_args = parser.parse_args(argv)
+    if cmd_args.process_capture and reads_stdin(cmd_args.source):
+        parser.error("-pc cannot read frames from stdin, use a fifo: -src pipe:<w>x<h>:<path>")
+
+    if cmd_args.decode_scale != 1 and not cmd_args.capture_format:
+        # only raw frames are decoded here, the capture backend decodes any other frame at full size
+        parser.error("-ds decodes the raw frames of -cf, give the capture format with -cf MJPG or -cf YUYV")
+
+    if cmd_args.daemon_host != "127.0.0.1" and cmd_args.daemon_port is None:
+        parser.error("-dh is the address of the -d control API, give the port with -d")
+
+    if cmd_args.daemon_port is not None and (cmd_args.analyse_track or cmd_args.play_track):
+        parser.error("-d streams the captured frames, it cannot be combined with -at or -pt")
+
+    if cmd_args.analyse_track and (str(cmd_args.source).isdigit() or str(cmd_args.source).startswith("pipe:")):
+        parser.error("-at analyses a video file: -src <path>")
+    return cmd_args
+
+
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+# bridges addresses and credentials, versioned JSON (previously a pickle in ".cache")
+CREDENTIALS_FILE = ".cache.json"
+# files of another version are not read: the bridge button is pushed again
+CREDENTIALS_VERSION = 2
+BRIDGE_STATE_FILE = ".bridge_state.json"
+DEFAULT_RATE = 50
+COLOR_LUT_DIR = ".color_luts"
+
+
+class SetupError(ValueError):
+    """
+    Lights or Entertainment areas missing for the requested mode, the message tells what to configure.
+    """
 
 
 class CustomHueGroup(HueGroup):
@@ -38,10 +109,20 @@ class CustomHueGroup(HueGroup):
         self.locations = group_locations
 
 
+class EntertainmentConfiguration:
+    def __init__(self, configuration_id, name, id_v1, channels):
+        self.id = configuration_id
+        self.name = name
+        self.id_v1 = id_v1
+        # {channel_id: [x, y, z]}, one channel per light or per gradient lightstrip segment
+        self.channels = channels
+
+
 class CustomHueLight(HueLight):
-    def __init__(self, light_id, name, state_dict, base_url, product_name):
+    def __init__(self, light_id, name, state_dict, base_url, product_name, gamut=DEFAULT_GAMUT):
         super(CustomHueLight, self).__init__(light_id, name, state_dict, base_url)
         self.product_name = product_name
+        self.gamut = gamut
         self._brightness = None
 
     @property
@@ -53,35 +134,62 @@ class CustomHueLight(HueLight):
         self._brightness = brightness
 
 
+class StreamSession:
+    """
+    Entertainment area of one bridge, streamed by the engine as one EntertainmentOutput.
+    """
+
+    __slots__ = ("api", "name", "light_locations", "rate", "entertainment_configuration", "lightstrips_gradient")
+
+    def __init__(self, api, name, light_locations, rate, entertainment_configuration=None, lightstrips_gradient=None):
+        self.api = api
+        self.name = name
+        # {light (v1) or channel id (v2): [x, y, z]}, in the order of the session zones
+        self.light_locations = light_locations
+        self.rate = rate
+        # HueStream v2 sessions only
+        self.entertainment_configuration = entertainment_configuration
+        self.lightstrips_gradient = lightstrips_gradient or []
+
+    @property
+    def zone_lights(self):
+        return list(self.light_locations.keys())
+
+
 class CustomHueApi(HueApi):
     def __init__(self, *args, **kwargs):
         super(CustomHueApi, self).__init__(*args, **kwargs)
+        self.bridge_id = None
         self.bridge_ip_address = None
         self.user_name = None
         self.client_key = None
         self.base_url = None
-        self._lightstrip_gradient = None
+        self.application_id = None
+        self.bridge_state = None
+        self.bridge_state_file = BRIDGE_STATE_FILE
 
     @property
-    def lightstrip_gradient(self):
-        return self._lightstrip_gradient
+    def clip_url(self):
+        return f"https://{self.bridge_ip_address}/clip/v2/resource"
 
-    @lightstrip_gradient.setter
-    def lightstrip_gradient(self, lightstrip_gradient):
-        self._lightstrip_gradient = lightstrip_gradient
+    def clip_request(self, method, url, **kwargs):
+        # the bridge serves CLIP v2 over https with a self-signed certificate
+        headers = {"hue-application-key": self.user_name}
+        return requests.request(method, url, headers=headers, verify=False, **kwargs)
 
     def load_existing(self, *args, **kwargs):
-        try:
-            cache_file = kwargs.get("cache_file") or self.find_cache_file()
-            with open(cache_file, "rb") as cached_file:
-                loaded = pickle.load(cached_file)
-            bridge_ip_address = loaded.get("bridge_ip_address")
-            user_name = loaded.get("user_name")
-            if cmd_args.stream or cmd_args.stream_gradient:
-                client_key = loaded.get("client_key")
-                self.client_key = client_key
-        except FileNotFoundError:
+        """
+        :param credentials: saved bridge, as returned by load_credentials()
+        """
+        credentials = kwargs.get("credentials")
+        if not credentials:
             raise UninitializedException
+        bridge_ip_address = credentials.get("bridge_ip_address")
+        user_name = credentials.get("user_name")
+        if needs_client_key():
+            client_key = credentials.get("client_key")
+            self.client_key = client_key
+        self.bridge_id = credentials.get("id")
         self.bridge_ip_address = bridge_ip_address
         self.user_name = user_name
         self.base_url = f"http://{bridge_ip_address}/api/{user_name}"
@@ -89,7 +197,7 @@ class CustomHueApi(HueApi):
     def create_new_user(self, bridge_ip_address, *args, **kwargs):
         url = f"http://{bridge_ip_address}/api"
         payload = {"devicetype": "hue_cli"}
-        if cmd_args.stream or cmd_args.stream_gradient:
+        if needs_client_key():
             payload = {"devicetype": "hue_cli", "generateclientkey": True}
         response = requests.post(url, json=payload)
         response = response.json()[0]
@@ -100,7 +208,7 @@ class CustomHueApi(HueApi):
             else:
                 raise ButtonNotPressedException
         user_name = response.get("success").get("username")
-        if cmd_args.stream or cmd_args.stream_gradient:
+        if needs_client_key():
             client_key = response.get("success").get("clientkey")
             self.client_key = client_key
         self.user_name = user_name
@@ -108,44 +216,141 @@ class CustomHueApi(HueApi):
         self.base_url = f"http://{bridge_ip_address}/api/{user_name}"
 
     def save_api_key(self, *args, **kwargs):
-        cache_file = kwargs.get("cache_file") or self.find_cache_file()
-        with open(cache_file, "wb") as pickle_file:
-            cache = {
-                "bridge_ip_address": self.bridge_ip_address,
-                "user_name": self.user_name,
-            }
-            if cmd_args.stream or cmd_args.stream_gradient:
-                cache.update({"client_key": self.client_key})
-            pickle.dump(cache, pickle_file)
+        # the other bridges saved in the file are kept, this one replaces its previous entry
+        cache_file = kwargs.get("cache_file") or CREDENTIALS_FILE
+        bridges = [
+            bridge
+            for bridge in load_credentials(cache_file)
+            if bridge.get("bridge_ip_address") != self.bridge_ip_address
+            and (self.bridge_id is None or bridge.get("id") != self.bridge_id)
+        ]
+        bridge = {"id": self.bridge_id, "bridge_ip_address": self.bridge_ip_address, "user_name": self.user_name}
+        if needs_client_key():
+            bridge.update({"client_key": self.client_key})
+        bridges.append(bridge)
+        with open(cache_file, "w") as json_file:
+            json.dump({"version": CREDENTIALS_VERSION, "bridges": bridges}, json_file)
+
+    def load_bridge_state(self):
+        """
+        Lights and groups come from the bridge state cache: a fresh copy on disk is used as is
+        (and refreshed in the background), otherwise the full state is fetched in one request.
+        """
+        self.bridge_state = BridgeStateCache(self.bridge_state_file, log=verbose)
+        if self.bridge_state.load(self.base_url):
+            verbose("Bridge state loaded from cache")
+            self.bridge_state.refresh_in_background()
+        else:
+            verbose("Fetching bridge state...")
+            self.bridge_state.fetch(self.base_url)
+
+    def reload_bridge_state(self):
+        """
+        Fetch the bridge state again once a light or Entertainment zone is missing from it:
+        the cached copy may predate that light being renamed or added.
+        :return: False if the state was fetched moments ago, nothing new to expect from the bridge
+        """
+        if self.bridge_state is None or not self.bridge_state.needs_recheck():
+            return False
+        verbose("Fetching bridge state again...")
+        self.bridge_state.invalidate()
+        self.bridge_state.fetch(self.base_url)
+        self.fetch_lights()
+        return True
 
     def fetch_lights(self, *args, **kwargs):
+        if self.bridge_state is None:
+            self.load_bridge_state()
         url = self.base_url + "/lights"
-        response = requests.get(url).json()
         lights = []
-        for light_id in response:
-            state = response[light_id].get("state")
-            name = response[light_id].get("name")
-            product_name = response[light_id].get("productname")
-            hue_light = CustomHueLight(int(light_id), name, state, url, product_name)
+        for light_id, light in self.bridge_state.lights.items():
+            state = light.get("state")
+            name = light.get("name")
+            product_name = light.get("productname")
+            hue_light = CustomHueLight(int(light_id), name, state, url, product_name, light_gamut(light))
             lights.append(hue_light)
         self.lights = lights
         return lights
 
     def fetch_groups(self, *args, **kwargs):
-        url = self.base_url + "/groups"
-        response = requests.get(url).json()
-        groups = []
-        for group_id in response:
-            group_name = response[group_id].get("name")
-            group_type = response[group_id].get("type")
-            group_locations = response[group_id].get("locations")
-            lights = [int(light) for light in response[group_id].get("lights")]
+        if not self.lights:
             self.fetch_lights()
+        groups = []
+        for group_id, group in self.bridge_state.groups.items():
+            group_name = group.get("name")
+            group_type = group.get("type")
+            group_locations = group.get("locations")
+            lights = [int(light) for light in group.get("lights")]
             group_lights = self.filter_lights(lights)
             groups.append(CustomHueGroup(group_id, group_name, group_lights, group_type, group_locations))
         self.groups = groups
         return groups
 
+    def get_light_by_name(self, name):
+        if not self.lights:
+            self.fetch_lights()
+        light_id = self.bridge_state.lights_by_name.get(name)
+        if light_id is None and self.reload_bridge_state():
+            light_id = self.bridge_state.lights_by_name.get(name)
+        if light_id is None:
+            return None
+        return self.filter_lights([int(light_id)])[0]
+
+    def fetch_application_id(self):
+        """
+        HueStream v2 sessions use the application id, not the user name, as PSK identity.
+        """
+        self.application_id = self.bridge_state.get_section("application_id")
+        if not self.application_id:
+            response = self.clip_request("GET", f"https://{self.bridge_ip_address}/auth/v1")
+            self.application_id = response.headers.get("hue-application-id")
+            self.bridge_state.set_section("application_id", self.application_id)
+        return self.application_id
+
+    def fetch_entertainment_configurations(self):
+        response = self.bridge_state.get_section("entertainment_configuration")
+        if response is None:
+            response = self.clip_request("GET", self.clip_url + "/entertainment_configuration").json()
+            self.bridge_state.set_section("entertainment_configuration", response)
+        configurations = []
+        for configuration in response.get("data", []):
+            channels = {}
+            for channel in configuration.get("channels", []):
+                position = channel.get("position")
+                channels[channel.get("channel_id")] = [position.get("x"), position.get("y"), position.get("z")]
+            configurations.append(
+                EntertainmentConfiguration(
+                    configuration.get("id"),
+                    configuration.get("metadata", {}).get("name"),
+                    configuration.get("id_v1"),
+                    channels,
+                )
+            )
+        return configurations
+
+    def set_entertainment_streaming(self, configuration, active):
+        url = f"{self.clip_url}/entertainment_configuration/{configuration.id}"
+        self.clip_request("PUT", url, json={"action": "start" if active else "stop"})
+
+
+def load_credentials(cache_file=CREDENTIALS_FILE):
+    """
+    :return: saved bridges, one {"id", "bridge_ip_address", "user_name", "client_key"} dict each
+    """
+    try:
+        with open(cache_file) as cached_file:
+            loaded = json.load(cached_file)
+    except (FileNotFoundError, ValueError):
+        return []
+    if loaded.get("version") != CREDENTIALS_VERSION:
+        return []
+    return loaded.get("bridges", [])
+
+
+def needs_client_key():
+    # a daemon may be switched to a streaming mode at any time
+    return cmd_args.stream or cmd_args.stream_gradient or cmd_args.daemon_port is not None
+
 
 def verbose(*args, **kwargs):
     if cmd_args.verbose:
@@ -158,46 +363,62 @@ def verbose(*args, **kwargs):
 ####################################
 def hue_login():
     """
-    This function will assure connection to hue bridge,
+    This function will assure connection to hue bridges,
     and save user info in hue_api cache.
+    Every bridge given with -bid is used, otherwise every bridge saved in cache, or the first bridge found.
     """
-    global api
-    # instantiate a HueApi object
-    api = CustomHueApi()
+    global api, bridge_apis
+    saved_bridges = load_credentials(CREDENTIALS_FILE)
+    bridge_ids = cmd_args.bridge_ids or [bridge.get("id") for bridge in saved_bridges] or [None]
+    discovered_bridges = None
+    bridge_apis = []
+    for bridge_id in bridge_ids:
+        # instantiate a HueApi object
+        bridge_api = CustomHueApi()
+        if bridge_apis:
+            bridge_api.bridge_state_file = f".bridge_state.{len(bridge_apis)}.json"
+        bridge_apis.append(bridge_api)
+        try:
+            # load existing user if saved in cache
+            verbose("Trying to load user from cache")
+            credentials = next(
+                (bridge for bridge in saved_bridges if bridge_id is None or bridge.get("id") == bridge_id), None
+            )
+            bridge_api.load_existing(credentials=credentials)
+            verbose("User saved in cache loaded")
+        except UninitializedException:
+            # auto-find bridges on network & get list
+            if discovered_bridges is None:
+                response = requests.get("https://discovery.meethue.com/")
+                discovered_bridges = json.loads(response.text)
+            register_bridge(bridge_api, discovered_bridges, bridge_id)
+    api = bridge_apis[0]
+
+
+def register_bridge(bridge_api, bridges, bridge_id):
+    # by default we take first bridge found
+    current_bridge = bridges[0]
+    if bridge_id:
+        current_bridge = next((bridge for bridge in bridges if bridge.get("id") == bridge_id), None)
+        if current_bridge is None:
+            print(f"Error: Can't find bridge with id: {bridge_id}")
+            sys.exit(0)
+    verbose(f"Bridge with id: {current_bridge.get('id')} will be used")
 
-    try:
-        # load existing user if saved in cache
-        verbose("Trying to load user from cache")
-        api.load_existing(cache_file=".cache")
-        verbose("User saved in cache loaded")
-        return
-    except (UninitializedException, EOFError):
-        # auto-find bridges on network & get list
-        response = requests.get("https://discovery.meethue.com/")
-        bridges = json.loads(response.text)
-
-        # by default we take first bridge found
-        current_bridge = bridges[0]
-        if cmd_args.bridge_id:
-            for bridge in bridges:
-                if bridge.get("id") == cmd_args.bridge_id:
-                    current_bridge = bridge
-        verbose(f"Bridge with id: {current_bridge.get('id')} will be used")
-
-        while True:
-            try:
-                print("Please push the button on the hue bridge...")
-                api.create_new_user(current_bridge.get("internalipaddress"))
-                verbose(f"User created on hue bridge ip: {current_bridge.get('internalipaddress')}")
-                break
-            except ButtonNotPressedException:
-                print("Hue bridge button not pushed")
-                print("Try again in three seconds...")
-                time.sleep(3)
-
-        open(".cache", "w+")
-        api.save_api_key(cache_file=".cache")
-        verbose(f"User saved on cache")
+    while True:
+        try:
+            print("Please push the button on the hue bridge...")
+            bridge_api.create_new_user(current_bridge.get("internalipaddress"))
+            verbose(f"User created on hue bridge ip: {current_bridge.get('internalipaddress')}")
+            break
+        except ButtonNotPressedException:
+            print("Hue bridge button not pushed")
+            print("Try again in three seconds...")
+            time.sleep(3)
+
+    bridge_api.bridge_id = current_bridge.get("id")
+    bridge_api.save_api_key(cache_file=CREDENTIALS_FILE)
+    verbose(f"User saved on cache")
 
 
 ####################################
@@ -205,8 +426,6 @@ def hue_login():
 ####################################
 def animation_light_on(light):
     try:
-        if cmd_args.stream_gradient and api.lightstrip_gradient:
-            light = api.lightstrip_gradient
         verbose(f"Turning on light: {light.name}")
         time.sleep(0.2)
         light.set_off()
@@ -224,8 +443,6 @@ def animation_light_on(light):
 
 def animation_light_off(light):
     try:
-        if cmd_args.stream_gradient and api.lightstrip_gradient:
-            light = api.lightstrip_gradient
         verbose(f"Turning off light: {light.name}")
         light.set_brightness(254)
         time.sleep(0.2)
@@ -238,74 +455,161 @@ def animation_light_off(light):
         verbose(f"Error on config set light off for light: {light.name}")
 
 
-def get_hue_color_from_rgba(rgba):
+def animation_light_resume(light):
+    try:
+        verbose(f"Resuming light: {light.name}")
+        light.set_on()
+        light.set_brightness(cmd_args.brightness)
+    except FailedToSetState:
+        verbose(f"Error on config set light on for light: {light.name}")
+
+
+def get_animated_lights(session=None):
     """
-    HSV: Hue, Saturation, Value
-    H: position in the spectrum
-    S: color saturation ("purity")
-    V: color brightness
-    :param rgba: Color in rgba format
-    :return: hue color and saturation (hue, saturation)
+    :param session: StreamSession whose lights are wanted, None for the lights of every session
     """
-    r, g, b, a = rgba
-    h, s, v = colorsys.rgb_to_hsv(r, g, b)
-    hue = int((2 ** 16 - 1) * h)
-    saturation = int((2 ** 8 - 1) * s)
-    return hue, saturation
+    if session is None:
+        if not sessions:
+            return light_locations.keys()
+        return [light for stream_session in sessions for light in get_animated_lights(stream_session)]
+    if cmd_args.stream_gradient:
+        return session.lightstrips_gradient
+    return session.zone_lights
+
+
+def start_light_animation(animation, light):
+    """
+    Run a light animation in the background, lights are animated in parallel.
+    """
+    animation_thread = threading.Thread(target=animation, args=(light,), daemon=True)
+    animation_thread.start()
+    return animation_thread
+
+
+def switch_lights(animation, session=None):
+    # every light (of the session) at once, returns when all of them are done
+    animations = [start_light_animation(animation, light) for light in get_animated_lights(session)]
+    for animation_thread in animations:
+        animation_thread.join()
+
+
+# switch on animations of the REST lights looked up, still running, see `wait_startup_animations`
+startup_animations = []
 
 
 def get_light_by_name(name):
-    for light in api.fetch_lights():
-        if light.name == name:
-            animation_light_on(light)
-            return light
+    light = api.get_light_by_name(name)
+    if light:
+        startup_animations.append(start_light_animation(animation_light_on, light))
+        return light
 
-    print(f"Error: Can't find light id for name: {name}")
-    sys.exit(0)
+    raise SetupError(f"Error: Can't find light id for name: {name}")
+
+
+def wait_startup_animations():
+    """
+    Wait for the switch on animations to be over before the senders take the lights over: their REST
+    commands would otherwise go out along with the sender ones, outside of its rate limit.
+    """
+    while startup_animations:
+        startup_animations.pop().join()
+
+
+def session_rate(index):
+    # -r is given once for every session, or once per session in bridge order
+    rates = cmd_args.rate or [DEFAULT_RATE]
+    return rates[min(index, len(rates) - 1)]
 
 
 def init_light_locations():
-    global light_locations
+    try:
+        find_light_locations()
+    except SetupError:
+        # an Entertainment zone or gradient lightstrip set up since the bridge state was cached
+        if not any([bridge_api.reload_bridge_state() for bridge_api in bridge_apis]):
+            raise
+        find_light_locations()
+
+
+def find_light_locations():
+    global light_locations, sessions
+    # one stream session per bridge: a bridge streams to a single Entertainment area at a time, the lights
+    # of all its Entertainment areas are streamed as one, see the README
+    sessions = []
+    light_locations = {}
     if cmd_args.stream:
-        light_locations = {}
-        for group in api.fetch_groups():
-            if group.type == "Entertainment":
-                verbose(f"Entertainment zone: {group.name} found.")
-                for light in group.lights:
-                    verbose(f"Light: {light.id} - {light.name}")
-                    locations = group.locations.get(str(light.id))
-                    light_locations.update({light: locations})
-                    verbose(f"Light: {light.name} with locations: {locations} configured successfully")
-
-        if not light_locations:
-            print(
-                "Error: no Entertainment zone found, "
-                "you must configure your Entertainment zone on your hue app before using 'stream' mode"
+        for bridge_api in bridge_apis:
+            locations = {}
+            areas = []
+            for group in bridge_api.fetch_groups():
+                if group.type == "Entertainment":
+                    verbose(f"Entertainment zone: {group.name} found on bridge {bridge_api.bridge_ip_address}.")
+                    areas.append(group.name)
+                    for light in group.lights:
+                        verbose(f"Light: {light.id} - {light.name}")
+                        light_location = group.locations.get(str(light.id))
+                        locations.update({light: light_location})
+                        verbose(f"Light: {light.name} with locations: {light_location} configured successfully")
+
+            if len(areas) > 1:
+                print(
+                    f"Warning: Entertainment zones {', '.join(areas)} of bridge {bridge_api.bridge_ip_address} are "
+                    "streamed as one, the bridge only shows the lights of the zone it streams to"
+                )
+            if not locations:
+                raise SetupError(
+                    f"Error: no Entertainment zone found on bridge {bridge_api.bridge_ip_address}, "
+                    "you must configure your Entertainment zone on your hue app before using 'stream' mode"
+                )
+            sessions.append(
+                StreamSession(bridge_api, bridge_api.bridge_ip_address, locations, session_rate(len(sessions)))
             )
-            sys.exit(0)
 
-    # Option to stream 7 colors to hue lightstrip gradient
+    # Option to stream every segment of hue lightstrips gradient
     elif cmd_args.stream_gradient:
-        light_locations = {
-            # light positions [x, y]
-            # 2 up lights
-            "up_right_light": [0.5, 1.0, 1.0],
-            "up_left_light": [-0.5, 1.0, 1.0],
-            # 3 up middle lights
-            "up_right_middle_light": [0.25, 1.0, 0.0],
-            "up_middle_light": [0.0, 1.0, 0.0],
-            "up_left_middle_light": [-0.25, 1.0, 0.0],
-            # 2 down lights
-            "down_right_light": [0.5, 0.65, 1.0],
-            "down_left_light": [-0.5, 0.65, 1.0],
-        }
-        for group in api.fetch_groups():
-            if group.type == "Entertainment":
-                verbose(f"Entertainment zone: {group.name} found.")
-                for light in group.lights:
-                    if light.product_name == "Hue play gradient lightstrip":
-                        verbose(f"Lightstrip gradient found: {light.id} - {light.name}")
-                        api.lightstrip_gradient = light
+        for bridge_api in bridge_apis:
+            lightstrips_gradient = []
+            gradient_groups = []
+            for group in bridge_api.fetch_groups():
+                if group.type == "Entertainment":
+                    verbose(f"Entertainment zone: {group.name} found on bridge {bridge_api.bridge_ip_address}.")
+                    for light in group.lights:
+                        if "gradient" in (light.product_name or "").lower():
+                            verbose(f"Lightstrip gradient found: {light.id} - {light.name}")
+                            lightstrips_gradient.append(light)
+                            gradient_groups.append(f"/groups/{group.id}")
+
+            # gradient segments are only addressable as channels of a HueStream v2 entertainment configuration
+            entertainment_configuration = None
+            for configuration in bridge_api.fetch_entertainment_configurations():
+                if configuration.id_v1 in gradient_groups:
+                    entertainment_configuration = configuration
+                    break
+
+            if not entertainment_configuration:
+                raise SetupError(
+                    f"Error: no Entertainment zone with a lightstrip gradient found on bridge "
+                    f"{bridge_api.bridge_ip_address}, you must add your lightstrip to an Entertainment zone "
+                    "on your hue app before using 'streamgradient' mode"
+                )
+
+            verbose(f"Entertainment configuration: {entertainment_configuration.name} will be used")
+            # one zone per channel: every segment of every lightstrip gradient of the area
+            locations = {}
+            for channel_id, channel_location in entertainment_configuration.channels.items():
+                locations[channel_id] = list(channel_location)
+                verbose(f"Channel: {channel_id} with locations: {channel_location} configured successfully")
+            bridge_api.fetch_application_id()
+            sessions.append(
+                StreamSession(
+                    bridge_api,
+                    entertainment_configuration.name,
+                    locations,
+                    session_rate(len(sessions)),
+                    entertainment_configuration,
+                    lightstrips_gradient,
+                )
+            )
 
     else:
         light_locations = {
@@ -349,229 +653,399 @@ def init_light_locations():
             verbose("Down-right light configured successfully")
 
         if not light_locations:
-            print(
+            raise SetupError(
                 "Error: no lights provided, "
                 "you must provide either right-light (-rl) name or left-light (-ll) name or both"
             )
-            sys.exit(0)
 
 
 ####################################
-#        Video Capture Setup       #
+#          Engine outputs          #
 ####################################
-def configure_rgb_frames():
-    global video_width, video_height, rgb_frame
-    time.sleep(2)  # wait for animation start complete
-    # Init video capture
-    capture = cv2.VideoCapture(0)
-
-    # Try to get the first frame
-    if capture.isOpened():
-        verbose("Capture Device Opened")
-
-    else:
-        verbose("Unable to open Capture Device, please check your configuration")
-        sys.exit(0)
+def stream_output(session):
+    """
+    :return: EntertainmentOutput streaming the zones of a StreamSession
+    """
+    session_api = session.api
+    locations = list(session.light_locations.values())
+    callbacks = {
+        "on_idle": lambda: switch_lights(animation_light_off, session),
+        "on_resume": lambda: switch_lights(animation_light_resume, session),
+    }
+    if cmd_args.stream_gradient:
+        # zones are the channels of the entertainment configuration, the segments of the lightstrips gradient
+        configuration = session.entertainment_configuration
+        gamut = session.lightstrips_gradient[0].gamut if session.lightstrips_gradient else DEFAULT_GAMUT
+        return EntertainmentOutput(
+            session.name,
+            session_api.bridge_ip_address,
+            session_api.application_id,
+            session_api.client_key,
+            session.zone_lights,
+            locations,
+            [gamut] * len(locations),
+            session.rate,
+            version=2,
+            entertainment_id=configuration.id,
+            on_open=lambda: session_api.set_entertainment_streaming(configuration, True),
+            on_close=lambda: session_api.set_entertainment_streaming(configuration, False),
+            **callbacks,
+        )
+    return EntertainmentOutput(
+        session.name,
+        session_api.bridge_ip_address,
+        session_api.user_name,
+        session_api.client_key,
+        [light.id for light in session.zone_lights],
+        locations,
+        [light.gamut for light in session.zone_lights],
+        session.rate,
+        **callbacks,
+    )
+
+
+def create_outputs():
+    """
+    :return: one engine output per stream session, or the REST lights given on the command line
+    """
+    if sessions:
+        return [stream_output(session) for session in sessions]
+    lights = list(light_locations.keys())
+    return [
+        RestOutput(
+            api.base_url,
+            [light.id for light in lights],
+            list(light_locations.values()),
+            [light.gamut for light in lights],
+            cmd_args.brightness,
+            fetch_groups=lambda: {group.id: [light.id for light in group.lights] for group in api.fetch_groups()},
+            on_idle=lambda: switch_lights(animation_light_off),
+            on_resume=lambda: switch_lights(animation_light_resume),
+        )
+    ]
 
-    video_width = int(capture.get(cv2.CAP_PROP_FRAME_WIDTH))  # gets video width
-    video_height = int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT))  # gets video height
-    verbose(f"Video Shape is: {video_width}, {video_height}")
 
-    # This section loops & pulls re-colored frames and always get the newest frame
-    capture.set(cv2.CAP_PROP_BUFFERSIZE, 0)  # No frame buffer to avoid lagging, always grab newest frame
-    capture_index = 0
+####################################
+#        Video Capture Setup       #
+####################################
+def capture_profile():
+    width, height = CaptureProfile.parse_size(cmd_args.capture_size) if cmd_args.capture_size else (None, None)
+    return CaptureProfile(width, height, cmd_args.capture_format, cmd_args.capture_fps, cmd_args.decode_scale)
 
-    while not stop_stream:
-        capture_index += 1
-        frame = capture.grab()  # constantly grabs frames
-        if capture_index % 1 == 0:  # Skip frames (1=don't skip,2=skip half,3=skip 2/3rds)
-            frame, bgr_frame = capture.retrieve()  # processes most recent frame
-            rgb_frame = cv2.cvtColor(bgr_frame, cv2.COLOR_BGR2RGB)  # corrects BGR to RGB
 
-        # if no new frame: stop loop
-        if not frame:
-            break
+def open_video_capture():
+    return open_capture(cmd_args.source, capture_profile(), log=verbose)
 
 
-####################################
-#          Average image          #
-####################################
-def average_image():
-    # Scales up locations to identify the nearest pixel based on lights locations
-    time.sleep(2.5)  # wait for video size to be defined
-    for light, light_pos in light_locations.items():
-        # Translates x value and resizes to video aspect ratio
-        light_pos[0] = ((light_pos[0]) + 1) * video_width // 2
-
-        # Flips y, translates, and resize to vid aspect ratio
-        light_pos[2] = (-1 * (light_pos[2]) + 1) * video_height // 2
-
-    scaled_locations = list(light_locations.items())  # Makes it a list of locations by light
-    verbose("Lights and locations (in order) on TV array after math are: ", scaled_locations)
-
-    # This section assigns light locations to variable light1,2,3...etc. in JSON order
-    avg_size = video_width / 2 + video_height / 2
-    verbose("Average size is: ", avg_size)
-
-    breadth = 0.15  # approx percent of the screen outside the location to capture
-    dist = int(breadth * avg_size)  # proportion of the pixels we want to average around in relation to the video size
-    verbose("Distance from relative location is: ", dist)
-
-    global coords  # dict of coordinates
-    global bounds  # dict of bounds for each coord, each item is formatted as [top, bottom, left, right]
-
-    # initialize the dicts
-    coords = {}
-    lights_bounds = {}
-    for light, coordinates in scaled_locations:
-        coords[light] = coordinates
-        bound_list = [coordinates[2] - dist, coordinates[2] + dist, coordinates[0] - dist, coordinates[0] + dist]
-        bound_map = list(map(int, bound_list))
-        bounds = list(map(lambda bound: 0 if bound < 0 else bound, bound_map))
-        lights_bounds[light] = bounds
-
-    global rgb_colors, rgb_frame, rgb_bytes  # array of rgb values, one for each light
-    rgb_bytes = {}
-    rgb_colors = {}
-    rgb = {}
-    area = {}
-
-    # Constantly sets RGB values by location via taking average of nearby pixels
-    while not stop_stream:
-        for light_id, bound in lights_bounds.items():
-            area[light_id] = rgb_frame[bound[0] : bound[1], bound[2] : bound[3], :]
-            rgb[light_id] = cv2.mean(area[light_id])
-            rgb_colors[light_id] = get_hue_color_from_rgba(rgb[light_id])
-
-        for light_id, color_mean in rgb.items():
-            rgb_bytes[light_id] = bytearray(
-                [
-                    int(color_mean[0] / 2),
-                    int(color_mean[0] / 2),
-                    int(color_mean[1] / 2),
-                    int(color_mean[1] / 2),
-                    int(color_mean[2] / 2),
-                    int(color_mean[2] / 2),
-                ]
-            )
+def start_video_capture():
+    verbose("Starting Video Capture Setup...")
+    if cmd_args.process_capture:
+        capture_process = CaptureProcess(
+            cmd_args.source, capture_profile(), poll_interval=engine.activity.poll_interval, verbose=cmd_args.verbose
+        )
+        capture_process.start()
+        engine.start_capture_process(capture_process)
+    else:
+        engine.start_capture(open_video_capture)
 
 
 ####################################
-#     Send colors to Lights        #
+#           Light tracks           #
 ####################################
-def send_colors_to_lights():
-    global rgb_colors
-    # Hold on for connection to bridge can be made & video capture is configured
-    time.sleep(3)
-    verbose("Streaming colors to lights... (Press Enter to stop streaming)")
-    while not stop_stream:
-        buffer_lock.acquire()
-        for light, (hue, saturation) in rgb_colors.items():
-            if hue == 0:
-                saturation = 0
-            light.set_state({"hue": hue, "sat": saturation})
-        buffer_lock.release()
-        # time.sleep(.01)  # 0.01 to 0.02 (slightly under 100 or 50 messages per sec // or (.015 = ~66.6))
-
-
-#########################################
-#  Stream colors to Entertainment zone  #
-#########################################
-def stream_colors_to_entertainment_zone(proc):
-    global rgb_bytes
-    # Hold on for connection to bridge can be made & video capture is configured
-    time.sleep(3)
-    verbose("Streaming colors to Entertainment zone... (Press Enter to stop streaming)")
-    while not stop_stream:
-        buffer_lock.acquire()
-
-        message = bytes("HueStream", "utf-8") + b"\1\0\0\0\0\0\0"
-        verbose(f"message: {message}")
-        if cmd_args.stream_gradient and api.lightstrip_gradient:
-            light_id = api.lightstrip_gradient.id
-            verbose(f"light id: {light_id}")
-            message += b"\0\0" + bytes(chr(int(light_id)), "utf-8")
-            verbose(f"message with id: {message}")
-            colors_bytes = rgb_bytes["up_right_light"]
-            # for colors_bytes in rgb_bytes.values():
-            message += colors_bytes
-            verbose(f"message color: {colors_bytes} : {message}")
-        else:
-            for light_id, colors_bytes in rgb_bytes.items():
-                message += b"\0\0" + bytes(chr(int(light_id)), "utf-8") + colors_bytes
-        verbose(f"rgb_bytes: {rgb_bytes}")
-        verbose(f"message: {message}")
-        verbose(f'message decoded: {message.decode("utf-8", "ignore")}')
-        buffer_lock.release()
-        proc.stdin.write(message.decode("utf-8", "ignore"))
-        time.sleep(0.02)  # 0.01 to 0.02 (slightly under 100 or 50 messages per sec // or (.015 = ~66.6))
-        proc.stdin.flush()
+def analyse_light_track():
+    """
+    Offline analysis of the -src video file into the -at light track, faster than real time.
+    """
+    width, height, _, _ = video_properties(cmd_args.source)
+    outputs = create_outputs()
+    zone_ids = [str(zone_id) for output in outputs for zone_id in output.zone_ids]
+    locations = [location for output in outputs for location in output.locations]
+    bounds = zone_bounds(locations, (0, height, 0, width))
+    track = analyse_video(
+        cmd_args.source, cmd_args.analyse_track, zone_ids, bounds, statistic=cmd_args.zone_statistic, log=print
+    )
+    print(f"Light track of {track.duration:.0f}s saved to {cmd_args.analyse_track}")
 
 
 ####################################
 #             Run script           #
 ####################################
-def run_hue_play():
-    global buffer_lock, stop_stream
-    buffer_lock = threading.Lock()
-    stop_stream = False
+def init_pipeline(started):
+    global engine
+    config = EngineConfig(
+        change_threshold=cmd_args.change_threshold,
+        keepalive=cmd_args.keepalive,
+        idle=cmd_args.idle,
+        letterbox=not cmd_args.no_letterbox,
+        color_lut_dir=COLOR_LUT_DIR,
+        metrics_port=cmd_args.metrics_port,
+        metrics_log=cmd_args.metrics_log,
+        log_packets=cmd_args.verbose,
+        output_delay=cmd_args.output_delay / 1000,
+        adaptive_quality=cmd_args.adaptive_quality,
+        cpu_budget=cmd_args.cpu_budget,
+        latency_budget=cmd_args.latency_budget / 1000,
+        zone_statistic=cmd_args.zone_statistic,
+    )
+    engine = HuePlayEngine(config, log=verbose, started=started)
+
+
+def stop_pipeline():
+    engine.stop()
+
+
+def wait_for_enter():
+    try:
+        input("Press ENTER to stop")  # Allow us to exit easily
+    except EOFError:
+        pass
+    stop_pipeline()
+
 
+def run_hue_play(interactive=True):
+    """
+    :param interactive: stop when ENTER is pressed, otherwise only stop_pipeline() stops
+    """
     # Section executes video input and establishes the connection stream to bridge
     try:
         try:
-            threads = list()
-            verbose("Starting Video Capture Setup...")
-            rgb_frames_thread = threading.Thread(target=configure_rgb_frames)
-            time.sleep(0.75)
-            verbose("Starting Average image...")
-            average_image_thread = threading.Thread(target=average_image)
-            time.sleep(0.25)  # Initialize and find bridge IP before creating connection
-            if cmd_args.stream or cmd_args.stream_gradient:
-                verbose("Starting stream colors to hue Entertainment zone...")
-                cmd = [
-                    "openssl",
-                    "s_client",
-                    "-dtls1_2",
-                    "-cipher",
-                    "PSK-AES128-GCM-SHA256",
-                    "-psk_identity",
-                    api.user_name,
-                    "-psk",
-                    api.client_key,
-                    "-connect",
-                    f"{api.bridge_ip_address}:2100",
-                ]
-                verbose(f'CMD: {" ".join(cmd)}')
-                proc = subprocess.Popen(
-                    cmd,
-                    stdout=subprocess.PIPE,
-                    stdin=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                    universal_newlines=True,
-                )
-                send_colors_thread = threading.Thread(target=stream_colors_to_entertainment_zone, args=(proc,))
+            track = LightTrack.open(cmd_args.play_track) if cmd_args.play_track else None
+            if sessions:
+                verbose("Starting stream colors to hue Entertainment zones...")
             else:
                 verbose("Starting Send colors to Lights...")
-                send_colors_thread = threading.Thread(target=send_colors_to_lights)
+            wait_startup_animations()
+            # one sender per output, sending concurrently
+            engine.start(create_outputs(), track=track, track_start=cmd_args.play_start)
 
-            rgb_frames_thread.start()
-            average_image_thread.start()
-            send_colors_thread.start()
-            threads.extend([rgb_frames_thread, average_image_thread, send_colors_thread])
-
-            input("Press ENTER to stop")  # Allow us to exit easily
-            stop_stream = True
-            for thread in threads:
-                thread.join()
+            if interactive and not reads_stdin(cmd_args.source):
+                threading.Thread(target=wait_for_enter, daemon=True).start()
+            engine.wait()
 
         except Exception as e:
             print(e)
             traceback.print_exc()
-            stop_stream = True
+            stop_pipeline()
 
-    finally:  # Turn off streaming to allow normal function immediately
-        for light in light_locations.keys():
-            animation_light_off(light)
+    finally:  # the senders have closed their Entertainment session on their way out
+        switch_lights(animation_light_off)
+        verbose("Disabling lights color streaming")
+
+
+####################################
+#              Daemon              #
+####################################
+MODES = ("stream", "streamgradient", "rest")
+LIGHT_ARGS = ("up_left_light", "up_right_light", "down_left_light", "down_right_light")
+# the engine outputs are started, set by the daemon commands
+streaming = False
+# the lights were switched off by a pause, they are switched back on by the next start
+lights_paused = False
+
+
+def current_mode():
+    if cmd_args.stream:
+        return "stream"
+    if cmd_args.stream_gradient:
+        return "streamgradient"
+    return "rest"
+
+
+def set_mode(mode):
+    cmd_args.stream = mode == "stream"
+    cmd_args.stream_gradient = mode == "streamgradient"
+
+
+def start_streaming():
+    """
+    Start the outputs of the current mode: the capture, bridges login and bridge state are already up,
+    the lights come from the cached bridge state.
+    :raise SetupError: lights or Entertainment area missing for the mode
+    """
+    global streaming, lights_paused
+    if streaming:
+        return
+    init_light_locations()
+    if lights_paused and sessions:
+        switch_lights(animation_light_resume)  # REST lights are switched on as they are looked up
+    lights_paused = False
+    wait_startup_animations()
+    engine.start(create_outputs())
+    streaming = True
+
+
+def stop_streaming():
+    """
+    Stop the outputs, closing the Entertainment sessions. The capture goes on.
+    """
+    global streaming
+    if not streaming:
+        return False
+    engine.stop_outputs()
+    streaming = False
+    return True
+
+
+def pause_streaming():
+    """
+    Stop the outputs and switch the lights off.
+    """
+    global lights_paused
+    if stop_streaming():
+        switch_lights(animation_light_off)
+        lights_paused = True
+
+
+def restart_streaming(restore):
+    """
+    Start the outputs again after a settings change, or with the previous settings if the new ones do not fit.
+    :param restore: callable bringing the previous settings back
+    :raise SetupError: the new settings do not fit the lights, the previous ones are streamed
+    """
+    try:
+        start_streaming()
+    except Exception:
+        restore()
+        try:
+            start_streaming()
+        except Exception as e:
+            print(f"Unable to start streaming again, paused: {e}")
+        raise
+
+
+def daemon_status():
+    outputs = engine.outputs if streaming else []
+    return {
+        "streaming": streaming,
+        "idle": engine.activity.idle.is_set(),
+        "mode": current_mode(),
+        "brightness": cmd_args.brightness,
+        "breadth": engine.breadth,
+        "statistic": engine.config.zone_statistic,
+        # Entertainment packets per second of each bridge, in -bid order
+        "rate": [session_rate(index) for index in range(len(bridge_apis))],
+        "lights": {name: getattr(cmd_args, name) for name in LIGHT_ARGS},
+        "outputs": [
+            {
+                "name": getattr(output, "name", "rest"),
+                "zones": len(output.zone_ids),
+                # REST outputs follow the light rate limit of the bridge
+                "rate": getattr(output, "rate", None),
+            }
+            for output in outputs
+        ],
+    }
+
+
+def daemon_start():
+    start_streaming()
+    return daemon_status()
+
+
+def daemon_pause():
+    pause_streaming()
+    return daemon_status()
+
+
+def daemon_mode(mode):
+    """
+    :param mode: one of MODES, the outputs are switched right away when streaming
+    """
+    if mode not in MODES:
+        raise ValueError(f"Unknown mode {mode}, one of: {', '.join(MODES)}")
+    previous = current_mode()
+    if mode == previous:
+        return daemon_status()
+    # the lights are not switched off and on again in between
+    was_streaming = stop_streaming()
+    set_mode(mode)
+    if was_streaming:
+        restart_streaming(lambda: set_mode(previous))
+    return daemon_status()
+
+
+def daemon_settings(brightness=None, breadth=None, rate=None, statistic=None, **lights):
+    """
+    Change settings live: brightness, zone breadth, zone statistic and rate apply to the running outputs as they are,
+    new REST lights restart the REST output, which has no session to reopen.
+    :param brightness: brightness of the REST lights and light animations (1-254)
+    :param breadth: approx percent of the screen around each light location its zone covers (0-1)
+    :param rate: Entertainment packets per second of every session
+    :param statistic: color of each zone, one of hue_play.zones.ZONE_STATISTICS
+    :param lights: light name of any of LIGHT_ARGS, None to remove the light
+    """
+    unknown = set(lights) - set(LIGHT_ARGS)
+    if unknown:
+        raise ValueError(f"Unknown settings {', '.join(sorted(unknown))}")
+    if brightness is not None and not 1 <= brightness <= 254:
+        raise ValueError("brightness must be within 1-254")
+    if breadth is not None and not 0 < breadth <= 1:
+        raise ValueError("breadth must be within 0-1")
+    if rate is not None and rate <= 0:
+        raise ValueError("rate must be positive")
+    if statistic is not None:
+        engine.set_zone_statistic(statistic)
+        cmd_args.zone_statistic = statistic
+    if brightness is not None:
+        cmd_args.brightness = brightness
+        for output in engine.outputs:
+            if isinstance(output, RestOutput):
+                output.brightness = brightness
+    if breadth is not None:
+        engine.set_breadth(breadth)
+    if rate is not None:
+        cmd_args.rate = [rate]
+        for output in engine.outputs:
+            if isinstance(output, EntertainmentOutput):
+                output.rate = rate  # the senders pick it up from their next tick
+    if lights:
+        previous = {name: getattr(cmd_args, name) for name in lights}
+        for name, light_name in lights.items():
+            setattr(cmd_args, name, light_name)
+        if streaming and current_mode() == "rest":
+            stop_streaming()
+            restart_streaming(lambda: [setattr(cmd_args, name, value) for name, value in previous.items()])
+    return daemon_status()
+
+
+def daemon_quit():
+    stop_pipeline()
+    return daemon_status()
+
+
+def run_daemon():
+    """
+    Stream until the quit command, controlled through the local control API (-d): commands stop and start the
+    outputs only, the capture, bridges login and bridge state stay up, so switching takes milliseconds.
+    """
+    commands = {
+        "status": daemon_status,
+        "start": daemon_start,
+        "resume": daemon_start,
+        "pause": daemon_pause,
+        "mode": daemon_mode,
+        "settings": daemon_settings,
+        "quit": daemon_quit,
+    }
+    server = ControlServer(
+        commands, cmd_args.daemon_port, queries=("status",), host=cmd_args.daemon_host, log=verbose
+    ).start()
+    print(
+        f"Control API on http://{cmd_args.daemon_host}:{server.port}, e.g. curl -X POST "
+        f"-H 'Content-Type: application/json' http://127.0.0.1:{server.port}/pause"
+    )
+    try:
+        status, answer = server.call("start", {})
+        if status != 200:
+            # stays paused, another mode or other lights can be set through the API
+            print(answer["error"])
+        engine.wait()
+    finally:
+        stop_pipeline()
+        server.shutdown()
+        engine.wait()
+        if streaming:
+            switch_lights(animation_light_off)
         verbose("Disabling lights color streaming")
 
 
@@ -579,11 +1053,37 @@ if __name__ == "__main__":
     ####################################
     #        Init global vars          #
     ####################################
-    global api, buffer_lock, stop_stream, light_locations, video_width, video_height
-    global rgb_frame, rgb_colors, rgb_bytes, coords, bounds
-    # login to hue bridge
-    hue_login()
-    # init lights location
-    init_light_locations()
+    global api, engine, light_locations, bridge_apis, sessions
+    parse_command_line()
+    if cmd_args.analyse_track:
+        # offline: only the lights and their locations are needed, nothing is captured nor sent
+        hue_login()
+        try:
+            init_light_locations()
+        except SetupError as e:
+            print(e)
+            sys.exit(0)
+        analyse_light_track()
+        sys.exit(0)
+    init_pipeline(time.monotonic())
+    if not cmd_args.play_track:
+        # capture device is opened while logging in and discovering lights
+        start_video_capture()
+    try:
+        # login to hue bridge
+        hue_login()
+        if cmd_args.daemon_port is not None:
+            # the lights of the mode are looked up by the start command
+            run_daemon()
+            sys.exit(0)
+        # init lights location
+        init_light_locations()
+    except SetupError as e:
+        stop_pipeline()
+        print(e)
+        sys.exit(0)
+    except BaseException:
+        stop_pipeline()
+        raise
     # run hue play script
     run_hue_play()
@@ -0,0 +1,54 @@
+import numpy as np
+
+from hue_play.activity import ACTIVE, STATIC, ActivityMonitor
+
+
+def test_slow_ramp_is_analysed_every_change_threshold():
+    monitor = ActivityMonitor(idle_after=0, change_threshold=2.0)
+    frame = np.full((360, 640, 3), 100, dtype=np.uint8)
+    results = []
+    for index in range(100):
+        frame[..., 0] = 20 + index  # blue rises by 1 per frame, half the change threshold
+        results.append(monitor.check(frame, index / 30))
+    # every other frame moved the picture by the change threshold since the last analysed one
+    assert results.count(ACTIVE) == 50
+
+    monitor = ActivityMonitor(idle_after=0, change_threshold=2.0)
+    for index in range(100):
+        frame[..., 0] = 20 + index * 2
+        results.append(monitor.check(frame, index / 30))
+    assert results[100:] == [ACTIVE] * 100
+
+
+def test_capture_noise_is_static():
+    monitor = ActivityMonitor(idle_after=0, change_threshold=2.0)
+    random = np.random.default_rng(0)
+    picture = np.full((360, 640, 3), 100, dtype=np.int16)
+    monitor.check(picture.astype(np.uint8), 0.0)
+    for index in range(1, 50):
+        noisy = picture + random.integers(-3, 4, picture.shape)
+        assert monitor.check(noisy.astype(np.uint8), index / 30) == STATIC
+
+
+def test_local_change_is_active():
+    monitor = ActivityMonitor(idle_after=0)
+    frame = np.full((360, 640, 3), 100, dtype=np.uint8)
+    monitor.check(frame, 0.0)
+    frame[:40, :40] = 255
+    assert monitor.check(frame, 1 / 30) == ACTIVE
+
+
+def test_idle_polls_fast_first_then_back_off():
+    monitor = ActivityMonitor(idle_after=1.0, poll_interval=1.0)
+    black = np.zeros((360, 640, 3), dtype=np.uint8)
+    # frames every 10 ms, the frame switching to idle is the first one looked at
+    ticks = iter(range(1000))
+    for tick in ticks:
+        monitor.check(black, tick / 100)
+        if monitor.idle.is_set():
+            break
+    polls = [tick] + [tick for tick in ticks if monitor.poll_due(tick / 100)]
+    gaps = np.diff(polls)
+    # within one frame of 0.1, 0.2, 0.4, 0.8 s then 1 s
+    assert np.abs(gaps[:4] - [10, 20, 40, 80]).max() <= 1
+    assert np.abs(gaps[4:] - 100).max() <= 1
@@ -0,0 +1,83 @@
+import gc
+import tracemalloc
+
+import numpy as np
+import pytest
+
+from hue_play.activity import ActivityMonitor
+from hue_play.color import ZoneColorConverter
+from hue_play.engine import zone_bounds
+from hue_play.huestream import COLOR_SPACE_XY, HueStreamEncoder
+from hue_play.jitter import JitterBuffer
+from hue_play.scheduler import SendScheduler
+from hue_play.zones import DOMINANT, SATURATION, ZoneAverager
+
+WIDTH, HEIGHT = 1920, 1080
+LOCATIONS = [[-1, 0, 1], [0, 0, 1], [1, 0, 1], [-1, 0, -1], [0, 0, -1], [1, 0, -1], [0, 0, 0]]
+# memory still held per frame: numpy may keep a few objects around, never a buffer
+LEAK_BUDGET = 8
+# memory allocated and freed again by the default per frame path: small Python objects and array views,
+# a float32 copy of the zone grid alone would take 27 kB
+PEAK_BUDGET = 16 * 1024
+
+
+@pytest.fixture(scope="module")
+def frames():
+    # rotating decode buffers, like the capture sources
+    random = np.random.default_rng(0)
+    return [random.integers(0, 256, (HEIGHT, WIDTH, 3), dtype=np.uint8) for _ in range(4)]
+
+
+def steady_state_memory(step, frames=100):
+    """
+    :param step: callable(frame index) running the per frame work
+    :return: (bytes still held per frame, peak bytes allocated on top of the memory held)
+    """
+    for index in range(10):
+        step(index)  # buffers, caches and lookup tables of the steady state
+    gc.collect()
+    tracemalloc.start()
+    try:
+        held = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        for index in range(frames):
+            step(index)
+        peak = tracemalloc.get_traced_memory()[1] - held
+        gc.collect()
+        leaked = tracemalloc.get_traced_memory()[0] - held
+    finally:
+        tracemalloc.stop()
+    return leaked / frames, peak
+
+
+def test_frame_path_allocates_no_buffer(frames):
+    activity = ActivityMonitor(idle_after=0)
+    averager = ZoneAverager(WIDTH, HEIGHT, zone_bounds(LOCATIONS, (0, HEIGHT, 0, WIDTH)))
+    jitter = JitterBuffer(0.05, len(LOCATIONS))
+    delayed_colors = np.empty((len(LOCATIONS), 3), dtype=np.float32)
+    scheduler = SendScheduler()
+    converter = ZoneColorConverter(["C"] * len(LOCATIONS))
+    encoder = HueStreamEncoder(list(range(len(LOCATIONS))), color_space=COLOR_SPACE_XY)
+
+    def step(index):
+        frame = frames[index % len(frames)]
+        activity.check(frame, index / 30)
+        zone_colors = averager.compute(frame)
+        jitter.push(zone_colors, index / 30)
+        jitter.colors_at(index / 30, delayed_colors)
+        if scheduler.has_changed(zone_colors):
+            encoder.encode_unit(converter.convert(zone_colors))
+            scheduler.mark_sent(zone_colors)
+
+    leaked, peak = steady_state_memory(step)
+    assert leaked <= LEAK_BUDGET
+    assert peak <= PEAK_BUDGET
+
+
+@pytest.mark.parametrize("statistic", [DOMINANT, SATURATION])
+def test_zone_statistics_allocate_no_frame_sized_buffer(frames, statistic):
+    averager = ZoneAverager(WIDTH, HEIGHT, zone_bounds(LOCATIONS, (0, HEIGHT, 0, WIDTH)), statistic=statistic)
+    leaked, peak = steady_state_memory(lambda index: averager.compute(frames[index % len(frames)]))
+    assert leaked <= LEAK_BUDGET
+    # their bincount results are sized by the zone cells, a 1080p frame is 6 MB
+    assert peak <= 128 * 1024
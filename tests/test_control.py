@@ -0,0 +1,55 @@
+import json
+import urllib.error
+import urllib.request
+
+import pytest
+
+from hue_play.control import ControlServer
+
+
+@pytest.fixture
+def server():
+    calls = []
+    commands = {"status": lambda: {"calls": len(calls)}, "pause": lambda **params: calls.append(params) or "paused"}
+    control_server = ControlServer(commands, 0, queries=("status",)).start()
+    control_server.calls = calls
+    yield control_server
+    control_server.shutdown()
+
+
+def request(server, command, body=None, headers=None, method="POST"):
+    """
+    :return: (HTTP status, decoded JSON answer)
+    """
+    data = None if body is None else body.encode()
+    http_request = urllib.request.Request(
+        f"http://127.0.0.1:{server.port}/{command}", data=data, headers=headers or {}, method=method
+    )
+    try:
+        with urllib.request.urlopen(http_request, timeout=5) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+def test_json_commands_are_called(server):
+    assert request(server, "pause", '{"lights": 2}', {"Content-Type": "application/json"}) == (200, "paused")
+    assert request(server, "pause", headers={"Content-Type": "application/json; charset=utf-8"}) == (200, "paused")
+    assert server.calls == [{"lights": 2}, {}]
+    assert request(server, "status", method="GET") == (200, {"calls": 2})
+
+
+def test_simple_cross_site_requests_are_refused(server):
+    # what a web page may send without a CORS preflight: form encoded, text/plain or empty body
+    assert request(server, "pause", "a=1", {"Content-Type": "application/x-www-form-urlencoded"})[0] == 415
+    assert request(server, "pause", "{}", {"Content-Type": "text/plain"})[0] == 415
+    assert request(server, "pause")[0] == 415
+    headers = {"Content-Type": "application/json", "Origin": "http://example.com"}
+    assert request(server, "pause", "{}", headers)[0] == 403
+    assert request(server, "status", headers={"Origin": "null"}, method="GET")[0] == 403
+    assert server.calls == []
+
+
+def test_local_pages_are_accepted(server):
+    headers = {"Content-Type": "application/json", "Origin": "http://localhost:8080"}
+    assert request(server, "pause", "{}", headers) == (200, "paused")
@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+from hue_play.huestream import COLOR_SPACE_XY, HueStreamEncoder
+
+CONFIGURATION_ID = "1a8d99cc-967b-44f2-9202-43f976c0fa6b"
+
+
+def test_v1_rgb_packet():
+    encoder = HueStreamEncoder([3, 0x0102])
+    packet = encoder.encode(np.array([[255, 0, 128], [1, 2, 3]], dtype=np.float32))
+    assert bytes(packet) == bytes.fromhex(
+        # "HueStream", version 1.0, sequence 1, reserved, RGB, reserved
+        "48756553747265616d" "0100" "01" "0000" "00" "00"
+        # light 3: 255 -> ffff, 0 -> 0000, 128 -> 8080 (x 257)
+        "00" "0003" "ffff" "0000" "8080"
+        # light 0x0102
+        "00" "0102" "0101" "0202" "0303"
+    )
+
+
+def test_v1_xy_packet():
+    encoder = HueStreamEncoder([7], color_space=COLOR_SPACE_XY)
+    packet = encoder.encode_unit(np.array([[0.5, 0.25, 1.0]], dtype=np.float32))
+    assert bytes(packet) == bytes.fromhex(
+        "48756553747265616d" "0100" "01" "0000" "01" "00"
+        # x, y and brightness on 16 bits, truncated: 0.5 * 65535 = 32767.5 -> 7fff
+        "00" "0007" "7fff" "3fff" "ffff"
+    )
+
+
+def test_v2_channel_packet():
+    encoder = HueStreamEncoder([0, 5], version=2, entertainment_id=CONFIGURATION_ID)
+    packet = encoder.encode(np.array([[255, 255, 255], [0, 0, 16]], dtype=np.float32))
+    assert bytes(packet) == (
+        bytes.fromhex("48756553747265616d" "0200" "01" "0000" "00" "00")
+        + CONFIGURATION_ID.encode("ascii")
+        # channel id on one byte, no device type
+        + bytes.fromhex("00" "ffff" "ffff" "ffff" "05" "0000" "0000" "1010")
+    )
+
+
+def test_sequence_is_byte_11_and_wraps():
+    encoder = HueStreamEncoder([1])
+    colors = np.zeros((1, 3), dtype=np.float32)
+    for sequence in range(1, 256):
+        assert encoder.encode(colors)[11] == sequence
+    assert encoder.encode(colors)[11] == 0
+
+
+def test_buffer_is_reused():
+    encoder = HueStreamEncoder([1, 2])
+    first = encoder.encode(np.zeros((2, 3), dtype=np.float32))
+    buffer_address = encoder._records.ctypes.data
+    second = encoder.encode(np.full((2, 3), 255, dtype=np.float32))
+    # the same memoryview over the same bytes, rewritten in place
+    assert second is first
+    assert encoder._records.ctypes.data == buffer_address
+    assert bytes(first[-6:]) == bytes.fromhex("ffff" "ffff" "ffff")
+
+
+@pytest.mark.parametrize(
+    "ids, entertainment_id",
+    [([1], None), ([1], "too-short"), (list(range(21)), CONFIGURATION_ID)],
+)
+def test_v2_rejects_invalid_configurations(ids, entertainment_id):
+    with pytest.raises(ValueError):
+        HueStreamEncoder(ids, version=2, entertainment_id=entertainment_id)
@@ -0,0 +1,14 @@
+from hue_play.metrics import Metrics
+
+
+def test_prometheus_summary_has_quantiles_sum_and_count():
+    metrics = Metrics(enabled=True, window=4)
+    # more durations than the window holds: the sum and count cover all of them
+    for duration in (0.001, 0.002, 0.003, 0.004, 0.005, 0.006):
+        metrics.record_duration("zones", duration)
+    lines = metrics.prometheus_text().splitlines()
+    assert "# TYPE hue_play_stage_duration_ms summary" in lines
+    assert 'hue_play_stage_duration_ms_sum{stage="zones"} 21.000' in lines
+    assert 'hue_play_stage_duration_ms_count{stage="zones"} 6' in lines
+    assert 'hue_play_stage_duration_ms{stage="zones",quantile="0.5"} 4.500' in lines
+    assert 'hue_play_stage_duration_ms_sum{stage="grab"} 0.000' in lines
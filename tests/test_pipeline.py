@@ -0,0 +1,85 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from hue_play.engine import EngineConfig, EntertainmentOutput, HuePlayEngine
+from hue_play.pipeline import LatestSlot
+
+
+class FakeTransport:
+    """
+    DTLS transport stand-in accepting every packet.
+    """
+
+    def __init__(self, host, psk_identity, client_key, on_connected=None, log=None):
+        self.on_connected = on_connected
+
+    def start(self):
+        self.on_connected()
+
+    def send(self, message):
+        return True
+
+    def close(self):
+        pass
+
+
+def test_cancel_set_before_wait_is_not_missed():
+    slot = LatestSlot()
+    cancel = threading.Event()
+    cancel.set()
+    slot.wake()  # the consumer was busy elsewhere, this wakeup is not for it
+    started = time.monotonic()
+    assert slot.wait(0, timeout=5, cancel=cancel) == (0, None, None)
+    assert time.monotonic() - started < 0.5
+
+
+def test_wake_releases_a_waiting_consumer():
+    slot = LatestSlot()
+    results = []
+    consumer = threading.Thread(target=lambda: results.append(slot.wait(0, timeout=5)))
+    consumer.start()
+    time.sleep(0.1)
+    slot.wake()
+    consumer.join(timeout=1)
+    assert results == [(0, None, None)]
+
+
+def test_stop_outputs_releases_a_sender_busy_when_woken_up():
+    # 2 packets/s: stopped 0.2 s in, the sender sleeps in wait_tick until its next tick, not in the colors wait,
+    # and must not then block there for the keepalive
+    engine = HuePlayEngine(EngineConfig(keepalive=5.0, idle=0, letterbox=False))
+    engine.transport_factory = FakeTransport
+    output = EntertainmentOutput("test", "127.0.0.1", "user", "00", ["1"], [[0, 0, 0]], ["C"], rate=2)
+    frame = np.full((72, 128, 3), 128, dtype=np.uint8)
+    try:
+        for _ in range(3):
+            engine.start([output])
+            engine.push_frame(frame)
+            time.sleep(0.2)
+            started = time.monotonic()
+            engine.stop_outputs()
+            assert time.monotonic() - started < 1.0
+    finally:
+        engine.stop()
+
+
+@pytest.mark.parametrize(
+    "frame",
+    [
+        np.zeros((72, 128, 3), dtype=np.float32),
+        np.zeros((72, 128), dtype=np.uint8),
+        np.zeros((72, 128, 4), dtype=np.uint8),
+    ],
+)
+def test_push_frame_rejects_frames_other_than_bgr_uint8(frame):
+    engine = HuePlayEngine(EngineConfig(idle=0))
+    try:
+        with pytest.raises(ValueError):
+            engine.push_frame(frame)
+        assert engine.video_width is None
+        assert engine.push_frame(np.zeros((72, 128, 3), dtype=np.uint8))
+    finally:
+        engine.stop()
@@ -0,0 +1,96 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from hue_play.rest import RestLightSender
+
+
+class FakeBridge:
+    """
+    Bridge REST API stand-in recording every PUT with the client port it came from.
+    """
+
+    def __init__(self):
+        self.requests = []
+        bridge = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive, like the bridge
+
+            def do_PUT(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                bridge.requests.append((time.monotonic(), self.path, body, self.client_address[1]))
+                answer = json.dumps([{"success": {self.path: True}}]).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(answer)))
+                self.end_headers()
+                self.wfile.write(answer)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}/api/user"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def paths(self):
+        return [path for _, path, _, _ in self.requests]
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def bridge():
+    fake_bridge = FakeBridge()
+    yield fake_bridge
+    fake_bridge.close()
+
+
+def test_light_commands_are_rate_limited(bridge):
+    sender = RestLightSender(bridge.base_url, light_rate=10)
+    started = time.monotonic()
+    step = 0
+    # a new color for every light as fast as the sender takes them, for 2 seconds
+    while time.monotonic() - started < 2.0:
+        step += 1
+        if sender.send({light_id: {"bri": step % 254 + 1} for light_id in ("1", "2", "3")}):
+            time.sleep(sender.retry_delay())
+    sender.close()
+    # a burst of 10, then 10 per second
+    assert 25 <= len(bridge.requests) <= 31
+    last_second = [request for request in bridge.requests if request[0] >= started + 1.0]
+    assert len(last_second) <= 11
+    for light_id in ("1", "2", "3"):
+        # least recently updated first: every light gets its share
+        assert bridge.paths().count(f"/api/user/lights/{light_id}/state") >= 8
+
+
+def test_lights_sharing_a_state_are_batched_in_their_group(bridge):
+    sender = RestLightSender(bridge.base_url, groups={"5": ["1", "2", "3"], "6": ["1", "2"]})
+    state = {"xy": (0.3, 0.3), "bri": 100}
+    assert not sender.send({"1": state, "2": state, "3": state})
+    assert bridge.paths() == ["/api/user/groups/5/action"]
+    assert bridge.requests[0][2] == {"xy": [0.3, 0.3], "bri": 100}
+    # unchanged states are not sent again
+    sender.send({"1": state, "2": state, "3": state})
+    assert len(bridge.requests) == 1
+    # the group rate is spent: lights sharing a state fall back to light commands
+    other = {"xy": (0.5, 0.4), "bri": 50}
+    sender.send({"1": other, "2": other, "3": state})
+    assert sorted(bridge.paths()[1:]) == ["/api/user/lights/1/state", "/api/user/lights/2/state"]
+    sender.close()
+
+
+def test_requests_reuse_one_connection(bridge):
+    sender = RestLightSender(bridge.base_url, light_rate=100)
+    for step in range(20):
+        sender.send({"1": {"bri": step + 1}})
+    sender.close()
+    assert len(bridge.requests) == 20
+    assert len({client_port for _, _, _, client_port in bridge.requests}) == 1
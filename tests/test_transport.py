@@ -0,0 +1,115 @@
+import os
+import shutil
+import socket
+import subprocess
+import threading
+import time
+
+import pytest
+
+from hue_play.transport import DtlsTransport
+
+PSK_IDENTITY = "test-user"
+PSK = "0123456789abcdef0123456789abcdef"
+# longest wait between two reconnection attempts, plus one handshake
+RESUME_BOUND = 2.0 + 2.0
+
+pytestmark = pytest.mark.skipif(shutil.which("openssl") is None, reason="needs openssl")
+
+
+class FakeEntertainment:
+    """
+    Bridge Entertainment API stand-in: an `openssl s_server` accepting the PSK DTLS session,
+    counting the HueStream packets it receives.
+    """
+
+    def __init__(self, port):
+        self.port = port
+        self.packets = 0
+        self._server = None
+
+    def start(self):
+        self._server = subprocess.Popen(
+            [
+                "openssl",
+                "s_server",
+                "-dtls1_2",
+                "-nocert",
+                "-cipher",
+                "PSK-AES128-GCM-SHA256",
+                "-psk",
+                PSK,
+                "-accept",
+                f"127.0.0.1:{self.port}",
+            ],
+            stdin=subprocess.PIPE,  # s_server quits on stdin EOF: keep it open
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            bufsize=0,
+        )
+        threading.Thread(target=self._read_packets, args=(self._server,), daemon=True).start()
+
+    def _read_packets(self, server):
+        while True:
+            chunk = os.read(server.stdout.fileno(), 65536)
+            if not chunk:
+                break
+            self.packets += chunk.count(b"HueStream")
+
+    def kill(self):
+        self._server.kill()
+        self._server.wait()
+
+
+def free_udp_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as udp_socket:
+        udp_socket.bind(("127.0.0.1", 0))
+        return udp_socket.getsockname()[1]
+
+
+def send_until_received(transport, bridge, timeout):
+    """
+    :return: seconds until a packet sent by `transport` reached `bridge`, None after `timeout`
+    """
+    started = time.monotonic()
+    received = bridge.packets
+    while time.monotonic() - started < timeout:
+        transport.send(b"HueStream" + bytes(7))
+        if bridge.packets > received:
+            return time.monotonic() - started
+        time.sleep(0.02)
+    return None
+
+
+@pytest.fixture
+def bridge():
+    fake_bridge = FakeEntertainment(free_udp_port())
+    fake_bridge.start()
+    yield fake_bridge
+    fake_bridge.kill()
+
+
+def test_sends_resume_after_the_bridge_restarts(bridge):
+    logs = []
+    transport = DtlsTransport("127.0.0.1", PSK_IDENTITY, PSK, port=bridge.port, log=logs.append)
+    transport.start()
+    try:
+        assert transport.connected.wait(RESUME_BOUND)
+        assert send_until_received(transport, bridge, RESUME_BOUND) is not None
+
+        bridge.kill()
+        # packets are dropped, never block, while the bridge is away
+        started = time.monotonic()
+        while time.monotonic() - started < 1.0:
+            transport.send(b"HueStream" + bytes(7))
+            time.sleep(0.02)
+        assert not transport.connected.is_set()
+
+        bridge.start()
+        resumed = send_until_received(transport, bridge, RESUME_BOUND)
+        assert resumed is not None, f"no packet received {RESUME_BOUND}s after the bridge restarted"
+        assert transport.reconnections >= 1
+    finally:
+        transport.close()
+    assert any(line.startswith("Opening DTLS session") for line in logs)
+    assert not any(PSK in line for line in logs)
@@ -0,0 +1,67 @@
+import cv2
+import numpy as np
+import pytest
+
+from hue_play.engine import zone_bounds
+from hue_play.zones import DOMINANT, MEAN, SATURATION, ZoneAverager
+
+WIDTH, HEIGHT = 1920, 1080
+
+
+def spread_locations(count):
+    return [[-0.9 + 1.8 * index / (count - 1), 0.0, 0.8 if index % 2 == 0 else -0.8] for index in range(count)]
+
+
+@pytest.fixture(scope="module")
+def frame():
+    random = np.random.default_rng(0)
+    return cv2.GaussianBlur(random.integers(0, 256, (HEIGHT, WIDTH, 3), dtype=np.uint8), (0, 0), 25)
+
+
+def on_grid(averager):
+    # the geometry of the same zones, read through the shared grid whatever their number
+    geometry = averager._geometry
+    averager._geometry = geometry[:-1] + ((float("inf"), float("inf"), 1),)
+
+
+def test_few_zones_are_exact_means(frame):
+    bounds = zone_bounds(spread_locations(4), (0, HEIGHT, 0, WIDTH))
+    averager = ZoneAverager(WIDTH, HEIGHT, bounds)
+    colors = averager.compute(frame)
+    for zone, (top, bottom, left, right) in enumerate(bounds):
+        expected = frame[max(0, top) : bottom, max(0, left) : right].reshape(-1, 3).mean(axis=0)[::-1]
+        np.testing.assert_allclose(colors[zone], expected, atol=0.01)
+    # the grid cells snap the zones to 30 pixels at 1080p: close, not equal
+    on_grid(averager)
+    np.testing.assert_allclose(averager.compute(frame), colors, atol=1.0)
+
+
+@pytest.mark.parametrize("statistic", [DOMINANT, SATURATION])
+def test_zone_cells_match_the_grid(frame, statistic):
+    averager = ZoneAverager(WIDTH, HEIGHT, zone_bounds(spread_locations(4), (0, HEIGHT, 0, WIDTH)), statistic=statistic)
+    colors = averager.compute(frame).copy()
+    on_grid(averager)
+    np.testing.assert_allclose(averager.compute(frame), colors, atol=0.01)
+
+
+def test_many_zones_use_the_grid_of_their_bounding_box(frame):
+    # zones in the top half: the bottom half of the frame is never read
+    locations = [[location[0], 0.0, 0.8] for location in spread_locations(64)]
+    averager = ZoneAverager(WIDTH, HEIGHT, zone_bounds(locations, (0, HEIGHT, 0, WIDTH)))
+    assert averager.method == "on a 64x36 grid"
+    colors = averager.compute(frame).copy()
+    changed = frame.copy()
+    changed[HEIGHT // 2 :] = 0
+    np.testing.assert_array_equal(averager.compute(changed), colors)
+
+
+def test_dominant_and_saturation_keep_the_color_of_an_object(frame):
+    picture = np.full((HEIGHT, WIDTH, 3), 128, dtype=np.uint8)
+    picture[: HEIGHT // 2, : WIDTH // 2] = (0, 0, 255)  # red quarter, BGR
+    bounds = [[0, HEIGHT * 3 // 4, 0, WIDTH * 3 // 4]]
+    mean = ZoneAverager(WIDTH, HEIGHT, bounds, statistic=MEAN).compute(picture)[0]
+    dominant = ZoneAverager(WIDTH, HEIGHT, bounds, statistic=DOMINANT).compute(picture)[0]
+    saturation = ZoneAverager(WIDTH, HEIGHT, bounds, statistic=SATURATION).compute(picture)[0]
+    # the grey background covers more cells than the red quarter
+    np.testing.assert_allclose(dominant, (128, 128, 128))
+    assert saturation[0] - saturation[1] > 2 * (mean[0] - mean[1])